@@ -0,0 +1,100 @@
+"""This module provides the clock which is used by all loops of the system.
+
+By default, the SystemClock is used. For simulations, a VirtualClock which
+runs faster than the real time can be set with setClock() before the system
+is started.
+"""
+import threading
+import datetime
+import time
+
+
+class SystemClock:
+	"""Clock which uses the real time of the system."""
+
+	def now(self) -> datetime.datetime:
+		"""Gets the current local date and time (like datetime.datetime.now())."""
+		return datetime.datetime.now()
+
+	def time(self) -> float:
+		"""Gets the seconds since the epoch (like time.time())."""
+		return time.time()
+
+	def monotonic(self) -> float:
+		"""Gets the value of a monotonic clock in seconds (like time.monotonic())."""
+		return time.monotonic()
+
+	def getTimeout(self, seconds: float) -> float:
+		"""Converts a number of clock seconds into real seconds (None stays None)."""
+		return seconds
+
+	def sleep(self, seconds: float):
+		"""Sleeps for a number of clock seconds."""
+		time.sleep(seconds)
+
+	def wait(self, waitable, seconds: float = None):
+		"""Waits on an Event or Condition for at most a number of clock seconds.
+
+		Returns:
+			The return value of waitable.wait().
+		"""
+		return waitable.wait(self.getTimeout(seconds))
+
+
+class VirtualClock(SystemClock):
+	"""Clock which starts at a given time and runs faster than the real time.
+
+	All sleeps and timeouts are shortened by the speed factor, so the whole
+	system behaves as if the time passed faster.
+	"""
+
+	def __init__(self, start: datetime.datetime = None, speed: float = 1000):
+		"""Initialises a VirtualClock, it starts running immediately.
+
+		Args:
+			start : Optional, the start time of the clock (default is now).
+			speed : Number of clock seconds which pass per real second.
+		"""
+		self.speed = speed
+		self._start = start or datetime.datetime.now()
+		self._startTimestamp = self._start.timestamp()
+		self._realStart = time.monotonic()
+
+	def _getElapsed(self) -> float:
+		"""Gets the clock seconds since the start."""
+		return (time.monotonic() - self._realStart) * self.speed
+
+	def now(self) -> datetime.datetime:
+		return self._start + datetime.timedelta(seconds=self._getElapsed())
+
+	def time(self) -> float:
+		return self._startTimestamp + self._getElapsed()
+
+	def monotonic(self) -> float:
+		return self._getElapsed()
+
+	def getTimeout(self, seconds: float) -> float:
+		return None if seconds is None else seconds / self.speed
+
+	def sleep(self, seconds: float):
+		time.sleep(seconds / self.speed)
+
+
+_clock = SystemClock()
+_clockLock = threading.Lock()
+
+
+def getClock() -> SystemClock:
+	"""Thread safe getter for the clock of the system."""
+	return _clock
+
+
+def setClock(c: SystemClock):
+	"""Thread safe, replaces the clock of the system.
+
+	Must be called before the system is started, running loops may still
+	wait with the old clock.
+	"""
+	global _clock
+	with _clockLock:
+		_clock = c
@@ -2,13 +2,24 @@ from controller.enums import State
 from pumper import Pumper
 from sensor import Sensor
 import controller.ruling
+import itertools
 import threading
 import time
-import datetime
 import logging
 
+import settings
+import clock
+import metrics
+
 logger = logging.getLogger(__name__)
 
+_WORKTIME = metrics.histogram(
+	"chilwater_controller_work_seconds", "Duration of Controller._doWork()"
+)
+
+# Versions of the ruleSets, shared by all controllers.
+_ruleSetVersions = itertools.count(1)
+
 
 class Controller:
 	"""Abstract class, represents a Controller.
@@ -20,6 +31,10 @@ class Controller:
 		_doWork()
 	"""
 
+	# Maximal number of seconds the controller sleeps without checking its
+	# rules (protects against jumps of the system clock).
+	MAXSLEEP = 60
+
 	def __init__(self, pumper: Pumper, pumpNr: int, sensor: Sensor):
 		"""Initialises the Controller.
 
@@ -29,16 +44,34 @@ class Controller:
 			sensor: The Sensor which shall be bound to the Pump.
 
 		Atributes:
-			lock: A lock object for concurrent access on the object.
+			lock: A lock object for concurrent access on the object (a
+				metrics.TimedLock).
+			nr: Number of the controller (None if unknown), is passed with the
+				pump orders.
 			pumpNr: See Argument pumpNr.
 			sensor: See Argument sensor.
-		       ruleSet: a list of Rule instances.
+		       ruleSet: a list of Rule instances (use addRule() to alter it).
+			ruleSetVersion: Is changed on every change of the ruleSet, it is
+				unique among all controllers (a replaced controller never gets
+				the version of its predecessor).
 		"""
-		self.lock = threading.Lock()
+		self.lock = metrics.TimedLock("controller")
+		self.nr: int = None
 		self.pumpNr = pumpNr
 		self.sensor = sensor
 		self.ruleSet = []
+		self.ruleSetVersion = next(_ruleSetVersions)
 		self._pumper = pumper
+
+		# Compiled ruleSet (a CompiledRuleSet or a RuleTable, see
+		# settings.RULETABLE), is rebuilt after changes of the ruleSet.
+		self._compiledRuleSet = None
+
+		# Is set to wake the controller loop up before its sleep time is over.
+		self._wakeup = threading.Event()
+
+		# True while a time window with a rule which was not applied today is open.
+		self._windowOpen = False
 		self._state = State.STOPPED
 		self._stop = False
 
@@ -47,25 +80,96 @@ class Controller:
 
 		This function keeps running until the function
 		stop() is called from another thread.
+		Between the time windows of its rules, the controller sleeps until
+		the next window opens.
 		"""
 		logger.info("Contoller startet for pumpNr: %d", self.pumpNr)
-		logger.debug("Sensor channel: %d", self.sensor.channel)
+		logger.debug("Sensor channel: %s", self.sensor.channel)
 		self._state = State.RUNNING
 		while 1:
-			# sleep ensures, that other components have also a chance to lock
-			time.sleep(0.1)
-
+			self._wakeup.clear()
 			with self.lock:
 				if self._stop:
 					self._state = State.STOPPED
 					logger.info("Controller is going down")
 					break
-				self._doWork()
+				start = time.perf_counter()
+				try:
+					self._doWork()
+				except Exception:
+					# One failed order (i.E. of a removed pump) must not end the loop.
+					logger.exception("Controller Nr. %s failed", self.nr)
+				_WORKTIME.observe(time.perf_counter() - start)
+				sleepTime = self._getSleepTime()
+
+			clock.getClock().wait(self._wakeup, sleepTime)
 
 	def addRule(self, rule: controller.ruling.Rule):
 		"""Thread safe, adds an additional Rule to the Controller."""
 		with self.lock:
 			self.ruleSet.append(rule)
+			self._compiledRuleSet = None
+			self._ruleSetChanged()
+		self._wakeup.set()
+
+	def replaceRules(self, rules: list):
+		"""Thread safe, replaces the ruleSet by the given rules.
+
+		Rules whose definition has not changed are kept as they are. Changed
+		rules take over the lastRun of the old rule with the same name, so they
+		are not applied twice on the same day.
+
+		Args:
+			rules : A list of Rule instances.
+		"""
+		with self.lock:
+			old = {rule.name: rule for rule in self.ruleSet}
+			ruleSet = []
+			for rule in rules:
+				oldRule = old.get(rule.name)
+				if oldRule and oldRule.getDefinition() == rule.getDefinition():
+					rule = oldRule
+				elif oldRule:
+					rule.lastRun = oldRule.lastRun
+				ruleSet.append(rule)
+			self.ruleSet = ruleSet
+			self._compiledRuleSet = None
+			self._ruleSetChanged()
+		self._wakeup.set()
+
+	def _ruleSetChanged(self):
+		"""NOT THREAD SAFE, is called after every change of the ruleSet.
+
+		Can be extended in descendants.
+		"""
+		self.ruleSetVersion = next(_ruleSetVersions)
+
+	def _getCompiledRuleSet(self):
+		"""NOT THREAD SAFE, gets the compiled ruleSet (compiles it if necessary)."""
+		if not self._compiledRuleSet:
+			if settings.RULETABLE:
+				self._compiledRuleSet = controller.ruling.RuleTable(self.ruleSet)
+			else:
+				self._compiledRuleSet = controller.ruling.CompiledRuleSet(self.ruleSet)
+		return self._compiledRuleSet
+
+	def _getSleepTime(self) -> float:
+		"""NOT THREAD SAFE, gets the number of seconds until the rules must be checked again.
+
+		While a time window is open, the controller sleeps until the next window
+		boundary or until it is woken up by a new sensor value. Else it sleeps
+		until the next window opens.
+		"""
+		now = clock.getClock().now()
+		ruleSet = self._getCompiledRuleSet()
+		nextCheck = ruleSet.getNextCheck(now)
+		if nextCheck is None:
+			self._windowOpen = False
+			return self.MAXSLEEP
+		self._windowOpen = nextCheck <= now
+		if self._windowOpen:
+			nextCheck = ruleSet.getNextBoundary(now)
+		return max(0, min(self.MAXSLEEP, (nextCheck - now).total_seconds()))
 
 	def _doWork(self):
 		"""NOT THREAD SAFE, Abstract function controlls the behavior of the controller.
@@ -95,6 +199,7 @@ class Controller:
 		"""Thread safe, stops the controller loop"""
 		with self.lock:
 			self._stop = True
+		self._wakeup.set()
 
 
 class MeasureController(Controller):
@@ -102,23 +207,62 @@ class MeasureController(Controller):
 
 	A MeasureController compares a Sensor value with a given constant which is
 	defined inside a MeasureRule.
+	It subscribes to its Sensor and is only notified if the value has changed
+	by the deadband or has crossed the rValue of one of its rules.
 	"""
 
-	def __init__(self, pumper, pumpNr, sensor):
+	def __init__(self, pumper, pumpNr, sensor, deadband: float = 0):
 		"""Initialises a MeasureController.
 
 		For functionality and attributes, see base class Controller.
+
+		Args:
+			deadband : Minimal change of the sensor value which is notified to
+				the controller (0 = every change).
 		"""
 		Controller.__init__(self, pumper, pumpNr, sensor)
+		self.deadband = deadband
+		self._subscription = sensor.subscribe(self._onSensorValue, deadband)
+		self._value = sensor.getValue()
+
+		# The value which was used by the last _doWork() call.
+		self._evaluatedValue = None
+
+	def _onSensorValue(self, value):
+		"""Receives a new value from the sensor (called by the sensor thread)."""
+		self._value = value
+		if self._windowOpen:
+			self._wakeup.set()
+
+	def _ruleSetChanged(self):
+		"""NOT THREAD SAFE, uses the rValues of all rules as thresholds."""
+		Controller._ruleSetChanged(self)
+		self._subscription.setThresholds([rule.rValue for rule in self.ruleSet])
 
 	def _doWork(self):
 		"""NOT THREAD SAFE, should be called from run() to do the work.
 
 		For details, see base class Controller.
 		"""
-		currentTimeStamp = datetime.datetime.now()
-		for rule in self.ruleSet:
-			seconds = rule.getPumpSeconds(currentTimeStamp, self.sensor.getValue())
-			if seconds > 0:
-				self._pumper.pump(self.pumpNr, seconds)
-				rule.lastRun = currentTimeStamp
+		currentTimeStamp = clock.getClock().now()
+		self._evaluatedValue = self._value
+		for rule, seconds in self._getCompiledRuleSet().evaluate(
+			currentTimeStamp, self._evaluatedValue
+		):
+			self._pumper.pump(self.pumpNr, seconds, self.nr, rule.name)
+
+	def _getSleepTime(self) -> float:
+		"""NOT THREAD SAFE, see base class.
+
+		If a new sensor value has arrived during _doWork() while a time window
+		is open, the rules are checked again immediately.
+		"""
+		sleepTime = Controller._getSleepTime(self)
+		if self._windowOpen and self._value != self._evaluatedValue:
+			return 0
+		return sleepTime
+
+	def stop(self):
+		"""Thread safe, stops the controller loop and unsubscribes from the sensor."""
+		self.sensor.unsubscribe(self._subscription)
+		Controller.stop(self)
@@ -1,6 +1,6 @@
-import datetime
 import controller
 import sensor
+import clock
 
 
 class TimeController(controller.Controller):
@@ -18,9 +18,6 @@ class TimeController(controller.Controller):
 
 		For details, see base class Controller.
 		"""
-		currentTimeStamp = datetime.datetime.now()
-		for rule in self.ruleSet:
-			seconds = rule.getPumpSeconds(currentTimeStamp)
-			if seconds > 0:
-				self._pumper.pump(self.pumpNr, seconds)
-				rule.lastRun = currentTimeStamp
+		currentTimeStamp = clock.getClock().now()
+		for rule, seconds in self._getCompiledRuleSet().evaluate(currentTimeStamp):
+			self._pumper.pump(self.pumpNr, seconds, self.nr, rule.name)
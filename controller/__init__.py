@@ -18,7 +18,14 @@ from controller.ruling import TimeRule
 import controller.ruling
 
 
-def createController(controllerType: Type, pumper, pumpNr, sensor=None):
+def createController(
+	controllerType: Type,
+	pumper,
+	pumpNr,
+	sensor=None,
+	deadband: float = 0,
+	controllerNr: int = None,
+):
 	"""Instatiates a new Controller.
 
 	A Controller links a Sensor with a Pump.
@@ -28,17 +35,22 @@ def createController(controllerType: Type, pumper, pumpNr, sensor=None):
 		pumper : Instance of the Pumper object.
 		pumpNr : Number of the Pump (Pump must be added to the Pumper).
 		sensor : Instance of a Sensor object (optional, i.E. not used TimeSensor).
+		deadband : Minimal change of the sensor value which is notified to the
+			controller (not used by TimeController).
+		controllerNr : Number of the controller (used to record its pump orders).
 
 	Returns:
 		Controller object of the desired type.
 	"""
 	if controllerType == Type.HUMIDITY:
-		return HumController(pumper, pumpNr, sensor)
+		c = HumController(pumper, pumpNr, sensor, deadband)
 	elif controllerType == Type.LIGHT:
-		return LightController(pumper, pumpNr, sensor)
+		c = LightController(pumper, pumpNr, sensor, deadband)
 	elif controllerType == Type.TEMPERATURE:
-		return TempController(pumper, pumpNr, sensor)
+		c = TempController(pumper, pumpNr, sensor, deadband)
 	elif controllerType == Type.TIME:
-		return TimeController(pumper, pumpNr)
+		c = TimeController(pumper, pumpNr)
 	else:
 		raise NotImplementedError
+	c.nr = controllerNr
+	return c
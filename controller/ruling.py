@@ -1,10 +1,33 @@
 import datetime
+import operator
+import bisect
+import array
+import math
 import controller
+from controller.enums import Comparator
+
+
+# Maps each Comparator to the function which implements it.
+_OPERATORS = {
+	Comparator.LESSER: operator.lt,
+	Comparator.LESSEROREQUAL: operator.le,
+	Comparator.EQUAL: operator.eq,
+	Comparator.GREATEROREQUAL: operator.ge,
+	Comparator.GREATER: operator.gt,
+}
+
+# Codes of the comparators in a RuleTable (index into _OPERATORLIST).
+_COMPARATORCODES = {c: i for i, c in enumerate(_OPERATORS)}
+_OPERATORLIST = tuple(_OPERATORS.values())
 
 
 class Rule:
 	"""Abstract class, represents a Rule for a Controller."""
 
+	# Large installations hold tens of thousands of rules, so the rules have
+	# no __dict__ and store their time window as seconds since midnight.
+	__slots__ = ("name", "lastRun", "secondsFrom", "secondsTo", "pumpSeconds")
+
 	def __init__(
 		self,
 		name: str,
@@ -24,6 +47,9 @@ class Rule:
 			lastRun : Last time, the Rule was checked.
 			timeFrom : Lowerbound of the Rule validity timespan.
 			timeTo : Upperbound of the Rule validity timespan.
+			secondsFrom : timeFrom as seconds since midnight (an int if
+				timeFrom has no microseconds).
+			secondsTo : timeTo as seconds since midnight.
 			pumpSeconds : Number of seconds for which the pump shall run if the Rule is applied.
 		"""
 		self.name = name
@@ -32,6 +58,22 @@ class Rule:
 		self.timeTo = timeTo
 		self.pumpSeconds = pumpSenconds
 
+	@property
+	def timeFrom(self) -> datetime.time:
+		return _timeOfSeconds(self.secondsFrom)
+
+	@timeFrom.setter
+	def timeFrom(self, value: datetime.time):
+		self.secondsFrom = _toSeconds(value)
+
+	@property
+	def timeTo(self) -> datetime.time:
+		return _timeOfSeconds(self.secondsTo)
+
+	@timeTo.setter
+	def timeTo(self, value: datetime.time):
+		self.secondsTo = _toSeconds(value)
+
 	def getPumpSeconds(self, currentDatetime) -> int:
 		"""ABSTRACT FUNCTION. Returns the number of seconds, the pump shall run.
 
@@ -47,25 +89,34 @@ class Rule:
 		"""
 		raise NotImplementedError
 
+	def getDefinition(self) -> tuple:
+		"""Gets all configured values of the Rule (without state like lastRun).
+
+		Two rules with the same definition behave identically.
+		"""
+		return (
+			self.__class__.__name__,
+			self.name,
+			self.secondsFrom,
+			self.secondsTo,
+			self.pumpSeconds,
+		)
+
 	def _shouldCheck(self, currentDateTime):
 		"""Checks if a the current timestamps meets the time span defined in the Rule."""
+		# If the Rule was never used (no lastRun), it has not run on any day.
+		lastRunDay = self.lastRun.toordinal() if self.lastRun else 0
 		return (
-			self.timeFrom <= datetime.datetime.time(currentDateTime)
-			and self.timeTo >= datetime.datetime.time(currentDateTime)
-			and (
-				# If the Rule was never used (no lastTime), it nonetheless has to
-				# be a date for comparison. Thats the reason of the lambda.
-				lambda a: datetime.datetime.date(a)
-				if a
-				else datetime.date(1970, 1, 1)
-			)(self.lastRun)
-			!= datetime.datetime.date(currentDateTime)
+			self.secondsFrom <= _secondsOfDay(currentDateTime) <= self.secondsTo
+			and lastRunDay != currentDateTime.toordinal()
 		)
 
 
 class MeasureRule(Rule):
 	"""Concrete class for rules which are used with measuring devices (sensors)."""
 
+	__slots__ = ("comparator", "rValue")
+
 	def __init__(
 		self,
 		name: str,
@@ -88,22 +139,21 @@ class MeasureRule(Rule):
 		self.comparator = comparator
 		self.rValue = rValue
 
+	def getDefinition(self) -> tuple:
+		"""See base class."""
+		return Rule.getDefinition(self) + (self.comparator, self.rValue)
+
 	def _compare(self, currentValue):
 		"""Compares the sensor value with the constant rValue."""
 		if currentValue == None:
 			return False
-		elif self.comparator == controller.enums.Comparator.LESSER:
-			return currentValue < self.rValue
-		elif self.comparator == controller.enums.Comparator.LESSEROREQUAL:
-			return currentValue <= self.rValue
-		elif self.comparator == controller.enums.Comparator.EQUAL:
-			return currentValue == self.rValue
-		elif self.comparator == controller.enums.Comparator.GREATEROREQUAL:
-			return currentValue >= self.rValue
-		elif self.comparator == controller.enums.Comparator.GREATER:
-			return currentValue > self.rValue
-		else:
+		return self.getOperator()(currentValue, self.rValue)
+
+	def getOperator(self):
+		"""Gets the function (i.E. operator.lt) which implements the comparator."""
+		if self.comparator not in _OPERATORS:
 			raise NotImplementedError
+		return _OPERATORS[self.comparator]
 
 	def getPumpSeconds(self, currentDateTime: datetime.datetime, currentValue) -> int:
 		"""Returns the number of seconds, the pump shall run.
@@ -124,6 +174,8 @@ class MeasureRule(Rule):
 class TimeRule(Rule):
 	"""Concrete class for rules which are only time related (no measuring device)."""
 
+	__slots__ = ()
+
 	def getPumpSeconds(self, currentDateTime: datetime.datetime) -> int:
 		"""Returns the number of seconds, the pump shall run.
 
@@ -134,3 +186,284 @@ class TimeRule(Rule):
 		if self._shouldCheck(currentDateTime):
 			return self.pumpSeconds
 		return 0
+
+
+def _secondsOfDay(t) -> float:
+	"""Converts a datetime.time (or datetime.datetime) into seconds since midnight."""
+	return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1000000
+
+
+def _toSeconds(t: datetime.time):
+	"""Converts a datetime.time into seconds since midnight (an int if possible)."""
+	seconds = t.hour * 3600 + t.minute * 60 + t.second
+	return seconds + t.microsecond / 1000000 if t.microsecond else seconds
+
+
+def _timeOfSeconds(seconds) -> datetime.time:
+	"""Converts seconds since midnight into a datetime.time."""
+	whole = int(seconds)
+	microseconds = min(999999, round((seconds - whole) * 1000000))
+	return datetime.time(whole // 3600, whole // 60 % 60, whole % 60, microseconds)
+
+
+class _CompiledRule:
+	"""A Rule with all values precomputed which are needed for its evaluation."""
+
+	__slots__ = ("rule", "compare", "rValue", "lastRunDay")
+
+	def __init__(self, rule: Rule):
+		self.rule = rule
+		if isinstance(rule, MeasureRule):
+			self.compare = rule.getOperator()
+			self.rValue = rule.rValue
+		else:
+			self.compare = None
+			self.rValue = None
+		# Day (date.toordinal()) of the last run, 0 if the rule never ran.
+		self.lastRunDay = rule.lastRun.toordinal() if rule.lastRun else 0
+
+
+class CompiledRuleSet:
+	"""Precomputed evaluator for the rule set of a Controller.
+
+	It behaves like calling getPumpSeconds() on every Rule, but the rules are
+	indexed by their time windows. Only rules whose time window contains the
+	current time are looked at, the comparators are resolved to operator
+	functions and the once a day check uses precomputed day numbers.
+	The CompiledRuleSet must be rebuilt if the rule set changes.
+	"""
+
+	def __init__(self, ruleSet: list):
+		"""Compiles a list of Rules.
+
+		Args:
+			ruleSet : A list of Rule instances.
+		"""
+		compiled = [_CompiledRule(rule) for rule in ruleSet]
+
+		# The day is split into segments at every window boundary. Every segment
+		# holds all rules which are active during the whole segment.
+		# Since timeTo is inclusive, a rule ends just after timeTo.
+		bounds = set([float(0)])
+		for c in compiled:
+			bounds.add(c.rule.secondsFrom)
+			bounds.add(math.nextafter(c.rule.secondsTo, math.inf))
+		self._bounds = sorted(bounds)
+		self._segments = [[] for _ in self._bounds]
+		for c in compiled:
+			first = bisect.bisect_left(self._bounds, c.rule.secondsFrom)
+			end = bisect.bisect_left(
+				self._bounds, math.nextafter(c.rule.secondsTo, math.inf)
+			)
+			for i in range(first, end):
+				self._segments[i].append(c)
+
+	def _getActive(self, secondsOfDay: float) -> list:
+		"""Gets all compiled rules whose time window contains the given time."""
+		return self._segments[bisect.bisect_right(self._bounds, secondsOfDay) - 1]
+
+	def evaluate(self, currentDateTime: datetime.datetime, currentValue=None) -> list:
+		"""Evaluates all rules for the given point in time.
+
+		Every rule which is applied gets its lastRun set to currentDateTime.
+
+		Args:
+			currentDateTime : Present date and time.
+			currentValue : The current value of the sensor (only used by MeasureRules).
+
+		Returns:
+			A list of (Rule, pumpSeconds) tuples of all rules which shall be applied.
+		"""
+		ret = []
+		active = self._getActive(_secondsOfDay(currentDateTime))
+		if not active:
+			return ret
+
+		day = currentDateTime.toordinal()
+		for c in active:
+			if c.lastRunDay == day or c.rule.pumpSeconds <= 0:
+				continue
+			if c.compare:
+				if currentValue is None or not c.compare(currentValue, c.rValue):
+					continue
+			c.rule.lastRun = currentDateTime
+			c.lastRunDay = day
+			ret.append((c.rule, c.rule.pumpSeconds))
+		return ret
+
+	def getNextCheck(self, currentDateTime: datetime.datetime) -> datetime.datetime:
+		"""Gets the next point in time at which a rule could be applied.
+
+		Args:
+			currentDateTime : Present date and time.
+
+		Returns:
+			currentDateTime if a rule which was not applied today has an open
+			time window, the start of the next time window which contains such a
+			rule, or None if there are no rules which could ever be applied.
+		"""
+		day = currentDateTime.toordinal()
+		current = bisect.bisect_right(self._bounds, _secondsOfDay(currentDateTime)) - 1
+
+		# Today, beginning with the current segment
+		for i in range(current, len(self._segments)):
+			for c in self._segments[i]:
+				if c.lastRunDay != day and c.rule.pumpSeconds > 0:
+					if i == current:
+						return currentDateTime
+					return datetime.datetime.combine(
+						currentDateTime.date(), datetime.time()
+					) + datetime.timedelta(seconds=self._bounds[i])
+
+		# Tomorrow, no rule can have run tomorrow yet
+		for i in range(len(self._segments)):
+			for c in self._segments[i]:
+				if c.rule.pumpSeconds > 0:
+					return datetime.datetime.combine(
+						currentDateTime.date(), datetime.time()
+					) + datetime.timedelta(days=1, seconds=self._bounds[i])
+		return None
+
+	def getNextBoundary(self, currentDateTime: datetime.datetime) -> datetime.datetime:
+		"""Gets the next point in time at which a time window opens or closes.
+
+		Args:
+			currentDateTime : Present date and time.
+
+		Returns:
+			The next window boundary, at the latest midnight.
+		"""
+		midnight = datetime.datetime.combine(currentDateTime.date(), datetime.time())
+		i = bisect.bisect_right(self._bounds, _secondsOfDay(currentDateTime))
+		if i < len(self._bounds):
+			return midnight + datetime.timedelta(seconds=self._bounds[i])
+		return midnight + datetime.timedelta(days=1)
+
+
+class RuleTable:
+	"""Compact evaluator for large rule sets, an alternative to CompiledRuleSet.
+
+	It behaves like a CompiledRuleSet, but the values of the rules are held in
+	parallel arrays (module array): the time windows as seconds since
+	midnight, the comparators as codes and the thresholds as floats. The
+	rules are indexed by the hours which their time windows touch, so the
+	memory grows linearly with the number of rules, while the segments of a
+	CompiledRuleSet grow with the overlap of the time windows.
+	The RuleTable must be rebuilt if the rule set changes.
+	"""
+
+	# Seconds of the day which are covered by one bucket of the index.
+	BUCKETSECONDS = 3600
+
+	def __init__(self, ruleSet: list):
+		"""Builds the table of a list of Rules.
+
+		Rules which can never be applied (no pumpSeconds or an empty time
+		window) are left out.
+
+		Args:
+			ruleSet : A list of Rule instances.
+		"""
+		self._rules = [
+			rule
+			for rule in ruleSet
+			if rule.pumpSeconds > 0 and rule.secondsFrom <= rule.secondsTo
+		]
+		self._secondsFrom = array.array("d", [r.secondsFrom for r in self._rules])
+		self._secondsTo = array.array("d", [r.secondsTo for r in self._rules])
+		self._comparators = array.array("b")
+		self._rValues = array.array("d")
+		for rule in self._rules:
+			if isinstance(rule, MeasureRule):
+				if rule.comparator not in _COMPARATORCODES:
+					raise NotImplementedError
+				self._comparators.append(_COMPARATORCODES[rule.comparator])
+				self._rValues.append(rule.rValue)
+			else:
+				self._comparators.append(-1)
+				self._rValues.append(0)
+		# Day (date.toordinal()) of the last run, 0 if the rule never ran.
+		self._lastRunDays = array.array(
+			"l", [r.lastRun.toordinal() if r.lastRun else 0 for r in self._rules]
+		)
+
+		# The indices of the rules whose time window touches bucket b are
+		# _bucketRules[_bucketStarts[b] : _bucketStarts[b + 1]].
+		buckets = [[] for _ in range(math.ceil(86400 / self.BUCKETSECONDS))]
+		for i, rule in enumerate(self._rules):
+			first = int(rule.secondsFrom // self.BUCKETSECONDS)
+			last = int(rule.secondsTo // self.BUCKETSECONDS)
+			for bucket in buckets[first : last + 1]:
+				bucket.append(i)
+		self._bucketStarts = array.array("I", [0])
+		self._bucketRules = array.array("I")
+		for bucket in buckets:
+			self._bucketRules.extend(bucket)
+			self._bucketStarts.append(len(self._bucketRules))
+
+	def evaluate(self, currentDateTime: datetime.datetime, currentValue=None) -> list:
+		"""See CompiledRuleSet.evaluate()."""
+		ret = []
+		seconds = _secondsOfDay(currentDateTime)
+		b = int(seconds // self.BUCKETSECONDS)
+		start, end = self._bucketStarts[b], self._bucketStarts[b + 1]
+		if start == end:
+			return ret
+
+		day = currentDateTime.toordinal()
+		lastRunDays = self._lastRunDays
+		for k in range(start, end):
+			i = self._bucketRules[k]
+			if lastRunDays[i] == day:
+				continue
+			if not self._secondsFrom[i] <= seconds <= self._secondsTo[i]:
+				continue
+			code = self._comparators[i]
+			if code >= 0:
+				if currentValue is None:
+					continue
+				if not _OPERATORLIST[code](currentValue, self._rValues[i]):
+					continue
+			rule = self._rules[i]
+			rule.lastRun = currentDateTime
+			lastRunDays[i] = day
+			ret.append((rule, rule.pumpSeconds))
+		return ret
+
+	def getNextCheck(self, currentDateTime: datetime.datetime) -> datetime.datetime:
+		"""See CompiledRuleSet.getNextCheck()."""
+		if not self._rules:
+			return None
+		day = currentDateTime.toordinal()
+		seconds = _secondsOfDay(currentDateTime)
+		nextStart = None
+		for secondsFrom, secondsTo, lastRunDay in zip(
+			self._secondsFrom, self._secondsTo, self._lastRunDays
+		):
+			if lastRunDay == day or secondsTo < seconds:
+				continue
+			if secondsFrom <= seconds:
+				return currentDateTime
+			if nextStart is None or secondsFrom < nextStart:
+				nextStart = secondsFrom
+
+		midnight = datetime.datetime.combine(currentDateTime.date(), datetime.time())
+		if nextStart is not None:
+			return midnight + datetime.timedelta(seconds=nextStart)
+		# Tomorrow, no rule can have run tomorrow yet
+		return midnight + datetime.timedelta(days=1, seconds=min(self._secondsFrom))
+
+	def getNextBoundary(self, currentDateTime: datetime.datetime) -> datetime.datetime:
+		"""See CompiledRuleSet.getNextBoundary().
+
+		Only the windows of the rules which can be applied are boundaries.
+		"""
+		seconds = _secondsOfDay(currentDateTime)
+		nextBoundary = 86400
+		for secondsFrom, secondsTo in zip(self._secondsFrom, self._secondsTo):
+			# Since timeTo is inclusive, a rule ends just after timeTo.
+			for boundary in (secondsFrom, math.nextafter(secondsTo, math.inf)):
+				if seconds < boundary < nextBoundary:
+					nextBoundary = boundary
+		midnight = datetime.datetime.combine(currentDateTime.date(), datetime.time())
+		return midnight + datetime.timedelta(seconds=nextBoundary)
@@ -0,0 +1,215 @@
+"""Replays sensor series through rule sets (backtesting of rules).
+
+The evaluation is vectorised with NumPy, which is an optional dependency
+of the chili watering system, it is only needed for this module.
+The results are the same as if a controller had evaluated its rules with
+CompiledRuleSet.evaluate() at every sample (each rule is applied at most
+once a day, at the first sample of the day which meets its conditions).
+"""
+import datetime
+
+import numpy
+
+import controller
+from controller.enums import Comparator
+from controller.ruling import _secondsOfDay
+
+# Maps each Comparator to the NumPy function which implements it.
+_UFUNCS = {
+	Comparator.LESSER: numpy.less,
+	Comparator.LESSEROREQUAL: numpy.less_equal,
+	Comparator.EQUAL: numpy.equal,
+	Comparator.GREATEROREQUAL: numpy.greater_equal,
+	Comparator.GREATER: numpy.greater,
+}
+
+# Maximal number of cells of the boolean matrices which are built at once.
+_MAXCELLS = 1 << 24
+
+
+class Series:
+	"""A series of sensor samples prepared for the simulation.
+
+	Attributes:
+		times : The sample times (numpy.datetime64[us], ascending).
+		values : The sample values (float, NaN if there was no value).
+		days : Day of each sample (date.toordinal()).
+		secondsOfDay : Seconds since midnight of each sample.
+	"""
+
+	def __init__(self, times, values=None):
+		"""Initialises a Series.
+
+		Args:
+			times : Sample times in ascending order, datetime.datetime objects
+				or numpy.datetime64 values (local time).
+			values : Optional, the sample values (None for missing values). If
+				omitted, all values are missing (i.E. for TimeRules).
+		"""
+		self.times = numpy.asarray(times, dtype="datetime64[us]")
+		if values is None:
+			self.values = numpy.full(len(self.times), numpy.nan)
+		else:
+			self.values = numpy.array(
+				[numpy.nan if v is None else v for v in values], dtype=float
+			)
+		if len(self.values) != len(self.times):
+			raise ValueError("times and values must have the same length")
+		if len(self.times) and numpy.any(self.times[1:] < self.times[:-1]):
+			raise ValueError("times must be in ascending order")
+
+		days = self.times.astype("datetime64[D]")
+		self.secondsOfDay = (self.times - days) / numpy.timedelta64(1, "s")
+		# datetime64 days count from 1970-01-01, date.toordinal() from 0001-01-01.
+		self.days = days.astype(numpy.int64) + datetime.date(1970, 1, 1).toordinal()
+
+		# Index of the first sample of every day.
+		newDay = numpy.concatenate(([True], self.days[1:] != self.days[:-1]))
+		self.dayStarts = numpy.flatnonzero(newDay[: len(self.days)])
+
+	def __len__(self):
+		return len(self.times)
+
+
+class Result:
+	"""The result of simulate().
+
+	Attributes:
+		firings : The times (numpy.datetime64[us]) at which each rule was
+			applied, the rule name is the key.
+		seconds : The pump seconds of each rule, the rule name is the key.
+	"""
+
+	def __init__(self):
+		self.firings = {}
+		self.seconds = {}
+
+	def getTotalSeconds(self) -> float:
+		"""Gets the pump seconds of all rules together."""
+		return sum(self.seconds.values())
+
+
+def _getWindowMask(series: Series, timeFrom, timeTo):
+	"""Gets the samples which are inside a time window (both bounds inclusive)."""
+	return (series.secondsOfDay >= _secondsOfDay(timeFrom)) & (
+		series.secondsOfDay <= _secondsOfDay(timeTo)
+	)
+
+
+def _getLastRunDay(rule) -> int:
+	return rule.lastRun.toordinal() if rule.lastRun else 0
+
+
+def simulate(ruleSet: list, series: Series) -> Result:
+	"""Evaluates all rules of a rule set at all samples of a series.
+
+	The rules are not altered, their lastRun is only used as initial state.
+
+	Args:
+		ruleSet : A list of Rule instances (i.E. Controller.ruleSet).
+		series : The samples.
+
+	Returns:
+		A Result with the firing times and pump seconds of every rule.
+	"""
+	result = Result()
+	for rule in ruleSet:
+		mask = numpy.zeros(len(series), dtype=bool)
+		if rule.pumpSeconds > 0:
+			mask = _getWindowMask(series, rule.timeFrom, rule.timeTo)
+			if isinstance(rule, controller.MeasureRule):
+				# NaN (no value) never meets a condition.
+				with numpy.errstate(invalid="ignore"):
+					mask &= _UFUNCS[rule.comparator](series.values, rule.rValue)
+
+		# Only the first matching sample of a day fires the rule.
+		indices = numpy.flatnonzero(mask)
+		days = series.days[indices]
+		first = numpy.concatenate(([True], days[1:] != days[:-1]))[: len(days)]
+		first &= days != _getLastRunDay(rule)
+		result.firings[rule.name] = series.times[indices[first]]
+		result.seconds[rule.name] = float(
+			numpy.count_nonzero(first) * rule.pumpSeconds
+		)
+	return result
+
+
+def sweep(
+	series: Series,
+	comparator: Comparator,
+	rValues,
+	windows: list,
+	pumpSeconds: float = 1,
+):
+	"""Computes the pump seconds of a MeasureRule for many parameter combinations.
+
+	A rule fires on a day if one of the samples in its window meets the
+	condition. For the comparators <, <=, > and >= only the minimum or maximum
+	value of each day and window has to be compared with the rValues.
+
+	Args:
+		series : The samples.
+		comparator : The Comparator of the rule.
+		rValues : The rValues to try (a sequence of numbers).
+		windows : The time windows to try, a list of (timeFrom, timeTo) tuples
+			of datetime.time objects.
+		pumpSeconds : Pump seconds of the rule.
+
+	Returns:
+		A numpy array of the pump seconds with the shape (len(windows),
+		len(rValues)).
+	"""
+	rValues = numpy.asarray(rValues, dtype=float)
+	result = numpy.zeros((len(windows), len(rValues)))
+	if not len(series):
+		return result
+
+	ufunc = _UFUNCS[comparator]
+	for w, (timeFrom, timeTo) in enumerate(windows):
+		mask = _getWindowMask(series, timeFrom, timeTo)
+		mask &= ~numpy.isnan(series.values)
+		if comparator in (Comparator.LESSER, Comparator.LESSEROREQUAL):
+			# The rule fires if the smallest value meets the condition.
+			values = numpy.where(mask, series.values, numpy.inf)
+			extremes = numpy.minimum.reduceat(values, series.dayStarts)
+			fired = ufunc(extremes[None, :], rValues[:, None])
+		elif comparator in (Comparator.GREATER, Comparator.GREATEROREQUAL):
+			values = numpy.where(mask, series.values, -numpy.inf)
+			extremes = numpy.maximum.reduceat(values, series.dayStarts)
+			fired = ufunc(extremes[None, :], rValues[:, None])
+		else:
+			fired = _sweepEqual(series, mask, rValues)
+		result[w] = numpy.count_nonzero(fired, axis=1) * pumpSeconds
+	return result
+
+
+def _sweepEqual(series: Series, mask, rValues):
+	"""Gets for each rValue and day if a sample in the mask equals the rValue."""
+	fired = numpy.zeros((len(rValues), len(series.dayStarts)), dtype=bool)
+	step = max(1, _MAXCELLS // len(series))
+	for i in range(0, len(rValues), step):
+		equal = series.values[None, :] == rValues[i : i + step, None]
+		equal &= mask[None, :]
+		fired[i : i + step] = numpy.logical_or.reduceat(
+			equal, series.dayStarts, axis=1
+		)
+	return fired
+
+
+def loadSeries(store, sensorNr: int, start: float, end: float, resolution: int):
+	"""Loads the history of a sensor from a timeseries.Store as Series.
+
+	The mean value of each slot is used as sample value.
+
+	Args:
+		store : A timeseries.Store.
+		sensorNr : Number of the sensor.
+		start : Begin of the range (seconds since the epoch).
+		end : End of the range (exclusive).
+		resolution : See timeseries.Store.query().
+	"""
+	points = store.query(sensorNr, start, end, resolution)
+	return Series(
+		[datetime.datetime.fromtimestamp(p[0]) for p in points],
+		[p[1] for p in points],
+	)
@@ -1,29 +1,51 @@
 from spidev import SpiDev
 import threading
+import time
 
 
 class MCP3008:
     """Handled the MCP3008.
 
+    The SPI device is opened once and kept open for the lifetime of the
+    object. Every access to the SPI device is secured with a lock, so one
+    instance can be shared by all sensors which are attached to the chip
+    (see lib.adc.getMCPInterface()).
+
     Args:
         bus: Number from used SPI-bus on the raspberry pi.
         device: Number of the SPI-device at the chosen bus
     """
+
+    # Number of analog channels of the chip.
+    CHANNELS = 8
+
     def __init__(self, bus=0, device=0):
-        self.lock = threading.Lock
+        self.lock = threading.Lock()
         self._bus = bus
         self._device = device
         self._spi = SpiDev()
         self._open()
-        self._spi.max_speed_hz = 1000000  # 1MHz
+
+        # Result of the last burst over all channels (see readBuffered()).
+        self._burstValues = {}
+        self._burstTime = None
 
     def __del__(self):
-        self._spi.close()
+        self.close()
 
     def _open(self):
         self._spi.open(self._bus, self._device)
         self._spi.max_speed_hz = 1000000  # 1MHz
 
+    def close(self):
+        """Closes the SPI device."""
+        self._spi.close()
+
+    def _transfer(self, channel):
+        """NOT THREAD SAFE, reads one channel from the SPI device."""
+        adc = self._spi.xfer2([1, (8 + channel) << 4, 0])
+        return ((adc[1] & 3) << 8) + adc[2]
+
     def read(self, channel=0):
         """Reads a chosen analog channel.
 
@@ -36,6 +58,47 @@ class MCP3008:
         Returns:
             Returns the read channel int-value between 0 and 1023.
         """
-        adc = self._spi.xfer2([1, (8 + channel) << 4, 0])
-        data = ((adc[1] & 3) << 8) + adc[2]
-        return data
+        with self.lock:
+            return self._transfer(channel)
+
+    def readMany(self, channels=range(CHANNELS)):
+        """Reads multiple analog channels in one locked burst.
+
+        Args:
+            channels: Numbers of the channels to read (default: all channels).
+
+        Returns:
+            A dict with the read int-values between 0 and 1023, the key is the
+            channel number.
+        """
+        with self.lock:
+            return self._readMany(channels)
+
+    def _readMany(self, channels):
+        """NOT THREAD SAFE, reads multiple channels and remembers the values."""
+        values = {channel: self._transfer(channel) for channel in channels}
+        self._burstValues = values
+        self._burstTime = time.monotonic()
+        return values
+
+    def readBuffered(self, channel, maxAge):
+        """Reads a channel from the last burst over all channels.
+
+        If the last burst is older than maxAge, all channels are read again
+        in one burst. So all sensors on the chip are served by one burst.
+
+        Args:
+            channel: Number of channel to read value.
+            maxAge: Maximal age of the burst in seconds.
+
+        Returns:
+            Returns the channel int-value between 0 and 1023.
+        """
+        with self.lock:
+            if (
+                self._burstTime is None
+                or time.monotonic() - self._burstTime > maxAge
+                or channel not in self._burstValues
+            ):
+                self._readMany(range(self.CHANNELS))
+            return self._burstValues[channel]
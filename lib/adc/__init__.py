@@ -1,21 +1,28 @@
 """This package is used for accessing the MCP3008.
 
-It provides a singleton which can be accessed by getMCPInterface().
+It provides one shared instance per SPI device which can be accessed by
+getMCPInterface().
 """
-from datetime import time
+import threading
 from lib.adc.MCP3008 import MCP3008
 
-mcpInterface = None
+mcpInterfaces = {}
+_mcpInterfacesLock = threading.Lock()
 
 
-def getMCPInterface():
-	"""Getter for singleton mcpInterface.
-	
+def getMCPInterface(bus: int = 0, device: int = 0):
+	"""Thread safe getter for the shared MCP3008 of a SPI device.
+
+	The MCP3008 is created on the first call and then kept open.
+
+	Args:
+		bus : Number of the SPI bus.
+		device : Number of the SPI device at the chosen bus.
+
 	Returns:
 		An instance to a MCP3008 object.
 	"""
-	global mcpInterface
-	if mcpInterface:
-		return mcpInterface
-	mcpInterface = MCP3008()
-	return mcpInterface
\ No newline at end of file
+	with _mcpInterfacesLock:
+		if (bus, device) not in mcpInterfaces:
+			mcpInterfaces[(bus, device)] = MCP3008(bus, device)
+		return mcpInterfaces[(bus, device)]
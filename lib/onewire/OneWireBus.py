@@ -0,0 +1,180 @@
+import concurrent.futures
+import threading
+import glob
+import os
+import re
+import logging
+
+import clock
+
+logger = logging.getLogger(__name__)
+
+# Lines of a w1_slave file, i.E.:
+# 72 01 4b 46 7f ff 0e 10 57 : crc=57 YES
+# 72 01 4b 46 7f ff 0e 10 57 t=23125
+_CRCLINE = re.compile(r"([0-9a-f]{2} ){9}: crc=[0-9a-f]{2} YES")
+_TEMPLINE = re.compile(r"([0-9a-f]{2} ){9}t=([+-]?[0-9]+)")
+
+
+def parseSlave(text: str) -> float:
+	"""Parses the content of a w1_slave file.
+
+	Returns:
+		The temperature in degrees Celsius or None if the CRC check failed.
+	"""
+	lines = text.splitlines()
+	if len(lines) < 2 or not _CRCLINE.match(lines[0]):
+		return None
+	m = _TEMPLINE.match(lines[1])
+	if not m:
+		return None
+	return float(m.group(2)) / 1000.0
+
+
+class OneWireBus:
+	"""Reads all DS18B20 temperature probes (family 28) of a 1-Wire sysfs tree.
+
+	A conversion of a DS18B20 takes about 750 ms. Instead of blocking a
+	sensor thread per probe, all probes are read in one round by a background
+	thread: If a bus master supports therm_bulk_read, one conversion is
+	triggered on all probes at once, otherwise the probes are read
+	concurrently. The values are cached, read() returns the cached value and
+	starts a new round if it is too old. So the values are published at the
+	real conversion rate, no matter how often the sensors are sampled. If a
+	probe fails in a round, read() returns None until a later round succeeds.
+	"""
+
+	# Seconds which read() waits for the first value of a probe.
+	FIRSTREADTIMEOUT = 5
+
+	def __init__(self, baseDir: str = "/sys/bus/w1/devices", workers: int = 8):
+		"""Initialises a OneWireBus, the probes are discovered on each round.
+
+		Args:
+			baseDir : The devices directory of the 1-Wire sysfs tree.
+			workers : Maximal number of probes which are read in parallel.
+		"""
+		self.baseDir = baseDir
+		self._workers = workers
+		self._executor: concurrent.futures.ThreadPoolExecutor = None
+		self._lock = threading.Condition()
+		self._reading = False
+		self._rounds = 0
+		# deviceId -> (value, clock monotonic() of the read), the value is None
+		# if the read has failed.
+		self._values = {}
+		# Devices which were requested by read() but not discovered.
+		self._requested = set()
+
+	def discover(self) -> list:
+		"""Gets the ids of all temperature probes (i.E. "28-3c01b556cc3d")."""
+		return sorted(
+			os.path.basename(path)
+			for path in glob.glob(os.path.join(self.baseDir, "28-*"))
+		)
+
+	def read(self, deviceId: str, maxAge: float) -> float:
+		"""Thread safe, gets the cached temperature of a probe.
+
+		If the cached value is older than maxAge, a new round is started in
+		the background. Only if there is no value yet, the call waits for the
+		round.
+
+		Args:
+			deviceId : Id of the probe (name of its directory).
+			maxAge : Maximal age of the cached value in seconds.
+
+		Returns:
+			The temperature in degrees Celsius or None if the probe could not
+			be read.
+		"""
+		with self._lock:
+			entry = self._values.get(deviceId)
+			if entry is None or clock.getClock().monotonic() - entry[1] > maxAge:
+				self._requested.add(deviceId)
+				self._startRound()
+			if entry is None:
+				rounds = self._rounds
+				self._lock.wait_for(
+					lambda: self._rounds != rounds, self.FIRSTREADTIMEOUT
+				)
+				entry = self._values.get(deviceId)
+			return entry and entry[0]
+
+	def _startRound(self):
+		"""Starts a round if none is running, the lock must be held."""
+		if self._reading:
+			return
+		self._reading = True
+		if self._executor is None:
+			self._executor = concurrent.futures.ThreadPoolExecutor(
+				max_workers=self._workers, thread_name_prefix="onewire"
+			)
+		threading.Thread(
+			target=self._readRound, name="onewire-round", daemon=True
+		).start()
+
+	def _readRound(self):
+		"""Reads all probes once and publishes the values."""
+		try:
+			with self._lock:
+				devices = set(self.discover()) | self._requested
+			self._triggerBulkRead()
+			values = self._executor.map(self._readDevice, devices)
+			values = dict(zip(devices, values))
+		except Exception:
+			logger.exception("1-Wire round failed")
+			values = None
+		now = clock.getClock().monotonic()
+		with self._lock:
+			if values is None:
+				values = dict.fromkeys(self._values)
+			for deviceId, value in values.items():
+				# A failing probe must not serve its last value forever, its
+				# error is cached, so read() does not wait for the next round.
+				self._values[deviceId] = (value, now)
+				if value is not None:
+					self._requested.discard(deviceId)
+			self._reading = False
+			self._rounds += 1
+			self._lock.notify_all()
+
+	def _triggerBulkRead(self) -> bool:
+		"""Starts a conversion on all probes of the masters which support it.
+
+		The kernel returns from the write after the conversion has finished,
+		the following reads of the w1_slave files do not convert again.
+
+		Returns:
+			True, if a bulk read was triggered.
+		"""
+		triggered = False
+		pattern = os.path.join(self.baseDir, "w1_bus_master*", "therm_bulk_read")
+		for path in glob.glob(pattern):
+			try:
+				with open(path, "w") as f:
+					f.write("trigger\n")
+				triggered = True
+			except OSError:
+				logger.debug("Bulk read not supported by %s", path)
+		return triggered
+
+	def _readDevice(self, deviceId: str) -> float:
+		"""Reads and parses the w1_slave file of a probe."""
+		path = os.path.join(self.baseDir, deviceId, "w1_slave")
+		try:
+			with open(path, "r") as f:
+				value = parseSlave(f.read())
+		except OSError:
+			logger.error("1-Wire probe %s could not be read", deviceId)
+			return None
+		if value is None:
+			logger.warning("1-Wire probe %s returned an invalid value", deviceId)
+		return value
+
+	def close(self):
+		"""Stops the worker threads, the cached values are kept."""
+		with self._lock:
+			executor, self._executor = self._executor, None
+		if executor is not None:
+			executor.shutdown(wait=False)
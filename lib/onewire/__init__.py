@@ -0,0 +1,31 @@
+"""This package is used for reading 1-Wire temperature probes (DS18B20).
+
+It provides one shared instance per sysfs devices directory which can be
+accessed by getOneWireBus().
+"""
+import threading
+from lib.onewire.OneWireBus import OneWireBus
+from lib.onewire.OneWireBus import parseSlave
+
+oneWireBuses = {}
+_oneWireBusesLock = threading.Lock()
+
+
+def getOneWireBus(baseDir: str = "/sys/bus/w1/devices", workers: int = 8):
+	"""Thread safe getter for the shared OneWireBus of a sysfs devices directory.
+
+	The OneWireBus is created on the first call and then kept.
+
+	Args:
+		baseDir : The devices directory of the 1-Wire sysfs tree (a fake tree
+			can be used for tests).
+		workers : Maximal number of probes which are read in parallel (only
+			used on the first call).
+
+	Returns:
+		An instance to a OneWireBus object.
+	"""
+	with _oneWireBusesLock:
+		if baseDir not in oneWireBuses:
+			oneWireBuses[baseDir] = OneWireBus(baseDir, workers)
+		return oneWireBuses[baseDir]
@@ -0,0 +1,122 @@
+"""This module keeps the latest log lines in memory (i.E. for the web frontend).
+
+A LogTail handler is attached to the root logger and stores the latest lines
+in a ring buffer. If there is no handler, the lines are read from the end of
+the log file.
+"""
+import collections
+import threading
+import logging
+import os
+
+_handler = None
+
+
+class LogTail(logging.Handler):
+	"""Logging handler which keeps the latest log lines in a ring buffer."""
+
+	def __init__(self, capacity: int):
+		"""Initialises an empty LogTail.
+
+		Args:
+			capacity : Maximal number of lines which are kept.
+		"""
+		logging.Handler.__init__(self)
+		self.capacity = capacity
+		self._lines = collections.deque(maxlen=capacity)
+		self._linesLock = threading.Lock()
+
+	def prime(self, lines: list):
+		"""Thread safe, adds lines which were logged before the handler existed."""
+		with self._linesLock:
+			self._lines.extendleft(reversed(lines))
+
+	def emit(self, record: logging.LogRecord):
+		"""Stores a log record (multi line records are split into lines)."""
+		try:
+			lines = self.format(record).splitlines()
+		except Exception:
+			self.handleError(record)
+			return
+		with self._linesLock:
+			self._lines.extend(lines)
+
+	def getLines(self, count: int) -> list:
+		"""Thread safe, gets the latest log lines.
+
+		Args:
+			count : Maximal number of lines.
+
+		Returns:
+			A list of lines, the latest line is the last one.
+		"""
+		with self._linesLock:
+			start = max(0, len(self._lines) - count)
+			return [self._lines[i] for i in range(start, len(self._lines))]
+
+
+def tailFile(path: str, count: int, blockSize: int = 4096) -> list:
+	"""Reads the last lines of a file.
+
+	The file is read backwards in blocks, so only the end of the file is read.
+
+	Args:
+		path : Path of the file.
+		count : Maximal number of lines.
+		blockSize : Number of bytes which are read at once.
+
+	Returns:
+		A list of lines (without line breaks), the last line of the file is the
+		last one.
+	"""
+	with open(path, "rb") as f:
+		f.seek(0, os.SEEK_END)
+		position = f.tell()
+		data = b""
+		# One line break more than lines is needed to know that the first
+		# line is complete.
+		while position > 0 and data.count(b"\n") <= count:
+			size = min(blockSize, position)
+			position -= size
+			f.seek(position)
+			data = f.read(size) + data
+	lines = data.decode(errors="replace").splitlines()
+	return lines[-count:] if count > 0 else []
+
+
+def install(path: str, capacity: int, formatter: logging.Formatter) -> LogTail:
+	"""Attaches a LogTail handler to the root logger.
+
+	The handler is primed with the last lines of the log file.
+
+	Args:
+		path : Path of the log file.
+		capacity : Maximal number of lines which are kept.
+		formatter : Formatter of the log lines (same as in the log file).
+	"""
+	global _handler
+	handler = LogTail(capacity)
+	handler.setFormatter(formatter)
+	try:
+		handler.prime(tailFile(path, capacity))
+	except OSError:
+		pass
+	logging.getLogger().addHandler(handler)
+	_handler = handler
+	return handler
+
+
+def getLines(count: int, path: str) -> list:
+	"""Gets the latest log lines.
+
+	Args:
+		count : Maximal number of lines.
+		path : Path of the log file, it is only read if there is no LogTail
+			handler which holds enough lines.
+
+	Returns:
+		A list of lines, the latest line is the last one.
+	"""
+	if _handler and _handler.capacity >= count:
+		return _handler.getLines(count)
+	return tailFile(path, count)
@@ -8,22 +8,37 @@ import os
 import logging
 
 import settings
+import metrics
 
 import sensor
 import pumper
 import controller
 import persistanceLayer
+import timeseries
+import processes
 import web.frontend
 
 
 class Main:
 	"""Controller class for main thread."""
 
-	def __init__(self):
-		"""Initialises the main thread."""
+	def __init__(self, basePath: str = None):
+		"""Initialises the main thread.
+
+		Args:
+			basePath : Optional, the base dir of all conf files (default is
+				settings.BASECONFDIR).
+		"""
+		self._basePath = basePath or settings.BASECONFDIR
 		self._stopRequest = False
-		self._reloadRequest = True
+		self._running = False
 		self._logger = logging.getLogger(__name__)
+
+		# Ensures that only one reload is applied at the same time.
+		self._reloadLock = threading.Lock()
+
+		# Functions which are called after the system was started or reloaded.
+		self._reloadListeners = []
 		signal.signal(signal.SIGINT, self._shutdown)
 		signal.signal(signal.SIGTERM, self._shutdown)
 
@@ -35,93 +50,399 @@ class Main:
 		self._logger.info("Signal received, signum: %d", signum)
 		self._stopRequest = True
 
+	def requestStop(self):
+		"""Thread safe, asks the main loop to stop the system."""
+		self._stopRequest = True
+
 	def reload(self):
-		"""Reloads config and restart all threads.
+		"""Reloads the config and applies only the changes to the running objects.
 
-		This function will remain active until the services have restarted.
+		Pumps, sensors and controllers whose configuration has not changed keep
+		running. Controllers whose rules have changed get their new rules in
+		place. This function returns after all changes have been applied.
 		"""
-		self._stopRequest = True
-		self._reloadRequest = True
+		with self._reloadLock:
+			if not self._running:
+				return
+			self._logger.info("Reloading configuration")
+			confs = persistanceLayer.readAllConfs(
+				self._basePath, settings.CONFLOADWORKERS, settings.SNAPSHOTFILE
+			)
+			try:
+				self._checkConfs(confs)
+			except ValueError:
+				self._logger.exception("Configuration is not applied")
+				return
+			self._reloadPumps(confs["pumps"])
+			changedSensors = self._reloadSensors(confs["sensors"])
+			self._reloadControllers(confs["controllers"], changedSensors)
+			self._notifyReloadListeners()
+
+	def reloadController(self, controllerNr: int):
+		"""Reloads the config of one controller (i.E. after one of its rules was edited).
+
+		Args:
+			controllerNr : The number of the controller.
+		"""
+		with self._reloadLock:
+			if not self._running:
+				return
+			confs = dict(self._controllerConfs)
+			conf = persistanceLayer.readControllerConf(
+				self._basePath, controllerNr
+			)
+			if conf:
+				confs[controllerNr] = conf
+			else:
+				confs.pop(controllerNr, None)
+			self._reloadControllers(confs, set())
+			self._notifyReloadListeners()
+
+	def addReloadListener(self, callback):
+		"""Adds a function which is called after the system was started or reloaded.
+
+		The function is called without arguments while the reload lock is
+		held, it must therefore not reload the system itself.
+		"""
+		self._reloadListeners.append(callback)
+
+	def _notifyReloadListeners(self):
+		"""Calls all reload listeners, must be called with the reload lock held."""
+		for callback in self._reloadListeners:
+			try:
+				callback()
+			except Exception:
+				self._logger.exception("Reload listener failed")
+
+	def _reloadPumps(self, confs: dict):
+		"""Adds, removes and replaces pumps whose configuration has changed."""
+		for nr in self._pumpConfs:
+			if self._pumpConfs[nr] != confs.get(nr):
+				self._logger.info("Removing pump Nr. %d", nr)
+				self.pumper.removePump(nr)
+		for nr in confs:
+			if self._pumpConfs.get(nr) != confs[nr]:
+				self._logger.info("Adding pump Nr. %d", nr)
+				self.pumper.addPump(nr, confs[nr]["gpio"], confs[nr]["flowRate"])
+		self._pumpConfs = confs
+
+	def _reloadSensors(self, confs: dict) -> set:
+		"""Adds, removes and replaces sensors whose configuration has changed.
+
+		Returns:
+			The numbers of all sensors which were replaced or removed.
+		"""
+		sensors = dict(self.sensors)
+		changed = set()
+		for nr, old in self._sensorConfs.items():
+			conf = confs.get(nr)
+			if (
+				not conf
+				or conf["type"] != old["type"]
+				or conf["channel"] != old["channel"]
+			):
+				self._logger.info("Removing sensor Nr. %d", nr)
+				self._removeSensor(nr)
+				del sensors[nr]
+				changed.add(nr)
+
+		for nr, conf in confs.items():
+			if nr in sensors:
+				self._updateSensor(sensors[nr], conf)
+			else:
+				self._logger.info("Adding sensor Nr. %d", nr)
+				sensors[nr] = self._createSensor(nr, conf)
+				self.sensorScheduler.addSensor(sensors[nr])
+
+		self.sensors = sensors
+		self._sensorConfs = confs
+		return changed
+
+	def _reloadControllers(self, confs: dict, changedSensors: set):
+		"""Adds, removes and updates controllers whose configuration has changed.
+
+		Controllers whose pump, sensor, type or deadband has changed are
+		restarted, all other controllers only get their new rules. Controllers
+		whose pump was removed are stopped.
+
+		Args:
+			confs : The configurations of all controllers.
+			changedSensors : Numbers of sensors which were replaced or removed.
+		"""
+		controllers = dict(self.controllers)
+		lastRuns = {}
+		for nr, old in self._controllerConfs.items():
+			conf = confs.get(nr)
+			if (
+				conf
+				and _getControllerHeader(conf) == _getControllerHeader(old)
+				and conf["sensorNr"] not in changedSensors
+				and conf["pumpNr"] in self.pumper.pumps
+			):
+				continue
+			self._logger.info("Stopping controller Nr. %d", nr)
+			self._stopController(nr, controllers[nr])
+			lastRuns[nr] = {rule.name: rule.lastRun for rule in controllers[nr].ruleSet}
+			del controllers[nr]
+
+		for nr, conf in confs.items():
+			if nr in controllers:
+				self._replaceRules(nr, controllers[nr], conf["rules"])
+				continue
+			self._logger.info("Starting controller Nr. %d", nr)
+			c = self._createController(conf)
+			if c is None:
+				continue
+			# Rules which already ran today shall not run again.
+			for rule in c.ruleSet:
+				rule.lastRun = lastRuns.get(nr, {}).get(rule.name)
+			controllers[nr] = c
+			self._startController(nr, c, conf)
+
+		self.controllers = controllers
+		# Rejected controllers are created again by the next reload.
+		self._controllerConfs = {nr: confs[nr] for nr in controllers}
+
+	def _createController(self, conf: dict) -> controller.Controller:
+		"""Creates a controller, returns None if its pump or sensor does not exist."""
+		if conf["pumpNr"] not in self.pumper.pumps:
+			self._logger.error(
+				"Controller Nr. %d is not created, pump Nr. %d does not exist",
+				conf["nr"],
+				conf["pumpNr"],
+			)
+			return None
+		return persistanceLayer.createController(conf, self.pumper, self.sensors)
+
+	def _checkConfs(self, confs: dict):
+		"""Checks the configuration before anything of it is applied.
+
+		Raises:
+			ValueError : The configuration cannot be applied.
+		"""
+
+	def _createSensor(self, sensorNr: int, conf: dict) -> sensor.Sensor:
+		"""Creates a sensor (it is added to the sensor scheduler by the caller)."""
+		return persistanceLayer.createSensor(sensorNr, conf)
+
+	def _updateSensor(self, s: sensor.Sensor, conf: dict):
+		"""Applies the changed interval of a sensor which keeps running."""
+		# The scheduler uses the new interval for the next measurement
+		s.interval = conf["interval"]
+
+	def _removeSensor(self, sensorNr: int):
+		"""Removes a sensor from the sensor scheduler."""
+		self.sensorScheduler.removeSensor(sensorNr)
+
+	def _startController(self, controllerNr: int, c: controller.Controller, conf: dict):
+		"""Starts a controller in a separate thread."""
+		self._controllerThreads[controllerNr] = threading.Thread(
+			target=c.run, args=(), name="controller_" + str(controllerNr)
+		)
+		self._controllerThreads[controllerNr].start()
+
+	def _stopController(self, controllerNr: int, c: controller.Controller):
+		"""Stops a controller and waits until its thread has ended."""
+		c.stop()
+		self._controllerThreads.pop(controllerNr).join()
 
-		while not self._running and self._reloadRequest:
-			time.sleep(0.1)
+	def _replaceRules(self, controllerNr: int, c: controller.Controller, rules: list):
+		"""Gives a running controller its new rules."""
+		c.replaceRules(rules)
 
 	def run(self):
 		"""Starts the main loop and its child threads."""
 		self._logger.info("#########START#########")
+		confs = persistanceLayer.readAllConfs(
+			self._basePath, settings.CONFLOADWORKERS, settings.SNAPSHOTFILE
+		)
+		self._checkConfs(confs)
 
 		# Pumper: Load config and start the thread
-		self.pumper = persistanceLayer.loadPumper(settings.BASECONFDIR)
+		self._pumpConfs = confs["pumps"]
+		self.ledger = pumper.Ledger(settings.LEDGERFILE)
+		self.pumper = pumper.Pumper(self.ledger)
+		for nr, conf in self._pumpConfs.items():
+			self.pumper.addPump(nr, conf["gpio"], conf["flowRate"])
 		self._pumperThread = threading.Thread(
 			target=self.pumper.run, args=(), name="pumper"
 		)
 		self._pumperThread.start()
+		self._ledgerThread = threading.Thread(
+			target=self.ledger.run, args=(settings.LEDGERFLUSHINTERVAL,), name="ledger"
+		)
+		self._ledgerThread.start()
 
-		# Sensors: Load config and start the threads
-		self.sensors = persistanceLayer.loadSensors(settings.BASECONFDIR)
-		self._sensorThreads = {}
-		for sid in self.sensors:
-			self._sensorThreads[sid] = threading.Thread(
-				target=self.sensors[sid].run, args=(), name="sensor_" + str(sid)
-			)
-			self._sensorThreads[sid].start()
+		# Sensors: Load config and start the scheduler which samples all sensors
+		self._sensorConfs = confs["sensors"]
+		self.sensors = {}
+		self.sensorScheduler = sensor.Scheduler(settings.SENSORWORKERS)
+		for sid in self._sensorConfs:
+			self.sensors[sid] = self._createSensor(sid, self._sensorConfs[sid])
+			self.sensorScheduler.addSensor(self.sensors[sid])
+		self._sensorThread = threading.Thread(
+			target=self.sensorScheduler.run, args=(), name="sensor_scheduler"
+		)
+		self._sensorThread.start()
 
-		# Controllers: Load config and start the threads
-		self.controllers = persistanceLayer.loadControllers(
-			settings.BASECONFDIR, self.pumper, self.sensors
+		# History: Stores all measured values of the sensors
+		self.history = timeseries.Store(
+			settings.HISTORYDIR, settings.HISTORYRETENTION, settings.HISTORYRAWSIZE
+		)
+		self.sensorScheduler.addListener(self.history.record)
+		self._historyThread = threading.Thread(
+			target=self.history.run,
+			args=(settings.HISTORYFLUSHINTERVAL,),
+			name="history",
 		)
+		self._historyThread.start()
+
+		# Controllers: Load config and start the threads
+		self.controllers = {}
 		self._controllerThreads = {}
-		for cid in self.controllers:
-			self._controllerThreads[cid] = threading.Thread(
-				target=self.controllers[cid].run, args=(), name="controller_" + str(cid)
-			)
-			self._controllerThreads[cid].start()
+		for cid, conf in confs["controllers"].items():
+			c = self._createController(conf)
+			if c is not None:
+				self.controllers[cid] = c
+				self._startController(cid, c, conf)
+		self._controllerConfs = {
+			cid: confs["controllers"][cid] for cid in self.controllers
+		}
 
 		# Main loop.
 		try:
-			self._running = True
+			with self._reloadLock:
+				self._running = True
+				self._notifyReloadListeners()
+			nextMetricsLog = time.monotonic() + settings.METRICSLOGINTERVAL
 			while not self._stopRequest:
 				time.sleep(1)
+				if settings.METRICSLOGINTERVAL and time.monotonic() >= nextMetricsLog:
+					nextMetricsLog += settings.METRICSLOGINTERVAL
+					metrics.logSummary()
 			self._logger.info("Stop request received by SIGINT/SIGTERM")
-			self._running = False
 
 		except KeyboardInterrupt:
 			self._logger.info("Stop request received by keyboard interrupt")
 
 		finally:
+			with self._reloadLock:
+				self._running = False
 			self.stop()
 
 	def stop(self):
 		"""Sends a stop command to all child threads and joins them back to the main thread."""
 		for cid in self.controllers:
 			self.controllers[cid].stop()
-		for sid in self.sensors:
-			self.sensors[sid].stop()
+		self.sensorScheduler.stop()
 		self.pumper.stop()
 
 		for cid in self._controllerThreads:
 			self._controllerThreads[cid].join()
-		for sid in self._sensorThreads:
-			self._sensorThreads[sid].join()
+		self._sensorThread.join()
 		self._pumperThread.join()
 
+		# The history and the ledger are stopped last, so they get all records.
+		self.history.stop()
+		self.ledger.stop()
+		self._historyThread.join()
+		self._ledgerThread.join()
+
 		self._logger.info("Main thread is goind down")
 
 
+class MultiProcessMain(Main):
+	"""Main which runs the sensors and the controllers in worker processes.
+
+	The sensors are sampled by one worker process, the controllers are spread
+	over settings.CONTROLLERPROCESSES worker processes (see processes.py), so
+	the rule evaluation does not compete with the web frontend for the GIL.
+	The pumps, the history, the ledger and the web frontend stay in the main
+	process, the pump orders of the workers are passed to the Pumper, so only
+	the main process accesses the GPIOs.
+	The sensors of the main process are proxies (sensor.ProxySensor) and its
+	controllers are copies which are not run, they are only used by the web
+	frontend.
+	"""
+
+	def run(self):
+		"""Starts the worker processes, then the main loop (see base class)."""
+		self._processes = processes.ProcessGroup(
+			settings.CONTROLLERPROCESSES, settings.SHAREDSENSORSLOTS, self._onOrder
+		)
+		self._processes.start()
+		try:
+			Main.run(self)
+		finally:
+			# Main.run() may fail before it stops the system itself.
+			self._processes.stop()
+
+	def _checkConfs(self, confs: dict):
+		if len(confs["sensors"]) > settings.SHAREDSENSORSLOTS:
+			raise ValueError(
+				"%d sensors, but only %d SHAREDSENSORSLOTS"
+				% (len(confs["sensors"]), settings.SHAREDSENSORSLOTS)
+			)
+
+	def _onOrder(self, pumpNr: int, seconds, controllerNr: int, ruleName: str):
+		"""Receives a pump order of a worker process."""
+		self.pumper.pump(pumpNr, seconds, controllerNr, ruleName)
+
+	def _createSensor(self, sensorNr: int, conf: dict) -> sensor.Sensor:
+		slot = self._processes.allocateSlot()
+		self._processes.sendToAll("addSensor", sensorNr, conf, slot)
+		return sensor.ProxySensor(
+			sensorNr, conf["channel"], conf["interval"], self._processes.values, slot
+		)
+
+	def _updateSensor(self, s: sensor.Sensor, conf: dict):
+		if s.interval != conf["interval"]:
+			self._processes.sendToAll("updateSensor", s.nr, conf)
+		Main._updateSensor(self, s, conf)
+
+	def _removeSensor(self, sensorNr: int):
+		Main._removeSensor(self, sensorNr)
+		self._processes.sendToAll("removeSensor", sensorNr)
+		self._processes.releaseSlot(self.sensors[sensorNr].slot)
+
+	def _startController(self, controllerNr: int, c: controller.Controller, conf: dict):
+		self._processes.sendToController(
+			controllerNr, "startController", controllerNr, conf
+		)
+
+	def _stopController(self, controllerNr: int, c: controller.Controller):
+		# Unsubscribes the copy from its sensor.
+		c.stop()
+		self._processes.sendToController(controllerNr, "stopController", controllerNr)
+
+	def _replaceRules(self, controllerNr: int, c: controller.Controller, rules: list):
+		Main._replaceRules(self, controllerNr, c, rules)
+		self._processes.sendToController(
+			controllerNr, "replaceRules", controllerNr, rules
+		)
+
+	def stop(self):
+		"""Stops the worker processes first, so no orders arrive at a stopped Pumper."""
+		self._processes.stop()
+		Main.stop(self)
+
+
+def _getControllerHeader(conf: dict) -> tuple:
+	"""Gets all values of a controller configuration except its rules."""
+	return (conf["type"], conf["pumpNr"], conf["sensorNr"], conf["deadband"])
+
+
 if __name__ == "__main__":
-	main = Main()
+	main = MultiProcessMain() if settings.CONTROLLERPROCESSES else Main()
 
 	# Web frontend
 	web = web.frontend.Frontend(main)
 	webThread = threading.Thread(target=web.run, args=(), name="web_frontend")
 	webThread.start()
 
-	# The backend can be reloaded by the web frontend
-	# this loop keeps running also if the main thread and its child threads are restarted.
-	while main._reloadRequest:
-		main._reloadRequest = False
-		main._stopRequest = False
-		main.run()
+	# The backend is reloaded in place by the web frontend (see Main.reload()),
+	# so it only has to be started once.
+	main.run()
 
 	web.stop()
 	webThread.join()
@@ -0,0 +1,309 @@
+"""This module collects metrics about the worker loops of the system.
+
+Metrics are registered once at import time of the instrumented module (i.E.
+histogram(...) on module level) and then updated in the hot paths, an update
+only costs one uncontended lock. All metrics can be rendered in the
+Prometheus text format (see render()) or written to the log (see
+logSummary()).
+
+Durations are measured in real seconds (time.perf_counter()), lateness values
+are measured with the clock of the system (see clock.py).
+"""
+import threading
+import bisect
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the buckets of a histogram.
+DEFAULTBUCKETS = (
+	0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60
+)
+
+# name -> _Family
+_families = {}
+_familiesLock = threading.Lock()
+
+
+class Counter:
+	"""A value which only increases (i.E. the number of errors)."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.value = 0
+
+	def inc(self, amount: float = 1):
+		"""Thread safe, increases the counter."""
+		with self._lock:
+			self.value += amount
+
+	def _getSamples(self, name: str, labels: str) -> list:
+		return ["{}{} {}".format(name, _formatLabels(labels), _formatValue(self.value))]
+
+	def _getSummary(self) -> str:
+		return _formatValue(self.value)
+
+
+class Histogram:
+	"""Counts observed values (i.E. durations) in buckets.
+
+	Attributes:
+		bounds : Upper bounds of the buckets (inclusive), the last bucket has
+			no upper bound.
+	"""
+
+	def __init__(self, bounds: tuple = DEFAULTBUCKETS):
+		self.bounds = bounds
+		self._lock = threading.Lock()
+		self._counts = [0] * (len(bounds) + 1)
+		self._sum = 0.0
+		self._count = 0
+		self._max = 0.0
+
+	def observe(self, value: float):
+		"""Thread safe, adds a value."""
+		i = bisect.bisect_left(self.bounds, value)
+		with self._lock:
+			self._counts[i] += 1
+			self._sum += value
+			self._count += 1
+			if value > self._max:
+				self._max = value
+
+	def getValues(self) -> tuple:
+		"""Thread safe, gets (count, sum, max, counts per bucket)."""
+		with self._lock:
+			return self._count, self._sum, self._max, list(self._counts)
+
+	def getQuantile(self, q: float) -> float:
+		"""Thread safe, estimates a quantile by the upper bound of its bucket.
+
+		Returns:
+			The upper bound, the maximum for the last bucket or None if no
+			value was observed.
+		"""
+		count, _, maximum, counts = self.getValues()
+		if not count:
+			return None
+		rank = q * count
+		total = 0
+		for i, c in enumerate(counts):
+			total += c
+			if total >= rank and c:
+				return min(self.bounds[i], maximum) if i < len(self.bounds) else maximum
+		return maximum
+
+	def _getSamples(self, name: str, labels: str) -> list:
+		count, total, _, counts = self.getValues()
+		samples = []
+		cumulative = 0
+		for bound, c in zip(self.bounds + ("+Inf",), counts):
+			cumulative += c
+			bucketLabels = _joinLabels(labels, 'le="{}"'.format(bound))
+			samples.append(
+				"{}_bucket{} {}".format(name, _formatLabels(bucketLabels), cumulative)
+			)
+		samples.append("{}_sum{} {}".format(name, _formatLabels(labels), repr(total)))
+		samples.append("{}_count{} {}".format(name, _formatLabels(labels), count))
+		return samples
+
+	def _getSummary(self) -> str:
+		count, total, maximum, _ = self.getValues()
+		if not count:
+			return "count=0"
+		return "count={} mean={:.6f} p50<={} p95<={} max={:.6f}".format(
+			count,
+			total / count,
+			self.getQuantile(0.5),
+			self.getQuantile(0.95),
+			maximum,
+		)
+
+
+class _Family:
+	"""All metrics with the same name, one metric per combination of labels."""
+
+	def __init__(self, name: str, helpText: str, metricType: str, labelNames, factory):
+		self.name = name
+		self.helpText = helpText
+		self.metricType = metricType
+		self.labelNames = tuple(labelNames)
+		self._factory = factory
+		self._lock = threading.Lock()
+		# label values (tuple of str) -> metric
+		self._metrics = {}
+
+	def labels(self, *values):
+		"""Thread safe, gets the metric of the given label values.
+
+		Args:
+			values : One value per label name (they are converted to str).
+		"""
+		values = tuple(str(v) for v in values)
+		metric = self._metrics.get(values)
+		if metric is None:
+			if len(values) != len(self.labelNames):
+				raise ValueError(
+					"Metric {} needs labels {}".format(self.name, self.labelNames)
+				)
+			with self._lock:
+				metric = self._metrics.setdefault(values, self._factory())
+		return metric
+
+	def getMetrics(self) -> list:
+		"""Thread safe, gets a list of (labels as text, metric) sorted by labels."""
+		with self._lock:
+			items = sorted(self._metrics.items())
+		metrics = []
+		for values, metric in items:
+			labels = ",".join(
+				'{}="{}"'.format(n, _escape(v)) for n, v in zip(self.labelNames, values)
+			)
+			metrics.append((labels, metric))
+		return metrics
+
+	# Families without labels can be used like their only metric.
+	def inc(self, amount: float = 1):
+		self.labels().inc(amount)
+
+	def observe(self, value: float):
+		self.labels().observe(value)
+
+
+class TimedLock:
+	"""A Lock which measures how long it is waited for and how long it is held.
+
+	It can be used like a threading.Lock (acquire(), release(), with
+	statement). All TimedLocks with the same name share their histograms
+	(chilwater_lock_wait_seconds and chilwater_lock_hold_seconds).
+	"""
+
+	def __init__(self, name: str):
+		"""Initialises an unlocked TimedLock.
+
+		Args:
+			name : Name of the lock (label "lock" of the metrics).
+		"""
+		self.name = name
+		self._lock = threading.Lock()
+		self._wait = _LOCKWAIT.labels(name)
+		self._hold = _LOCKHOLD.labels(name)
+		self._acquiredAt = None
+
+	def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+		start = time.perf_counter()
+		acquired = self._lock.acquire(blocking, timeout)
+		if acquired:
+			# Only the holder of the lock writes _acquiredAt.
+			self._acquiredAt = time.perf_counter()
+			self._wait.observe(self._acquiredAt - start)
+		return acquired
+
+	def release(self):
+		held = time.perf_counter() - self._acquiredAt
+		self._lock.release()
+		self._hold.observe(held)
+
+	def locked(self) -> bool:
+		return self._lock.locked()
+
+	def __enter__(self):
+		self.acquire()
+		return self
+
+	def __exit__(self, *args):
+		self.release()
+
+
+def _register(name: str, helpText: str, metricType: str, labelNames, factory):
+	"""Gets the family of a name, it is created on the first call."""
+	with _familiesLock:
+		family = _families.get(name)
+		if family is None:
+			family = _Family(name, helpText, metricType, labelNames, factory)
+			_families[name] = family
+		elif family.metricType != metricType or family.labelNames != tuple(labelNames):
+			raise ValueError("Metric {} is already registered differently".format(name))
+		return family
+
+
+def counter(name: str, helpText: str, labelNames: tuple = ()) -> _Family:
+	"""Thread safe, registers a counter (or gets it, if it already exists).
+
+	Args:
+		name : Name of the metric (Prometheus naming, i.E. "..._total").
+		helpText : Description of the metric.
+		labelNames : Names of the labels, their values are passed to labels().
+
+	Returns:
+		The family of the counter, use labels(...).inc() or inc() if it has no
+		labels.
+	"""
+	return _register(name, helpText, "counter", labelNames, Counter)
+
+
+def histogram(
+	name: str, helpText: str, labelNames: tuple = (), bounds: tuple = DEFAULTBUCKETS
+) -> _Family:
+	"""Thread safe, registers a histogram (or gets it, if it already exists).
+
+	Args:
+		name : Name of the metric (Prometheus naming, i.E. "..._seconds").
+		helpText : Description of the metric.
+		labelNames : Names of the labels, their values are passed to labels().
+		bounds : Upper bounds of the buckets.
+
+	Returns:
+		The family of the histogram, use labels(...).observe() or observe() if
+		it has no labels.
+	"""
+	return _register(name, helpText, "histogram", labelNames, lambda: Histogram(bounds))
+
+
+def render() -> str:
+	"""Thread safe, renders all metrics in the Prometheus text format."""
+	with _familiesLock:
+		families = sorted(_families.items())
+	lines = []
+	for name, family in families:
+		lines.append("# HELP {} {}".format(name, family.helpText))
+		lines.append("# TYPE {} {}".format(name, family.metricType))
+		for labels, metric in family.getMetrics():
+			lines.extend(metric._getSamples(name, labels))
+	return "\n".join(lines) + "\n"
+
+
+def logSummary(log: logging.Logger = logger):
+	"""Thread safe, writes a summary line of every metric into the log."""
+	with _familiesLock:
+		families = sorted(_families.items())
+	for name, family in families:
+		for labels, metric in family.getMetrics():
+			log.info(
+				"Metric %s%s %s", name, _formatLabels(labels), metric._getSummary()
+			)
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _joinLabels(*labels) -> str:
+	return ",".join(label for label in labels if label)
+
+
+def _formatLabels(labels: str) -> str:
+	return "{" + labels + "}" if labels else ""
+
+
+def _formatValue(value: float) -> str:
+	return str(value) if isinstance(value, int) else repr(float(value))
+
+
+_LOCKWAIT = histogram(
+	"chilwater_lock_wait_seconds", "Time waited to acquire a lock", ("lock",)
+)
+_LOCKHOLD = histogram(
+	"chilwater_lock_hold_seconds", "Time a lock was held", ("lock",)
+)
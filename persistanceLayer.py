@@ -1,13 +1,79 @@
 """This module provides functions for reading and writing configuration files."""
 import os
 import configparser
+import concurrent.futures
+import threading
 import datetime
-
+import logging
+import marshal
+import struct
+import zlib
+import mmap
+import time
+
+import settings
 import pumper
 import sensor
 import controller
 
 
+class _ConfigCache:
+	"""Thread safe cache of parsed configuration files.
+
+	A file is only parsed again if its modification time or its size has
+	changed. The cached ConfigParser objects must not be altered.
+	"""
+
+	def __init__(self):
+		"""Initialises an empty cache."""
+		self._lock = threading.Lock()
+		# path -> ((mtime, size), ConfigParser)
+		self._entries = {}
+
+	def read(self, path: str) -> configparser.ConfigParser:
+		"""Gets the parsed content of a configuration file.
+
+		Args:
+			path : Path of the configuration file.
+		"""
+		st = os.stat(path)
+		key = (st.st_mtime_ns, st.st_size)
+		with self._lock:
+			entry = self._entries.get(path)
+		if entry and entry[0] == key:
+			return entry[1]
+
+		config = configparser.ConfigParser()
+		config.read(path)
+		with self._lock:
+			self._entries[path] = (key, config)
+		return config
+
+	def invalidate(self, path: str):
+		"""Removes a file from the cache (i.E. after it was written)."""
+		with self._lock:
+			self._entries.pop(path, None)
+
+
+logger = logging.getLogger(__name__)
+
+_configCache = _ConfigCache()
+
+# Index of the controller configuration files: basePath -> {controllerNr: path}
+# It is written with the snapshot and loaded from it on the first access.
+_controllerIndex = {}
+_controllerIndexLock = threading.Lock()
+
+
+def _getConfFiles(basePath: str, subDir: str) -> list:
+	"""Gets the paths of all .conf files in a sub directory of the config dir."""
+	return [
+		entry.path
+		for entry in os.scandir(os.path.join(basePath, subDir))
+		if entry.path.endswith(".conf") and entry.is_file()
+	]
+
+
 def loadControllers(
 	basePath: str, pumper: pumper.Pumper, sensors: dict[sensor.Sensor]
 ) -> dict[controller.Controller]:
@@ -22,36 +88,116 @@ def loadControllers(
 		A dict of all controllers, the key represents the controllerNr.
 	"""
 	controllers = {}
-	for entry in os.scandir(os.path.join(basePath, "controllers")):
-		if entry.path.endswith(".conf") and entry.is_file():
-			config = configparser.ConfigParser(defaults={"SensorNr": 0})
-			config.read(entry)
-
-			if not config.has_option("DEFAULT", "Nr"):
-				continue
-
-			# The Default section in the config file describes the controller
-			controllers[config.getint("DEFAULT", "Nr")] = controller.createController(
-				controller.enums.Type.fromNumber(config.getint("DEFAULT", "Type")),
-				pumper,
-				config.getint("DEFAULT", "PumpNr"),
-				# If there is no Sensor specified (TimeController), None is used.
-				sensors.get(config.getint("DEFAULT", "SensorNr"), None),
-			)
+	for nr, conf in readControllerConfs(basePath).items():
+		c = createController(conf, pumper, sensors)
+		if c is not None:
+			controllers[nr] = c
+	return controllers
 
-			if controller.enums.Type.TIME == controller.enums.Type.fromNumber(
-				config.getint("DEFAULT", "Type")
-			):
-				getRule = _getTimeRule
-			else:
-				getRule = _getMeasureRule
 
-			# Load all rules (same config file, other sections).
-			for section in config.sections():
-				controllers[config.getint("DEFAULT", "Nr")].addRule(
-					getRule(section, section, config)
-				)
-	return controllers
+def createController(
+	conf: dict, pumper: pumper.Pumper, sensors: dict[sensor.Sensor]
+) -> controller.Controller:
+	"""Instantiates a Controller with its rules from a controller configuration.
+
+	Args:
+		conf : A controller configuration (see readControllerConfs()).
+		pumper : Reference to a Pumper instance which holds references to all pumps.
+		sensors : A dict of all sensors, the key represents the sensor number.
+
+	Returns:
+		The Controller (not started yet) or None if its sensor does not exist.
+	"""
+	# If there is no Sensor specified (TimeController), None is used.
+	s = sensors.get(conf["sensorNr"], None)
+	if s is None and conf["type"] != controller.Type.TIME:
+		logger.error(
+			"Controller Nr. %d is not created, sensor Nr. %s does not exist",
+			conf["nr"],
+			conf["sensorNr"],
+		)
+		return None
+	c = controller.createController(
+		conf["type"],
+		pumper,
+		conf["pumpNr"],
+		s,
+		conf["deadband"],
+		conf["nr"],
+	)
+	for rule in conf["rules"]:
+		c.addRule(rule)
+	return c
+
+
+def readControllerConfs(basePath: str) -> dict:
+	"""Reads the configuration of all controllers from a given config directory.
+
+	Args:
+		basePath : The base dir of all conf files (/etc/chilwater/).
+
+	Returns:
+		A dict of controller configurations (see readControllerConf()), the key
+		represents the controllerNr.
+	"""
+	confs = {}
+	index = {}
+	for path in _getConfFiles(basePath, "controllers"):
+		conf = _readControllerFile(path)
+		if conf:
+			confs[conf["nr"]] = conf
+			index[conf["nr"]] = path
+	with _controllerIndexLock:
+		_controllerIndex[basePath] = index
+	return confs
+
+
+def readControllerConf(basePath: str, controllerNr: int) -> dict:
+	"""Reads the configuration of one controller.
+
+	Args:
+		basePath : The base dir of all conf files (/etc/chilwater/).
+		controllerNr : The number of the controller.
+
+	Returns:
+		A dict with the keys nr, type (controller.enums.Type), pumpNr, sensorNr,
+		deadband and rules (list of Rule objects) or None if the controller
+		does not exist.
+	"""
+	f = _getControllerFile(basePath, controllerNr)
+	if not f:
+		return None
+	return _readControllerFile(f)
+
+
+def _readControllerFile(path: str) -> dict:
+	"""Reads a controller configuration file (see readControllerConf()).
+
+	Returns:
+		The controller configuration or None if the file contains no controller.
+	"""
+	config = _configCache.read(path)
+
+	if not config.has_option("DEFAULT", "Nr"):
+		return None
+
+	# The Default section in the config file describes the controller
+	conf = {
+		"nr": config.getint("DEFAULT", "Nr"),
+		"type": controller.enums.Type.fromNumber(config.getint("DEFAULT", "Type")),
+		"pumpNr": config.getint("DEFAULT", "PumpNr"),
+		"sensorNr": config.getint("DEFAULT", "SensorNr", fallback=0),
+		"deadband": config.getfloat("DEFAULT", "Deadband", fallback=0),
+	}
+
+	if conf["type"] == controller.enums.Type.TIME:
+		getRule = _getTimeRule
+	else:
+		getRule = _getMeasureRule
+
+	# Load all rules (same config file, other sections).
+	conf["rules"] = [getRule(section, section, config) for section in config.sections()]
+	return conf
 
 
 def _getMeasureRule(ruleName: str, section: str, config: configparser.ConfigParser):
@@ -104,17 +250,53 @@ def _getControllerFile(basePath: str, controllerNr: int) -> str:
 	Return:
 		The full path of the configuration file if one was found, else None.
 	"""
-	for entry in os.scandir(os.path.join(basePath, "controllers")):
-		if entry.path.endswith(".conf") and entry.is_file():
-			config = configparser.ConfigParser()
-			config.read(entry)
+	with _controllerIndexLock:
+		index = _controllerIndex.get(basePath)
+	if index is None:
+		# The index of the last run is kept in the snapshot (see readAllConfs()).
+		index = _readSnapshotIndex(basePath)
+		with _controllerIndexLock:
+			index = _controllerIndex.setdefault(basePath, index)
+	path = index.get(controllerNr)
+	if path and _isControllerFile(path, controllerNr):
+		return path
+
+	# The index is outdated, it is rebuilt (only changed files are parsed again).
+	index = {}
+	for path in _getConfFiles(basePath, "controllers"):
+		config = _configCache.read(path)
+		if config.has_option("DEFAULT", "Nr"):
+			index[config.getint("DEFAULT", "Nr")] = path
+	with _controllerIndexLock:
+		_controllerIndex[basePath] = index
+	return index.get(controllerNr)
+
+
+def _isControllerFile(path: str, controllerNr: int) -> bool:
+	"""Checks if a file (still) contains the configuration of a controller."""
+	try:
+		config = _configCache.read(path)
+	except FileNotFoundError:
+		return False
+	return (
+		config.has_option("DEFAULT", "Nr")
+		and config.getint("DEFAULT", "Nr") == controllerNr
+	)
 
-			if not config.has_option("DEFAULT", "Nr"):
-				continue
-			if config.getint("DEFAULT", "Nr") == controllerNr:
-				return entry
 
-	return None
+def _fileWritten(path: str):
+	"""Invalidates the cached content of a conf file which was written or removed.
+
+	The modification time could remain the same on coarse file systems, so
+	neither the cache nor the snapshot (settings.SNAPSHOTFILE) would notice
+	the change.
+	"""
+	_configCache.invalidate(path)
+	if settings.SNAPSHOTFILE:
+		try:
+			os.remove(settings.SNAPSHOTFILE)
+		except FileNotFoundError:
+			pass
 
 
 def deleteController(basePath: str, controllerNr: int):
@@ -128,6 +310,7 @@ def deleteController(basePath: str, controllerNr: int):
 	if not f:
 		raise Exception("Conf file not found")
 	os.remove(f)
+	_fileWritten(f)
 
 
 def deleteRule(basePath: str, controllerNr: int, rule: str):
@@ -148,6 +331,7 @@ def deleteRule(basePath: str, controllerNr: int, rule: str):
 	config.remove_section(rule)
 	with open(f, "w") as fh:
 		config.write(fh)
+	_fileWritten(f)
 
 
 def editRule(basePath: str, controllerNr: int, ruleName: str, **kwargs):
@@ -174,6 +358,7 @@ def editRule(basePath: str, controllerNr: int, ruleName: str, **kwargs):
 
 	with open(f, "w") as fh:
 		config.write(fh)
+	_fileWritten(f)
 
 
 def loadPumper(basePath: str) -> pumper.Pumper:
@@ -186,17 +371,41 @@ def loadPumper(basePath: str) -> pumper.Pumper:
 		A Pumper objects with all Pumps defined in the config dir.
 	"""
 	p = pumper.Pumper()
-	for entry in os.scandir(os.path.join(basePath, "pumps")):
-		# Each Pump defined in pumps config dir is created and added to the Pumper.
-		if entry.path.endswith(".conf") and entry.is_file():
-			config = configparser.ConfigParser()
-			config.read(entry)
-
-			for section in config.sections():
-				p.addPump(config.getint(section, "Nr"), config.get(section, "GPIO"))
+	for nr, conf in readPumpConfs(basePath).items():
+		p.addPump(nr, conf["gpio"], conf["flowRate"])
 	return p
 
 
+def readPumpConfs(basePath: str) -> dict:
+	"""Reads the configuration of all pumps from a given config directory.
+
+	Args:
+		basePath : The base dir of all conf files (/etc/chilwater/).
+
+	Returns:
+		A dict of pump configurations, the key represents the pumpNr.
+		A pump configuration is a dict with the keys gpio (GPIO number as
+		string) and flowRate (liters per minute, 0 = unknown).
+	"""
+	confs = {}
+	for path in _getConfFiles(basePath, "pumps"):
+		confs.update(_readPumpFile(path))
+	return confs
+
+
+def _readPumpFile(path: str) -> dict:
+	"""Reads a pump configuration file (see readPumpConfs())."""
+	confs = {}
+	config = _configCache.read(path)
+	# Each Pump defined in pumps config dir is created and added to the Pumper.
+	for section in config.sections():
+		confs[config.getint(section, "Nr")] = {
+			"gpio": config.get(section, "GPIO"),
+			"flowRate": config.getfloat(section, "FlowRate", fallback=0),
+		}
+	return confs
+
+
 def loadSensors(basePath: str) -> dict[sensor.Sensor]:
 	"""Loads all Sensor objects defined in a given config directory.
 
@@ -207,20 +416,331 @@ def loadSensors(basePath: str) -> dict[sensor.Sensor]:
 		A dict of Sensor objects, the key is represented by Nr.
 	"""
 	sensors = {}
-	for entry in os.scandir(os.path.join(basePath, "sensors")):
+	for nr, conf in readSensorConfs(basePath).items():
+		sensors[nr] = createSensor(nr, conf)
+	return sensors
+
+
+def createSensor(sensorNr: int, conf: dict) -> sensor.Sensor:
+	"""Instantiates a Sensor from a sensor configuration.
+
+	Args:
+		sensorNr : The number of the sensor.
+		conf : A sensor configuration (see readSensorConfs()).
+	"""
+	return sensor.createSensor(
+		sensorNr, conf["type"], conf["channel"], conf["interval"]
+	)
+
+
+def readSensorConfs(basePath: str) -> dict:
+	"""Reads the configuration of all sensors from a given config directory.
+
+	Args:
+		basePath : The base dir of all conf files (/etc/chilwater/).
+
+	Returns:
+		A dict of sensor configurations with the keys type (sensor.enums.Type),
+		channel and interval. The key represents the sensorNr.
+	"""
+	confs = {}
+	for path in _getConfFiles(basePath, "sensors"):
 		# Each config file is scanned (filename could be equal to sensorNr,
 		# but has not to be.
-		if entry.path.endswith(".conf") and entry.is_file():
-			config = configparser.ConfigParser()
-			config.read(entry)
-
-			for section in config.sections():
-				sensors[config.getint(section, "Nr")] = sensor.createSensor(
-					config.getint(section, "Nr"),
-					sensor.enums.Type.fromNumber(config.getint(section, "Type")),
-					config.get(section, "Channel"),
+		confs.update(_readSensorFile(path))
+	return confs
+
+
+def _readSensorFile(path: str) -> dict:
+	"""Reads a sensor configuration file (see readSensorConfs())."""
+	confs = {}
+	config = _configCache.read(path)
+	for section in config.sections():
+		confs[config.getint(section, "Nr")] = {
+			"type": sensor.enums.Type.fromNumber(config.getint(section, "Type")),
+			"channel": config.get(section, "Channel"),
+			"interval": config.getfloat(
+				section, "Interval", fallback=sensor.Sensor.DEFAULTINTERVAL
+			),
+		}
+	return confs
+
+
+def readAllConfs(basePath: str, workers: int = 0, snapshotPath: str = None) -> dict:
+	"""Reads the configuration of all pumps, sensors and controllers.
+
+	With workers > 0, the files of all three directories are read and parsed
+	concurrently on a thread pool. This mainly helps on slow storage (i.E. SD
+	cards), since the parsing itself is limited by the GIL.
+	The time needed for each file is logged (DEBUG) and returned.
+	If a snapshotPath is given and none of the conf files has changed since
+	the snapshot was written, the configuration is loaded from the snapshot
+	(see _writeSnapshot()). Else the snapshot is rewritten.
+
+	Args:
+		basePath : The base dir of all conf files (/etc/chilwater/).
+		workers : Number of threads, 0 reads all files in the calling thread.
+		snapshotPath : Optional path of a binary snapshot of the configuration.
+
+	Returns:
+		A dict with the following keys:
+		pumps : See readPumpConfs().
+		sensors : See readSensorConfs().
+		controllers : See readControllerConfs().
+		timings : A dict with the number of seconds needed for each file (path as key).
+	"""
+	readers = {
+		"pumps": _readPumpFile,
+		"sensors": _readSensorFile,
+		"controllers": _readControllerFile,
+	}
+	files = [
+		(subDir, path) for subDir in readers for path in _getConfFiles(basePath, subDir)
+	]
+
+	if snapshotPath:
+		# The manifest is created before the files are read, so a file which
+		# is altered while reading invalidates the snapshot.
+		manifest = _getManifest(files)
+		ret = _loadSnapshot(snapshotPath, manifest)
+		if ret:
+			with _controllerIndexLock:
+				_controllerIndex[basePath] = ret.pop("index")
+			return ret
+
+	def read(subDir: str, path: str):
+		start = time.perf_counter()
+		conf = readers[subDir](path)
+		return conf, time.perf_counter() - start
+
+	if workers > 0:
+		with concurrent.futures.ThreadPoolExecutor(
+			max_workers=workers, thread_name_prefix="confloader"
+		) as executor:
+			results = list(executor.map(lambda f: read(*f), files))
+	else:
+		results = [read(*f) for f in files]
+
+	# The results are merged in the same order as the files were listed, so the
+	# result is the same as with the readXXXConfs() functions.
+	ret = {"pumps": {}, "sensors": {}, "controllers": {}, "timings": {}}
+	index = {}
+	for (subDir, path), (conf, seconds) in zip(files, results):
+		ret["timings"][path] = seconds
+		logger.debug("Config file %s read in %.6f s", path, seconds)
+		if subDir != "controllers":
+			ret[subDir].update(conf)
+		elif conf:
+			ret["controllers"][conf["nr"]] = conf
+			index[conf["nr"]] = path
+	with _controllerIndexLock:
+		_controllerIndex[basePath] = index
+
+	if ret["timings"]:
+		slowest = max(ret["timings"], key=ret["timings"].get)
+		logger.info(
+			"%d config files read in %.3f s, slowest: %s (%.3f s)",
+			len(files),
+			sum(ret["timings"].values()),
+			slowest,
+			ret["timings"][slowest],
+		)
+
+	if snapshotPath:
+		try:
+			_writeSnapshot(snapshotPath, manifest, ret, index)
+		except OSError:
+			logger.exception("Config snapshot could not be written")
+	return ret
+
+
+# Snapshot file layout: header (magic, version, crc32 and length of the
+# payload) followed by the payload, which is serialised with marshal.
+_SNAPSHOTMAGIC = b"CWSNAP"
+_SNAPSHOTVERSION = 2
+_SNAPSHOTHEADER = struct.Struct("<6sHII")
+
+
+def _getManifest(files: list) -> list:
+	"""Gets path, modification time and size of all given (subDir, path) files."""
+	manifest = []
+	for subDir, path in files:
+		st = os.stat(path)
+		manifest.append((subDir, path, st.st_mtime_ns, st.st_size))
+	return manifest
+
+
+def _timeToMicroseconds(t: datetime.time) -> int:
+	"""Converts a datetime.time into microseconds since midnight."""
+	return ((t.hour * 60 + t.minute) * 60 + t.second) * 1000000 + t.microsecond
+
+
+def _microsecondsToTime(microseconds: int) -> datetime.time:
+	"""Converts microseconds since midnight into a datetime.time."""
+	seconds, microsecond = divmod(microseconds, 1000000)
+	return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60, microsecond)
+
+
+def _writeSnapshot(path: str, manifest: list, confs: dict, index: dict):
+	"""Writes a binary snapshot of a configuration which was read by readAllConfs().
+
+	The snapshot contains only primitive values, so it can be loaded without
+	parsing any INI text or time strings. The file is replaced atomically.
+
+	Args:
+		path : Path of the snapshot file.
+		manifest : The manifest of the conf files (see _getManifest()).
+		confs : The configuration (see readAllConfs()).
+		index : A dict with the conf file of each controller (controllerNr as key).
+	"""
+	sensors = {
+		nr: (conf["type"].value, conf["channel"], conf["interval"])
+		for nr, conf in confs["sensors"].items()
+	}
+	controllers = {}
+	for nr, conf in confs["controllers"].items():
+		rules = []
+		for rule in conf["rules"]:
+			measure = isinstance(rule, controller.MeasureRule)
+			rules.append(
+				(
+					rule.name,
+					_timeToMicroseconds(rule.timeFrom),
+					_timeToMicroseconds(rule.timeTo),
+					rule.pumpSeconds,
+					rule.comparator.value if measure else 0,
+					rule.rValue if measure else 0.0,
 				)
-	return sensors
+			)
+		controllers[nr] = (
+			index[nr],
+			conf["type"].value,
+			conf["pumpNr"],
+			conf["sensorNr"],
+			conf["deadband"],
+			rules,
+		)
+
+	payload = marshal.dumps((manifest, confs["pumps"], sensors, controllers))
+	header = _SNAPSHOTHEADER.pack(
+		_SNAPSHOTMAGIC, _SNAPSHOTVERSION, zlib.crc32(payload), len(payload)
+	)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path + ".tmp", "wb") as f:
+		f.write(header)
+		f.write(payload)
+	os.replace(path + ".tmp", path)
+
+
+def _readSnapshot(path: str) -> tuple:
+	"""Reads the payload of a snapshot written by _writeSnapshot().
+
+	The snapshot file is memory mapped and only used if its version and
+	checksum are valid.
+
+	Returns:
+		A tuple (manifest, pumps, sensors, controllers) or None if the snapshot
+		can not be used.
+	"""
+	try:
+		with open(path, "rb") as f, mmap.mmap(
+			f.fileno(), 0, access=mmap.ACCESS_READ
+		) as mm:
+			if len(mm) < _SNAPSHOTHEADER.size:
+				return None
+			magic, version, crc, length = _SNAPSHOTHEADER.unpack_from(mm)
+			if magic != _SNAPSHOTMAGIC or version != _SNAPSHOTVERSION:
+				return None
+			with memoryview(mm) as view, view[_SNAPSHOTHEADER.size :] as payload:
+				if len(payload) != length or zlib.crc32(payload) != crc:
+					logger.warning("Config snapshot %s is corrupt", path)
+					return None
+				return marshal.loads(payload)
+	except (OSError, ValueError, EOFError, TypeError):
+		return None
+
+
+def _readSnapshotIndex(basePath: str) -> dict:
+	"""Gets the controller file index of the snapshot (settings.SNAPSHOTFILE).
+
+	The files of the index may have changed since the snapshot was written,
+	the entries must be checked before they are used (see _getControllerFile()).
+
+	Returns:
+		A dict with the conf file of each controller (controllerNr as key), it is
+		empty if there is no snapshot of the basePath.
+	"""
+	payload = settings.SNAPSHOTFILE and _readSnapshot(settings.SNAPSHOTFILE)
+	if not payload:
+		return {}
+	controllerDir = os.path.join(basePath, "controllers", "")
+	return {
+		nr: conf[0]
+		for nr, conf in payload[3].items()
+		if conf[0].startswith(controllerDir)
+	}
+
+
+def _loadSnapshot(path: str, manifest: list) -> dict:
+	"""Loads a configuration snapshot written by _writeSnapshot().
+
+	The snapshot is only used if it is valid (see _readSnapshot()) and its
+	manifest matches the current conf files.
+
+	Args:
+		path : Path of the snapshot file.
+		manifest : The manifest of the current conf files (see _getManifest()).
+
+	Returns:
+		The configuration like readAllConfs() plus the controller file index
+		(key: index), or None if the snapshot can not be used.
+	"""
+	payload = _readSnapshot(path)
+	if not payload:
+		return None
+	snapshotManifest, pumps, sensors, controllers = payload
+	if snapshotManifest != [tuple(m) for m in manifest]:
+		logger.info("Config files have changed, snapshot is not used")
+		return None
+
+	ret = {"pumps": pumps, "sensors": {}, "controllers": {}, "timings": {}, "index": {}}
+	for nr, (sensorType, channel, interval) in sensors.items():
+		ret["sensors"][nr] = {
+			"type": sensor.enums.Type.fromNumber(sensorType),
+			"channel": channel,
+			"interval": interval,
+		}
+	for nr, (f, controllerType, pumpNr, sensorNr, deadband, rules) in controllers.items():
+		conf = {
+			"nr": nr,
+			"type": controller.enums.Type.fromNumber(controllerType),
+			"pumpNr": pumpNr,
+			"sensorNr": sensorNr,
+			"deadband": deadband,
+			"rules": [],
+		}
+		for name, timeFrom, timeTo, pumpSeconds, comparator, rValue in rules:
+			if conf["type"] == controller.enums.Type.TIME:
+				rule = controller.TimeRule(
+					name,
+					_microsecondsToTime(timeFrom),
+					_microsecondsToTime(timeTo),
+					pumpSeconds,
+				)
+			else:
+				rule = controller.MeasureRule(
+					name,
+					_microsecondsToTime(timeFrom),
+					_microsecondsToTime(timeTo),
+					controller.enums.Comparator(comparator),
+					rValue,
+					pumpSeconds,
+				)
+			conf["rules"].append(rule)
+		ret["controllers"][nr] = conf
+		ret["index"][nr] = f
+	logger.info("Config loaded from snapshot %s", path)
+	return ret
 
 
 def getWebServerConf(basePath: str) -> dict:
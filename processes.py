@@ -0,0 +1,263 @@
+"""This module runs the sensors and the controllers in worker processes.
+
+It is used by main.MultiProcessMain (see settings.CONTROLLERPROCESSES). One
+worker process samples all sensors and writes their values into shared
+memory (see sensor.SharedValues), the controllers are spread over the other
+worker processes. Their controllers read the sensor values through
+sensor.ProxySensor objects and pass their pump orders through a queue to the
+main process, which owns the Pumper and therefore the GPIOs.
+
+The workers are started with the "spawn" method, so they do not inherit the
+threads of the main process. All changes of the configuration are sent to
+the workers as commands (name of a _Worker function and its arguments).
+"""
+import multiprocessing
+import collections
+import threading
+import signal
+import logging
+
+import settings
+import sensor
+import pumper
+import persistanceLayer
+
+logger = logging.getLogger(__name__)
+
+# Roles of the worker processes
+SENSORS = "sensors"
+CONTROLLERS = "controllers"
+
+# Seconds to wait for a worker process to end before it is terminated.
+STOPTIMEOUT = 10
+
+
+class _Worker:
+	"""Runs the sensors or a share of the controllers in a worker process."""
+
+	def __init__(self, role: str, values: sensor.SharedValues, orders):
+		"""Initialises a worker without sensors and controllers.
+
+		Args:
+			role : SENSORS or CONTROLLERS.
+			values : The shared memory of the sensor values.
+			orders : The queue of the pump orders (only used by CONTROLLERS).
+		"""
+		self._role = role
+		self._values = values
+		self._pumper = pumper.PumperProxy(orders)
+		self.sensors = {}
+		self.controllers = {}
+		self._controllerThreads = {}
+
+		# Slot of every sensor, the dict is replaced and not altered.
+		self._slots = {}
+
+		# controllerNr -> {rule name: lastRun} of the stopped controllers
+		self._lastRuns = {}
+
+		self.scheduler = sensor.Scheduler(settings.SENSORWORKERS)
+		if role == SENSORS:
+			self.scheduler.addListener(self._onValue)
+
+	def run(self, commands):
+		"""Executes the commands of the main process until "stop" is received."""
+		schedulerThread = threading.Thread(
+			target=self.scheduler.run, args=(), name="sensor_scheduler"
+		)
+		schedulerThread.start()
+		while 1:
+			name, args = commands.get()
+			if name == "stop":
+				break
+			try:
+				getattr(self, name)(*args)
+			except Exception:
+				logger.exception("Worker command %s failed", name)
+
+		for nr in list(self.controllers):
+			self.stopController(nr)
+		self.scheduler.stop()
+		schedulerThread.join()
+		logger.info("Worker process (%s) is going down", self._role)
+
+	def _onValue(self, s: sensor.Sensor, value, timestamp: float):
+		"""Writes a measured value into the shared memory."""
+		# Values of removed sensors must not overwrite a reused slot.
+		if self.sensors.get(s.nr) is s:
+			self._values.write(self._slots[s.nr], value)
+
+	def addSensor(self, sensorNr: int, conf: dict, slot: int):
+		"""Adds a sensor (a ProxySensor in the controller processes)."""
+		if self._role == SENSORS:
+			s = persistanceLayer.createSensor(sensorNr, conf)
+		else:
+			s = sensor.ProxySensor(
+				sensorNr, conf["channel"], conf["interval"], self._values, slot
+			)
+		self._slots = {**self._slots, sensorNr: slot}
+		self.sensors = {**self.sensors, sensorNr: s}
+		self.scheduler.addSensor(s)
+
+	def updateSensor(self, sensorNr: int, conf: dict):
+		"""Applies the changed interval of a sensor."""
+		self.sensors[sensorNr].interval = conf["interval"]
+
+	def removeSensor(self, sensorNr: int):
+		"""Removes a sensor, the sensor process clears its slot."""
+		self.scheduler.removeSensor(sensorNr)
+		self.sensors = {nr: s for nr, s in self.sensors.items() if nr != sensorNr}
+		slot = self._slots[sensorNr]
+		self._slots = {nr: s for nr, s in self._slots.items() if nr != sensorNr}
+		if self._role == SENSORS:
+			self._values.write(slot, None)
+
+	def startController(self, controllerNr: int, conf: dict):
+		"""Creates a controller and starts it in a separate thread."""
+		c = persistanceLayer.createController(conf, self._pumper, self.sensors)
+		if c is None:
+			return
+		# Rules which already ran today shall not run again.
+		lastRuns = self._lastRuns.pop(controllerNr, {})
+		for rule in c.ruleSet:
+			rule.lastRun = lastRuns.get(rule.name)
+		self.controllers[controllerNr] = c
+		self._controllerThreads[controllerNr] = threading.Thread(
+			target=c.run, args=(), name="controller_" + str(controllerNr)
+		)
+		self._controllerThreads[controllerNr].start()
+
+	def stopController(self, controllerNr: int):
+		"""Stops a controller, its lastRuns are kept for a restart."""
+		c = self.controllers.pop(controllerNr)
+		c.stop()
+		self._controllerThreads.pop(controllerNr).join()
+		self._lastRuns[controllerNr] = {rule.name: rule.lastRun for rule in c.ruleSet}
+
+	def replaceRules(self, controllerNr: int, rules: list):
+		"""Gives a running controller its new rules."""
+		self.controllers[controllerNr].replaceRules(rules)
+
+
+def _runWorker(role: str, commands, orders, values, settingsValues: dict):
+	"""Entry point of a worker process."""
+	# Only the main process handles Ctrl+C, it stops the workers.
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	for name, value in settingsValues.items():
+		setattr(settings, name, value)
+	_Worker(role, values, orders).run(commands)
+
+
+def _getSettings() -> dict:
+	"""Gets all settings, the workers take them over (they may have been changed)."""
+	return {
+		name: getattr(settings, name)
+		for name in dir(settings)
+		if name.isupper() and not name.startswith("_")
+	}
+
+
+class ProcessGroup:
+	"""Starts the worker processes and sends them the changes of the configuration.
+
+	The controllers are assigned to the controller processes by their numbers.
+	"""
+
+	def __init__(self, controllerProcesses: int, slots: int, onOrder):
+		"""Initialises the ProcessGroup, the processes are not started yet.
+
+		Args:
+			controllerProcesses : Number of processes which run controllers.
+			slots : Maximal number of sensors (see sensor.SharedValues).
+			onOrder : Function which is called in the main process with the
+				arguments pumpNr, seconds, controllerNr and ruleName of every
+				pump order of a controller.
+
+		Attributes:
+			values : The shared memory of the sensor values.
+		"""
+		self._context = multiprocessing.get_context("spawn")
+		self._controllerProcesses = controllerProcesses
+		self._onOrder = onOrder
+		self.values = sensor.SharedValues(slots)
+		self._freeSlots = collections.deque(range(slots))
+		self._orders = self._context.Queue()
+		self._orderThread: threading.Thread = None
+		self._stopped = False
+
+		# One queue of commands per process, the sensor process is the first.
+		self._commands = []
+		self._processes = []
+
+	def start(self):
+		"""Starts the worker processes and the thread which passes the pump orders."""
+		settingsValues = _getSettings()
+		roles = [SENSORS] + [CONTROLLERS] * self._controllerProcesses
+		for i, role in enumerate(roles):
+			commands = self._context.Queue()
+			process = self._context.Process(
+				target=_runWorker,
+				args=(role, commands, self._orders, self.values, settingsValues),
+				name="chilwater_%s_%d" % (role, i),
+				daemon=True,
+			)
+			process.start()
+			self._commands.append(commands)
+			self._processes.append(process)
+		self._orderThread = threading.Thread(
+			target=self._passOrders, args=(), name="pump_orders"
+		)
+		self._orderThread.start()
+
+	def _passOrders(self):
+		"""Passes the pump orders of the workers to onOrder() until stop()."""
+		while 1:
+			order = self._orders.get()
+			if order is None:
+				break
+			try:
+				self._onOrder(*order)
+			except Exception:
+				logger.exception("Pump order %s could not be passed on", order)
+
+	def allocateSlot(self) -> int:
+		"""NOT THREAD SAFE, gets a free slot of the shared memory.
+
+		The slots are reused as late as possible, so the old value of a slot is
+		overwritten long before it is used again.
+		"""
+		if not self._freeSlots:
+			raise RuntimeError("No free slot for sensor values, see SHAREDSENSORSLOTS")
+		return self._freeSlots.popleft()
+
+	def releaseSlot(self, slot: int):
+		"""NOT THREAD SAFE, gives a slot back which was got by allocateSlot()."""
+		self._freeSlots.append(slot)
+
+	def sendToAll(self, name: str, *args):
+		"""Sends a command to all worker processes (i.E. the changes of sensors)."""
+		for commands in self._commands:
+			commands.put((name, args))
+
+	def sendToController(self, controllerNr: int, name: str, *args):
+		"""Sends a command to the worker process which runs a controller."""
+		self._commands[1 + controllerNr % self._controllerProcesses].put((name, args))
+
+	def stop(self):
+		"""Stops the worker processes and waits until they have ended.
+
+		Further calls do nothing.
+		"""
+		if self._stopped:
+			return
+		self._stopped = True
+		self.sendToAll("stop")
+		for process in self._processes:
+			process.join(STOPTIMEOUT)
+			if process.is_alive():
+				logger.error("Worker process %s is terminated", process.name)
+				process.terminate()
+				process.join()
+		if self._orderThread:
+			self._orders.put(None)
+			self._orderThread.join()
@@ -0,0 +1,286 @@
+"""Records the runs of all pumps."""
+import collections
+import threading
+import datetime
+import marshal
+import struct
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Record: start (seconds since the epoch), seconds, liters, controllerNr
+# (-1 = no controller), pumpNr, flags, length of the rule name (followed by
+# the UTF-8 encoded rule name).
+_RECORD = struct.Struct("<dffiIBB")
+_FIRSTOFRUN = 1
+
+
+class Ledger:
+	"""Append only ledger of all pump runs.
+
+	A run of a pump can be caused by multiple orders (i.E. from different
+	rules), every order gets its own record with the seconds it caused. The
+	records are passed by the pumper thread with add() and written in batches
+	by the ledger thread (see run()).
+
+	The ledger keeps daily aggregates (runs, orders, seconds, liters) per
+	pump, controller and rule, so queries do not have to read the records.
+	The aggregates are saved next to the ledger file, one file per day, so a
+	write only saves the days it changed. Every day file contains the size of
+	the ledger when it was saved, on startup only the records which were
+	written after the last save of their day are read.
+	"""
+
+	def __init__(self, path: str):
+		"""Opens the ledger, the directory is created if needed.
+
+		Args:
+			path : Path of the ledger file.
+		"""
+		self._path = path
+		self._aggregateDir = path + ".agg"
+		self._pending = collections.deque()
+		self._lock = threading.Lock()
+		self._stopEvent = threading.Event()
+
+		# Daily aggregates: day (date.toordinal()) ->
+		# {(pumpNr, controllerNr, ruleName): [runs, orders, seconds, liters]}
+		self._days = {}
+		self._offset = 0
+
+		os.makedirs(self._aggregateDir, exist_ok=True)
+		self._load()
+
+	def add(
+		self,
+		pumpNr: int,
+		start: datetime.datetime,
+		orders: list,
+		flowRate: float = 0,
+	):
+		"""Thread safe, adds a finished run of a pump.
+
+		The run is only queued, it is written by the ledger thread.
+
+		Args:
+			pumpNr : Number of the pump.
+			start : Start of the run.
+			orders : A list of (controllerNr, ruleName, seconds), the seconds of
+				all orders together are the duration of the run.
+			flowRate : Liters per minute of the pump (0 = unknown).
+		"""
+		timestamp = start.timestamp()
+		flags = _FIRSTOFRUN
+		for controllerNr, ruleName, seconds in orders:
+			self._pending.append(
+				(
+					timestamp,
+					seconds,
+					seconds * flowRate / 60,
+					-1 if controllerNr is None else controllerNr,
+					pumpNr,
+					flags,
+					ruleName or "",
+				)
+			)
+			flags = 0
+
+	def run(self, flushInterval: float = 30):
+		"""Starts the ledger loop.
+
+		This function keeps running until the function stop() is called from
+		another thread. It writes the queued records regularly.
+
+		Args:
+			flushInterval : Number of seconds between two writes.
+		"""
+		logger.info("Pump ledger started")
+		while not self._stopEvent.wait(flushInterval):
+			self.flush()
+		self.flush()
+		logger.info("Pump ledger is going down")
+
+	def stop(self):
+		"""Thread safe, stops the ledger loop after the last write."""
+		self._stopEvent.set()
+
+	def flush(self):
+		"""Thread safe, writes all queued records and saves the aggregates."""
+		records = []
+		while self._pending:
+			records.append(self._pending.popleft())
+		if not records:
+			return
+
+		data = bytearray()
+		packed = []
+		for record in records:
+			name = record[6].encode()[:255]
+			try:
+				data += _RECORD.pack(*record[:6], len(name)) + name
+			except struct.error:
+				logger.exception("Pump ledger: record %s is skipped", record)
+				continue
+			packed.append(record)
+		if not packed:
+			return
+		try:
+			with self._lock:
+				with open(self._path, "ab") as f:
+					f.write(data)
+					self._offset = f.tell()
+				days = set()
+				for record in packed:
+					days.add(self._aggregate(*record))
+				self._saveAggregates(days)
+		except OSError:
+			logger.exception("Pump ledger could not be written")
+
+	def _aggregate(
+		self, start, seconds, liters, controllerNr, pumpNr, flags, ruleName
+	) -> int:
+		"""Adds a record to the daily aggregates and returns its day.
+
+		The lock must be held.
+		"""
+		day = datetime.date.fromtimestamp(start).toordinal()
+		key = (pumpNr, None if controllerNr < 0 else controllerNr, ruleName)
+		aggregate = self._days.setdefault(day, {}).setdefault(key, [0, 0, 0.0, 0.0])
+		aggregate[0] += flags & _FIRSTOFRUN
+		aggregate[1] += 1
+		aggregate[2] += seconds
+		aggregate[3] += liters
+		return day
+
+	def _saveAggregates(self, days: set):
+		"""Saves the aggregates of the given days, the lock must be held.
+
+		The offset of the ledger is saved after the days, if the days are saved
+		but not the offset, the records of these days are skipped by _load().
+		"""
+		for day in days:
+			self._dump(str(day), (self._offset, self._days[day]))
+		self._dump("offset", self._offset)
+
+	def _dump(self, name: str, value):
+		"""Replaces a file of the aggregates directory with the marshaled value."""
+		path = os.path.join(self._aggregateDir, name)
+		with open(path + ".tmp", "wb") as f:
+			marshal.dump(value, f)
+		os.replace(path + ".tmp", path)
+
+	def _load(self):
+		"""Loads the aggregates and adds the records which were written later."""
+		# day -> offset of the ledger when the day was saved
+		savedOffsets = {}
+		complete = True
+		for name in os.listdir(self._aggregateDir):
+			if name != "offset" and not name.isdigit():
+				# A temporary file of an interrupted save.
+				continue
+			try:
+				with open(os.path.join(self._aggregateDir, name), "rb") as f:
+					value = marshal.load(f)
+				if name == "offset":
+					self._offset = value
+				else:
+					savedOffsets[int(name)], self._days[int(name)] = value
+			except (OSError, EOFError, ValueError, TypeError):
+				logger.warning("Pump ledger: aggregates %s are ignored", name)
+				complete = False
+		if not complete:
+			# The lost day is rebuilt from all records.
+			self._offset = 0
+
+		try:
+			with open(self._path, "rb") as f:
+				f.seek(self._offset)
+				data = f.read()
+		except FileNotFoundError:
+			return
+		position = 0
+		while position + _RECORD.size <= len(data):
+			*record, length = _RECORD.unpack_from(data, position)
+			end = position + _RECORD.size + length
+			if end > len(data):
+				# Incomplete record of an interrupted write.
+				break
+			day = datetime.date.fromtimestamp(record[0]).toordinal()
+			if self._offset + position >= savedOffsets.get(day, 0):
+				self._aggregate(*record, data[position + _RECORD.size : end].decode())
+			position = end
+		if position:
+			self._offset += position
+			logger.info("Pump ledger: %d bytes added to the aggregates", position)
+
+	def getDailyTotals(
+		self,
+		start: datetime.date,
+		end: datetime.date,
+		pumpNr: int = None,
+		controllerNr: int = None,
+		ruleName: str = None,
+	) -> dict:
+		"""Thread safe, gets the totals per day for the given filters.
+
+		Args:
+			start : First day.
+			end : Last day (inclusive).
+			pumpNr : Optional, only runs of this pump are included.
+			controllerNr : Optional, only orders of this controller are included.
+			ruleName : Optional, only orders of rules with this name are included.
+
+		Returns:
+			A dict with the days (datetime.date) as key and dicts {"runs",
+			"orders", "seconds", "liters"} as value. Days without runs are
+			not included. If an order filter is given, "runs" counts only the
+			runs whose first order matches.
+		"""
+		first, last = start.toordinal(), end.toordinal()
+		totals = {}
+		with self._lock:
+			# Only the days with runs are visited, the range may be huge.
+			for day in self._days:
+				if day < first or day > last:
+					continue
+				for (pNr, cNr, name), aggregate in self._days[day].items():
+					if (
+						(pumpNr is not None and pNr != pumpNr)
+						or (controllerNr is not None and cNr != controllerNr)
+						or (ruleName is not None and name != ruleName)
+					):
+						continue
+					total = totals.setdefault(day, [0, 0, 0.0, 0.0])
+					for i, value in enumerate(aggregate):
+						total[i] += value
+		return {
+			datetime.date.fromordinal(day): dict(
+				zip(("runs", "orders", "seconds", "liters"), total)
+			)
+			for day, total in sorted(totals.items())
+		}
+
+	def query(
+		self,
+		start: datetime.date,
+		end: datetime.date,
+		pumpNr: int = None,
+		controllerNr: int = None,
+		ruleName: str = None,
+	) -> dict:
+		"""Thread safe, gets the totals of a date range.
+
+		Args:
+			See getDailyTotals().
+
+		Returns:
+			A dict {"runs", "orders", "seconds", "liters"}.
+		"""
+		result = {"runs": 0, "orders": 0, "seconds": 0.0, "liters": 0.0}
+		for total in self.getDailyTotals(
+			start, end, pumpNr, controllerNr, ruleName
+		).values():
+			for key in result:
+				result[key] += total[key]
+		return result
@@ -8,15 +8,19 @@ logger = logging.getLogger(__name__)
 class Pump:
 	"""Represents a physical Pump."""
 
-	def __init__(self, pumpNr: int, gpio: str):
+	__slots__ = ("_pumpNr", "_gpio", "flowRate", "_pumping")
+
+	def __init__(self, pumpNr: int, gpio: str, flowRate: float = 0):
 		"""Intatiates a Pump.
 
 		Args:
 			pumpNr : Number of the Pump (identifier).
 			gpio : GPIO on which the pump is attached (as string).
+			flowRate : Liters per minute which are pumped (0 = unknown).
 		"""
 		self._pumpNr = pumpNr
 		self._gpio = int(gpio)
+		self.flowRate = flowRate
 
 		# True if Pump is currently pumping, else False.
 		self._pumping = False
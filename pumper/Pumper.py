@@ -3,23 +3,47 @@
 
 from pumper.Pump import Pump
 from pumper.enums import State
-import threading
-import time
+import heapq
+import queue
 import datetime
+import time
 import logging
 
+import clock
+import metrics
+
 logger = logging.getLogger(__name__)
 
+_LOOPTIME = metrics.histogram(
+	"chilwater_pumper_loop_seconds", "Duration of one pumper loop iteration"
+)
+_STOPLATENESS = metrics.histogram(
+	"chilwater_pump_stop_lateness_seconds",
+	"Clock seconds a pump was stopped after its deadline",
+	("pump",),
+)
+_ORDERS = metrics.counter("chilwater_pump_orders_total", "Pump orders", ("pump",))
+
 
 class _Pump(Pump):
 	"""Private class for a pump extending the Pump class in Pump.py.
 
 	It adds values and functions which are used for the pump management.
-	This Class is NOT THREAD SAFE, every access to it must be secured with a
-	lock (in Pumper class)"
+	This Class is NOT THREAD SAFE, it must only be altered by the pumper
+	thread (Pumper.run()), other threads send their orders through the
+	order queue of the Pumper.
 	"""
 
-	def __init__(self, pumpNr: int, gpio: str):
+	__slots__ = (
+		"_pendingSeconds",
+		"_deadline",
+		"_runSince",
+		"_startedAt",
+		"_runOrders",
+		"finishedRun",
+	)
+
+	def __init__(self, pumpNr: int, gpio: str, flowRate: float = 0):
 		"""See base class
 
 		Attributes:
@@ -27,12 +51,26 @@ class _Pump(Pump):
 						The pump must be stopped if it reaches 0.
 			For the rest, see base class Pump
 		"""
-		Pump.__init__(self, pumpNr, gpio)
-		self.seconds = float(0)
+		Pump.__init__(self, pumpNr, gpio, flowRate)
+
+		# Seconds ordered while the pump is stopped.
+		self._pendingSeconds = float(0)
+
+		# Monotonic time (clock monotonic()) at which a running pump must stop.
+		self._deadline: float = None
 
-		# runSince is used to calculate the stop time.
+		# runSince is the time when the pump was started.
 		self._runSince: datetime.datetime = None
 
+		# Monotonic time at which the pump was started.
+		self._startedAt: float = None
+
+		# Orders of the current (or next) run: [controllerNr, ruleName, seconds]
+		self._runOrders = []
+
+		# The last finished run: (runSince, [(controllerNr, ruleName, seconds)])
+		self.finishedRun = None
+
 	def __del__(self):
 		"""Stops the pump before the object is destroyed.
 
@@ -41,34 +79,84 @@ class _Pump(Pump):
 		"""
 		self.stop()
 
-	def manageStartStop(self):
+	@property
+	def seconds(self) -> float:
+		"""Number of seconds for which the pump still has to run."""
+		if self._deadline is not None:
+			return max(float(0), self._deadline - clock.getClock().monotonic())
+		return self._pendingSeconds
+
+	def addSeconds(
+		self, seconds: float, controllerNr: int = None, ruleName: str = None
+	):
+		"""Adds seconds to the running time of the pump.
+
+		If the pump is running, its stop deadline is moved, else the seconds
+		are used on the next start.
+
+		Args:
+			seconds : Number of seconds.
+			controllerNr : Number of the controller which ordered the seconds.
+			ruleName : Name of the rule which ordered the seconds.
+		"""
+		self._runOrders.append([controllerNr, ruleName, seconds])
+		if self._deadline is not None:
+			self._deadline += seconds
+		else:
+			self._pendingSeconds += seconds
+
+	def manageStartStop(self, now: float) -> float:
 		"""Stops/starts the pump, if this has to be done.
 
-		Recalculates the seconds based on the time ellapsed since the last call.
+		Args:
+			now : The current monotonic time (clock monotonic()).
+
+		Returns:
+			The stop deadline if the pump is running, else None.
 		"""
-		if self._runSince and self.seconds <= 0:
+		if self._deadline is not None and self._deadline <= now:
 			# Pump started, but has to be stopped
 			self.stop()
-			self._runSince = None
+			self._finishRun(now)
 
-		elif not self._runSince and self.seconds > 0:
+		elif self._deadline is None and self._pendingSeconds > 0:
 			# Pump stopped, but has to be started
-			self._runSince = datetime.datetime.now()
+			self._deadline = now + self._pendingSeconds
+			self._pendingSeconds = float(0)
+			self._runSince = clock.getClock().now()
+			self._startedAt = now
 			self.start()
 
-		elif self._runSince:
-			# Pump started, seconds have to be updated
-			currentDate = datetime.datetime.now()
-			self.seconds -= (currentDate - self._runSince).total_seconds()
-			self._runSince = currentDate
+		return self._deadline
+
+	def _finishRun(self, now: float):
+		"""Resets the run variables and stores the run in finishedRun.
+
+		The real running time is assigned to the orders in their order, so
+		orders which were cut off by an immediate stop get less seconds.
+		"""
+		remaining = now - self._startedAt
+		orders = []
+		for controllerNr, ruleName, seconds in self._runOrders:
+			seconds = min(seconds, remaining)
+			if seconds > 0:
+				orders.append((controllerNr, ruleName, seconds))
+				remaining -= seconds
+		self.finishedRun = (self._runSince, orders)
+		self._runOrders = []
+		self._deadline = None
+		self._runSince = None
+		self._startedAt = None
 
 	def immediateStop(self):
 		"""Imediately stops Pump and resets control variables.
 
 		Is used if the whole System is going down.
 		"""
-		self.seconds = float(0)
-		self._runSince: datetime.datetime = None
+		self._pendingSeconds = float(0)
+		if self._deadline is not None:
+			self._finishRun(clock.getClock().monotonic())
+		self._runOrders = []
 		self.stop()
 
 
@@ -79,10 +167,14 @@ class _TestPump(_Pump):
 	which now simply make a log entry.
 	"""
 
+	__slots__ = ()
+
 	def start(self):
+		self._pumping = True
 		logger.info("TESTPUMP START: " + str(self._pumpNr))
 
 	def stop(self):
+		self._pumping = False
 		logger.info("TESTPUMP  STOP: " + str(self._pumpNr))
 
 
@@ -92,19 +184,36 @@ class Pumper:
 	Runs in a separate thread and gets pump orders from other threads.
 	Other threads can also create new pumps and delete exsiting ones
 	with its class methods.
+	Pump orders are put into a queue which is drained by the pumper thread,
+	so ordering a pump never waits for the GPIO access of other pumps.
 	"""
 
-	def __init__(self):
+	def __init__(self, ledger=None):
 		"""Inits Pumper with an empty list of pumps.
-		
+
+		Args:
+			ledger : Optional, a pumper.Ledger which records all pump runs.
+
 		Attributes:
 			pump : A dict of pumps, which are managed by this pumper (pumNr is the key).
-			lock : A Lock object which must be used for direct state changes of Pumper.
+			lock : A Lock object which must be used for direct state changes of Pumper
+				(a metrics.TimedLock).
 		"""
 		self.pumps = {}
-		self.lock = threading.Lock()
+		self._ledger = ledger
+		self.lock = metrics.TimedLock("pumper")
 		self._stop: bool = None
 
+		# Queue of pump orders (pumpNr, seconds, controllerNr, ruleName), only
+		# drained by the pumper thread.
+		self._orders = queue.SimpleQueue()
+
+		# Pumps which were removed and have to be stopped by the pumper thread.
+		self._removedPumps = []
+
+		# Listeners of pump starts/stops, the list is replaced and not altered.
+		self._subscribers = []
+
 	def run(self):
 		"""Starts the pumper management loop.
 
@@ -112,67 +221,198 @@ class Pumper:
 		another thread.
 		It ensures that the pumps are stopped after the specified time which
 		was given in the pump() function.
+		The loop sleeps until the earliest stop deadline of a running pump or
+		until a new order arrives.
 		"""
 		logger.info("Pumper startet")
 		self._state = State.RUNNING
-		while 1:
-			time.sleep(0.1)
 
+		# heap entries: (deadline, pumpNr), entries of pumps whose deadline
+		# was moved in the meantime are skipped.
+		deadlines = []
+		while 1:
+			c = clock.getClock()
+			timeout = None
+			if deadlines:
+				timeout = c.getTimeout(max(0, deadlines[0][0] - c.monotonic()))
+			try:
+				orders = [self._orders.get(timeout=timeout)]
+			except queue.Empty:
+				orders = []
+
+			start = time.perf_counter()
 			with self.lock:
-				if self._stop:
-					for pump in self.pumps:
-						self.pumps[pump].immediateStop()
+				stop = self._stop
+				# The pumps are only altered by this thread, so they can be
+				# managed outside of the lock.
+				pumps = self.pumps.copy()
+				removedPumps = self._removedPumps
+				self._removedPumps = []
+
+			for pump in removedPumps:
+				self._immediateStop(pump)
+
+			if stop:
+				for pump in pumps.values():
+					self._immediateStop(pump)
+
+				self._state = State.STOPPED
+				logger.info("Pumper is going down")
+				break
+
+			now = c.monotonic()
+			for pumpNr in self._applyOrders(orders, pumps):
+				deadline = self._manageStartStop(pumps[pumpNr], now)
+				if deadline is not None:
+					heapq.heappush(deadlines, (deadline, pumpNr))
+
+			while deadlines and deadlines[0][0] <= now:
+				deadline, pumpNr = heapq.heappop(deadlines)
+				pump = pumps.get(pumpNr)
+				if pump and pump._deadline == deadline:
+					_STOPLATENESS.labels(pumpNr).observe(c.monotonic() - deadline)
+					self._manageStartStop(pump, now)
+			_LOOPTIME.observe(time.perf_counter() - start)
+
+	def _manageStartStop(self, pump: _Pump, now: float) -> float:
+		"""Calls pump.manageStartStop() and publishes a start/stop of the pump."""
+		running = pump._deadline is not None
+		deadline = pump.manageStartStop(now)
+		if running != (deadline is not None):
+			self._publish(pump)
+		return deadline
+
+	def _immediateStop(self, pump: _Pump):
+		"""Calls pump.immediateStop() and publishes the stop of a running pump."""
+		running = pump._deadline is not None
+		pump.immediateStop()
+		if running:
+			self._publish(pump)
+
+	def _publish(self, pump: _Pump):
+		"""Calls all subscribers with the new state of a pump.
+
+		A finished run is passed to the ledger.
+		"""
+		if pump.finishedRun:
+			runSince, orders = pump.finishedRun
+			pump.finishedRun = None
+			if self._ledger and orders:
+				self._ledger.add(pump.getPumpNr(), runSince, orders, pump.flowRate)
+		for callback in self._subscribers:
+			try:
+				callback(pump.getPumpNr(), pump._deadline is not None, pump._runSince)
+			except Exception:
+				logger.exception("Pump subscriber failed")
+
+	def _applyOrders(self, orders: list, pumps: dict) -> set:
+		"""Applies the given and all other queued pump orders to their pumps.
+
+		Must only be called from the pumper thread.
+
+		Returns:
+			The numbers of all pumps which received an order.
+		"""
+		while 1:
+			try:
+				orders.append(self._orders.get_nowait())
+			except queue.Empty:
+				break
+
+		ordered = set()
+		for order in orders:
+			# None is only used to wake up the pumper thread.
+			if order and order[0] in pumps:
+				_ORDERS.labels(order[0]).inc()
+				pumps[order[0]].addSeconds(*order[1:])
+				ordered.add(order[0])
+		return ordered
+
+	def subscribe(self, callback):
+		"""Thread safe, subscribes a listener to the starts and stops of all pumps.
+
+		The callback is called from the pumper thread, it should therefore
+		return quickly.
 
-					self._state = State.STOPPED
-					logger.info("Pumper is going down")
-					break
+		Args:
+			callback : Function which is called with the arguments pumpNr,
+				running (bool) and runSince (datetime of the start or None).
+		"""
+		with self.lock:
+			self._subscribers = self._subscribers + [callback]
 
-				for pump in self.pumps:
-					self.pumps[pump].manageStartStop()
+	def unsubscribe(self, callback):
+		"""Thread safe, removes a listener which was added with subscribe()."""
+		with self.lock:
+			self._subscribers = [c for c in self._subscribers if c != callback]
 
 	def stop(self):
-		"""Thread safe, stops the sensor measure loop."""
+		"""Thread safe, stops the pumper management loop."""
 		with self.lock:
 			self._stop = True
+		self._orders.put(None)
 
-	def addPump(self, pumpNr, gpio):
+	def addPump(self, pumpNr, gpio, flowRate: float = 0):
 		"""Thread safe, instantiates a pump and adds it to the managed pump list.
 
 		Args:
 			pumpNr: Number of the pump (int).
 			gpio: GPIO Pin of the pump.
+			flowRate: Liters per minute which are pumped (0 = unknown).
 		"""
 		with self.lock:
 			if pumpNr in self.pumps:
 				raise ValueError("pumpNr is already in use by another pump")
 
-			if gpio == 0:
+			if int(gpio) == 0:
 				# For testing purposes for when there is no hardware available.
-				self.pumps[pumpNr] = _TestPump(pumpNr, gpio)
+				self.pumps[pumpNr] = _TestPump(pumpNr, gpio, flowRate)
 			else:
-				self.pumps[pumpNr] = _Pump(pumpNr, gpio)
+				self.pumps[pumpNr] = _Pump(pumpNr, gpio, flowRate)
+
+	def removePump(self, pumpNr):
+		"""Thread safe, removes a pump from the managed pump list.
+
+		A running pump is stopped by the pumper thread.
 
-	def pump(self, pumpNr: int, seconds: int) -> int:
+		Args:
+			pumpNr: Number of the pump (int).
+		"""
+		with self.lock:
+			self._removedPumps.append(self.pumps.pop(pumpNr))
+		self._orders.put(None)
+
+	def pump(
+		self,
+		pumpNr: int,
+		seconds: int,
+		controllerNr: int = None,
+		ruleName: str = None,
+	) -> int:
 		"""Thread safe, receives a pump order for a specific pump.
 
-		The pump is started, on the next checking time (manageStartStop())
-		and will be stopped after the time period defined in "seconds" has elapsed.
+		The order is queued and the pump is started on the next checking time
+		(manageStartStop()). It will be stopped after the time period defined
+		in "seconds" has elapsed.
 		If the pump is already running, the seconds are added to the predefined
 		ones.
 
 		Args:
 			pumpNr: Number of the pump.
 			seconds: For how many seconds shall the pump be activated?
+			controllerNr: Optional, number of the ordering controller (for the ledger).
+			ruleName: Optional, name of the ordering rule (for the ledger).
 
 		Returns:
-			New value (could be equivalent to the argument "seconds", but could
-			be also more than that.
+			Expected new value (could be equivalent to the argument "seconds",
+			but could be also more than that). Orders of other threads which
+			are still queued are not included.
 		"""
 		logger.info("Pump order received, pumpNr: %d, second: %d", pumpNr, seconds)
-		with self.lock:
-
-			self.pumps[pumpNr].seconds += seconds
-			return self.pumps[pumpNr].seconds
+		# Raises a KeyError for unknown pumps, like a direct access would do.
+		pump = self.pumps[pumpNr]
+		self._orders.put((pumpNr, seconds, controllerNr, ruleName))
+		return pump.seconds + seconds
 
 	def getPumpState(self, pumpNr: int) -> str:
 		"""NOT THREAD SAFE, gets a string representation of the current Pump state.
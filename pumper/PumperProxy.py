@@ -0,0 +1,37 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PumperProxy:
+	"""Passes pump orders to the Pumper of another process.
+
+	It is used by the controllers of a worker process instead of a Pumper,
+	only the process which owns the Pumper accesses the GPIOs.
+	"""
+
+	def __init__(self, orders):
+		"""Initialises a PumperProxy.
+
+		Args:
+			orders : A multiprocessing queue, the owner of the Pumper passes
+				the orders (pumpNr, seconds, controllerNr, ruleName) to
+				Pumper.pump().
+		"""
+		self._orders = orders
+
+	def pump(
+		self,
+		pumpNr: int,
+		seconds: int,
+		controllerNr: int = None,
+		ruleName: str = None,
+	) -> int:
+		"""Thread safe, passes a pump order to the Pumper (see Pumper.pump()).
+
+		Returns:
+			The ordered seconds, the state of the pump is not known here.
+		"""
+		logger.info("Pump order passed on, pumpNr: %d, second: %d", pumpNr, seconds)
+		self._orders.put((pumpNr, seconds, controllerNr, ruleName))
+		return seconds
@@ -5,3 +5,5 @@ you can manage one or multiple pumps.
 """
 
 from pumper.Pumper import Pumper
+from pumper.Ledger import Ledger
+from pumper.PumperProxy import PumperProxy
@@ -7,6 +7,8 @@ class EmptySensor(Sensor):
 	For details, see base class.
 	"""
 
+	__slots__ = ()
+
 	def __init__(self):
 		"""Iitialises the EmptySensor with dummy values."""
 		Sensor.__init__(self, 0, 0)
@@ -1,17 +1,21 @@
 from sensor import Sensor
-from lib.adc import MCP3008
+import lib.adc
 
 
 class LightSensor(Sensor):
 	"""Represents a light sensor.
 	"""
+
+	__slots__ = ()
+
 	def _measure(self):
 		"""Reads the Sensor
 
 		Returns:
 			Returns a normalized light value between 0 and 100.
 		"""
-		adc = MCP3008()
+		adc = lib.adc.getMCPInterface()
 		normalized_max_value = 100
-		value = adc.read(int(self.channel))
+		# All sensors on the chip share one burst read.
+		value = adc.readBuffered(int(self.channel), self.interval / 2)
 		return round((value / 1023.0 * normalized_max_value), 2)
@@ -0,0 +1,73 @@
+import multiprocessing
+import math
+
+from sensor import Sensor
+
+
+class SharedValues:
+	"""Sensor values in shared memory, one slot (a double) per sensor.
+
+	The values are written by the process which samples the real sensors and
+	read by any number of other processes (see ProxySensor). NaN stands for
+	no value (None). A SharedValues object can only be passed to a process
+	when the process is started.
+	"""
+
+	def __init__(self, size: int):
+		"""Allocates the shared memory, all slots are empty.
+
+		Args:
+			size : Number of slots (maximal number of sensors).
+		"""
+		self._values = multiprocessing.RawArray("d", [math.nan] * size)
+
+	def __len__(self) -> int:
+		return len(self._values)
+
+	def write(self, slot: int, value):
+		"""Thread safe, writes the value of a slot (None clears the slot).
+
+		A slot must only be written by one thread, a double is written at once,
+		so the readers need no lock.
+		"""
+		self._values[slot] = math.nan if value is None else value
+
+	def read(self, slot: int):
+		"""Thread safe, reads the value of a slot (None if it is empty)."""
+		value = self._values[slot]
+		return None if math.isnan(value) else value
+
+
+class ProxySensor(Sensor):
+	"""Sensor which reads the values of a sensor of another process.
+
+	The real sensor is sampled by another process which writes its values
+	into a slot of a SharedValues object, the ProxySensor reads this slot.
+	It is sampled like any other sensor (i.E. by a sensor.Scheduler), so
+	its subscribers are notified about changed values.
+	"""
+
+	__slots__ = ("_sharedValues", "slot")
+
+	def __init__(
+		self,
+		nr: int,
+		channel: str,
+		interval: float,
+		sharedValues: SharedValues,
+		slot: int,
+	):
+		"""Initialises a ProxySensor.
+
+		Args:
+			sharedValues : The shared memory of the sensor values.
+			slot : The slot of the real sensor.
+			For the other Arguments, see base class (the channel is the one of
+			the real sensor).
+		"""
+		Sensor.__init__(self, nr, channel, interval)
+		self._sharedValues = sharedValues
+		self.slot = slot
+
+	def _measure(self):
+		return self._sharedValues.read(self.slot)
@@ -0,0 +1,204 @@
+import sensor.enums
+import concurrent.futures
+import itertools
+import threading
+import heapq
+import time
+import logging
+
+import clock
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_SAMPLETIME = metrics.histogram(
+	"chilwater_sensor_sample_seconds", "Duration of Sensor.sample()", ("sensor",)
+)
+_LATENESS = metrics.histogram(
+	"chilwater_sensor_lateness_seconds",
+	"Clock seconds a sample started after its due time",
+	("sensor",),
+)
+_OVERRUNS = metrics.counter(
+	"chilwater_sensor_overruns_total",
+	"Samples which took longer than the sensor interval",
+	("sensor",),
+)
+_ERRORS = metrics.counter(
+	"chilwater_sensor_errors_total", "Failed sensor reads", ("sensor",)
+)
+
+
+class Scheduler:
+	"""Samples many Sensors from one scheduling thread.
+
+	Every Sensor has its own sampling interval (Sensor.interval). The Scheduler
+	keeps a heap with the next due time of each Sensor and sleeps until the
+	earliest one is due. Due Sensors are measured on a small worker pool, so a
+	slow Sensor (i.E. a 1-Wire read) does not delay the others. The worker
+	threads are only created if there is work to do.
+	"""
+
+	def __init__(self, workers: int = 4):
+		"""Initialises a Scheduler without any Sensors.
+
+		Args:
+			workers : Maximal number of threads which measure Sensors in parallel.
+
+		Attributes:
+			lock : A Condition object, used for thread safe altering of this object.
+				It is also notified if the heap has changed.
+		"""
+		self.lock = threading.Condition()
+		self._workers = workers
+		self._executor: concurrent.futures.ThreadPoolExecutor = None
+
+		# heap entries: (dueTime, sequence, token, Sensor)
+		self._heap = []
+		self._sequence = itertools.count()
+
+		# The token of a sensor changes if it is removed/readded, so stale heap
+		# entries can be recognized and dropped.
+		self._tokens = {}
+		self._sensors = {}
+		self._stop = False
+		self._state = sensor.enums.State.STOPPED
+
+		# Listeners of all measurements, the list is replaced and not altered.
+		self._listeners = []
+
+	def addListener(self, callback):
+		"""Thread safe, adds a listener which gets every measured value.
+
+		Unlike Sensor.subscribe(), unchanged values are passed too. The callback
+		is called from the worker thread which measured the Sensor, it should
+		therefore return quickly.
+
+		Args:
+			callback : Function which is called with the arguments Sensor,
+				value and timestamp (clock time() of the measurement).
+		"""
+		with self.lock:
+			self._listeners = self._listeners + [callback]
+
+	def removeListener(self, callback):
+		"""Thread safe, removes a listener which was added with addListener()."""
+		with self.lock:
+			self._listeners = [c for c in self._listeners if c != callback]
+
+	def addSensor(self, s: sensor.Sensor):
+		"""Thread safe, adds a Sensor which is then sampled on its interval.
+
+		Args:
+			s : The Sensor, its number (Sensor.nr) must be unique.
+		"""
+		with self.lock:
+			if s.nr in self._sensors:
+				raise ValueError("sensorNr is already in use by another sensor")
+			token = next(self._sequence)
+			self._sensors[s.nr] = s
+			self._tokens[s.nr] = token
+			s._state = sensor.enums.State.RUNNING
+			heapq.heappush(self._heap, (clock.getClock().monotonic(), token, token, s))
+			self.lock.notify()
+
+	def removeSensor(self, sensorNr: int):
+		"""Thread safe, removes a Sensor from the Scheduler.
+
+		A measurement which is already running is finished, but its Sensor is not
+		rescheduled anymore.
+
+		Args:
+			sensorNr : The number of the Sensor.
+		"""
+		with self.lock:
+			s = self._sensors.pop(sensorNr)
+			del self._tokens[sensorNr]
+			s._state = sensor.enums.State.STOPPED
+
+	def getSensors(self) -> dict:
+		"""NOT THREAD SAFE, getter for all Sensors (the key is the sensorNr)."""
+		return self._sensors
+
+	def run(self):
+		"""Starts the scheduling loop.
+
+		This function keeps running until the function stop() is called from
+		another thread.
+		"""
+		logger.info("Sensor scheduler started with %d sensors", len(self._sensors))
+		self._executor = concurrent.futures.ThreadPoolExecutor(
+			max_workers=self._workers, thread_name_prefix="sensor"
+		)
+		self._state = sensor.enums.State.RUNNING
+		with self.lock:
+			while not self._stop:
+				now = clock.getClock().monotonic()
+				while self._heap and self._heap[0][0] <= now:
+					due, _, token, s = heapq.heappop(self._heap)
+					if self._tokens.get(s.nr) != token:
+						# Sensor was removed in the meantime
+						continue
+					self._executor.submit(self._sample, s, token, due)
+
+				if self._heap:
+					clock.getClock().wait(self.lock, self._heap[0][0] - now)
+				else:
+					self.lock.wait()
+
+		self._executor.shutdown(wait=True)
+		with self.lock:
+			for s in self._sensors.values():
+				s._state = sensor.enums.State.STOPPED
+		self._state = sensor.enums.State.STOPPED
+		logger.info("Sensor scheduler is going down")
+
+	def _sample(self, s: sensor.Sensor, token: int, due: float):
+		"""Measures a Sensor and schedules its next measurement.
+
+		Is executed by a worker thread.
+		"""
+		_LATENESS.labels(s.nr).observe(max(0, clock.getClock().monotonic() - due))
+		start = time.perf_counter()
+		try:
+			value = s.sample()
+		except Exception:
+			_ERRORS.labels(s.nr).inc()
+			logger.exception("Sensor Nr. %d could not be measured", s.nr)
+		else:
+			timestamp = clock.getClock().time()
+			for callback in self._listeners:
+				try:
+					callback(s, value, timestamp)
+				except Exception:
+					logger.exception("Sensor listener failed")
+
+		duration = time.perf_counter() - start
+		_SAMPLETIME.labels(s.nr).observe(duration)
+
+		with self.lock:
+			if self._tokens.get(s.nr) != token:
+				return
+			now = clock.getClock().monotonic()
+			if now > due + s.interval:
+				_OVERRUNS.labels(s.nr).inc()
+			# If the sensor is overdue, it is not measured multiple times in a row.
+			nextDue = max(due + s.interval, now)
+			heapq.heappush(self._heap, (nextDue, next(self._sequence), token, s))
+			if self._heap[0][2] == token:
+				self.lock.notify()
+
+	def getState(self) -> sensor.enums.State:
+		"""NOT THREAD SAFE getter for current state.
+
+		Returns:
+			State.RUNNING, if the scheduler is up and running,
+			State.STOPPED else.
+		"""
+		return self._state
+
+	def stop(self):
+		"""Thread safe, stops the scheduling loop."""
+		with self.lock:
+			self._stop = True
+			self.lock.notify()
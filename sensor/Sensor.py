@@ -1,55 +1,180 @@
 import sensor.enums
 import threading
-import time
+import bisect
 import logging
 
+import clock
+
 logger = logging.getLogger(__name__)
 
 
-class Sensor:
-	"""Abstract class, represents a sensor."""
+class Subscription:
+	"""Represents the subscription of a listener to the values of a Sensor.
+
+	The listener is only notified if the value has changed by at least the
+	deadband or if it has crossed one of the thresholds since the last
+	notification.
+	"""
+
+	__slots__ = ("callback", "deadband", "_thresholds", "_lastValue")
 
-	def __init__(self, nr: int, channel: str):
+	def __init__(self, callback, deadband: float = 0, thresholds: list = ()):
+		"""Initialises a Subscription.
+
+		Args:
+			callback : Function which is called with the new value as argument.
+			deadband : Minimal change of the value which is notified (0 = every change).
+			thresholds : Values whose crossing is always notified.
+		"""
+		self.callback = callback
+		self.deadband = deadband
+		self.setThresholds(thresholds)
+		self._lastValue = None
+
+	def setThresholds(self, thresholds: list):
+		"""Replaces the thresholds of the Subscription."""
+		self._thresholds = sorted(set(thresholds))
+
+	def _getPosition(self, value) -> tuple:
+		"""Gets the position of a value relative to the thresholds."""
+		return (
+			bisect.bisect_left(self._thresholds, value),
+			bisect.bisect_right(self._thresholds, value),
+		)
+
+	def _shouldNotify(self, value) -> bool:
+		"""Checks if a new value has to be notified."""
+		last = self._lastValue
+		if value is None or last is None:
+			return value is not last
+		if value == last:
+			return False
+		if abs(value - last) >= self.deadband:
+			return True
+		return self._getPosition(value) != self._getPosition(last)
+
+	def notify(self, value):
+		"""Calls the callback if the value has to be notified."""
+		if self._shouldNotify(value):
+			self._lastValue = value
+			self.callback(value)
+
+
+class Sensor:
+	"""Abstract class, represents a sensor.
+
+	The sensors and their descendants have no __dict__ (see __slots__), new
+	attributes of descendants must be added to their __slots__.
+	"""
+
+	__slots__ = (
+		"nr",
+		"lock",
+		"channel",
+		"interval",
+		"_state",
+		"_stop",
+		"_value",
+		"_subscriptions",
+	)
+
+	# Default sampling interval in seconds.
+	DEFAULTINTERVAL = 0.1
+
+	def __init__(self, nr: int, channel: str, interval: float = DEFAULTINTERVAL):
 		"""Initialises a Sensor object.
 
 		Args:
 			nr : Number of the pump (defined in config file and used by Controller)
 			channel : The channel on which the physical sensor is plugged in.
+			interval : Number of seconds between two measurements.
 
 		Attributes:
 			nr : See Args.
 			channel : See Args.
+			interval : See Args.
 			lock : A Lock object which is used for thread safe altering of this object.
 		"""
 		self.nr = nr
 		self.lock = threading.Lock()
 		self.channel = channel
+		self.interval = interval
 
 		# current state of the sensor
 		self._state = sensor.enums.State.STOPPED
 		self._stop = False
 		self._value = None
+		self._subscriptions = []
 
 	def run(self):
 		"""Starts the sensor measure loop.
 
 		This function keeps running until the function stop() is called from
 		another thread. It measures the current sensor value regularly.
+		Usually, Sensors are not run in their own thread, but sampled by a
+		sensor.Scheduler.
 		"""
 		logger.info("Sensor Nr. %d started on channel: %s", self.nr, self.channel)
 		self._state = sensor.enums.State.RUNNING
 		while 1:
-			time.sleep(0.1)
+			clock.getClock().sleep(self.interval)
 
-			# Measuring outsyide sync block -> less blocking time
-			val = self._measure()
-			logger.debug("Value measured: %f", val)
 			with self.lock:
 				if self._stop:
 					self._state = sensor.enums.State.STOPPED
 					logger.info("Sensor is going down")
 					break
-				self._value = val
+			self.sample()
+
+	def sample(self):
+		"""Thread safe, measures the sensor once and stores the value.
+
+		If the value has changed, it is published to the subscribers.
+
+		Returns:
+			The measured value.
+		"""
+		# Measuring outsyide sync block -> less blocking time
+		val = self._measure()
+		logger.debug("Value measured: %s", val)
+		with self.lock:
+			if val == self._value:
+				return val
+			self._value = val
+			subscriptions = self._subscriptions
+
+		for subscription in subscriptions:
+			subscription.notify(val)
+		return val
+
+	def subscribe(self, callback, deadband: float = 0, thresholds: list = ()):
+		"""Thread safe, subscribes a listener to the values of the sensor.
+
+		The callback is called from the thread which measures the sensor, it
+		should therefore return quickly.
+
+		Args:
+			callback : Function which is called with the new value as argument.
+			deadband : Minimal change of the value which is notified (0 = every change).
+			thresholds : Values whose crossing is always notified.
+
+		Returns:
+			The Subscription, it is needed for unsubscribe().
+		"""
+		subscription = Subscription(callback, deadband, thresholds)
+		with self.lock:
+			subscription._lastValue = self._value
+			# The list is replaced and not altered, so it can be iterated
+			# outside of the lock.
+			self._subscriptions = self._subscriptions + [subscription]
+		return subscription
+
+	def unsubscribe(self, subscription: Subscription):
+		"""Thread safe, removes a subscription from the sensor."""
+		with self.lock:
+			self._subscriptions = [
+				s for s in self._subscriptions if s is not subscription
+			]
 
 	def getState(self) -> sensor.enums.State:
 		"""NOT THREAD SAFE getter for current state.
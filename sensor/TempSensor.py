@@ -1,32 +1,47 @@
 from sensor import Sensor
-import re, os
+import lib.onewire
+import settings
+import metrics
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+_ERRORS = metrics.counter(
+	"chilwater_sensor_errors_total", "Failed sensor reads", ("sensor",)
+)
+
 
 class TempSensor(Sensor):
 	"""Represents a temperature sensor.
+
+	The channel is the path of the w1_slave file of a DS18B20 probe (i.E.
+	/sys/bus/w1/devices/28-3c01b556cc3d/w1_slave) or only the id of the probe
+	(i.E. 28-3c01b556cc3d), which is then looked up in settings.ONEWIREDIR.
+	All probes of a 1-Wire tree are read together by a shared
+	lib.onewire.OneWireBus.
 	"""
+
+	__slots__ = ()
+
+	def _getDevice(self) -> tuple:
+		"""Gets the devices directory and the id of the probe."""
+		if os.sep in self.channel:
+			deviceDir = os.path.dirname(self.channel)
+			return os.path.dirname(deviceDir), os.path.basename(deviceDir)
+		return settings.ONEWIREDIR, self.channel
+
 	def _measure(self):
 		"""Reads the Sensor
 
 		Returns:
 			Returns the read temperature.
 		"""
-		value = 100.0
-		try:
-			f = open(self.channel, "r")
-			line = f.readline()
-			if re.match(r"([0-9a-f]{2} ){9}: crc=[0-9a-f]{2} YES", line):
-				line = f.readline()
-				m = re.match(r"([0-9a-f]{2} ){9}t=([+-]?[0-9]+)", line)
-				if m:
-					value = float(m.group(2)) / 1000.0
-			f.close()
-		except IOError as e:
-			print("Error reading path: ", self.channel)
-			print(e)
-		finally:
-			return value
-
-
-
-
-
+		baseDir, deviceId = self._getDevice()
+		bus = lib.onewire.getOneWireBus(baseDir, settings.ONEWIREWORKERS)
+		value = bus.read(deviceId, self.interval)
+		if value is None:
+			_ERRORS.labels(self.nr).inc()
+			logger.error("Error reading path: %s", self.channel)
+			return 100.0
+		return value
@@ -1,6 +1,6 @@
 from sensor import Sensor
+from sensor.TestValueProvider import getTestValueProvider
 import settings
-import configparser
 
 
 class TestTempSensor(Sensor):
@@ -9,8 +9,8 @@ class TestTempSensor(Sensor):
 	It reads values not from a sensor but from a config file.
 	For details, see class TempSensor.
 	"""
-	def _measure(self):
-		config = configparser.ConfigParser()
-		config.read(settings.TESTFILE)
 
-		return config.getfloat("Sensors", str(self.channel))
+	__slots__ = ()
+
+	def _measure(self):
+		return getTestValueProvider(settings.TESTFILE).getValue(str(self.channel))
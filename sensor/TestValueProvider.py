@@ -0,0 +1,169 @@
+"""Provides the values of the test sensors (TestTempSensor, ...)."""
+import configparser
+import threading
+import bisect
+import os
+import logging
+
+import clock
+
+logger = logging.getLogger(__name__)
+
+_providers = {}
+_providersLock = threading.Lock()
+
+
+class TestValueProvider:
+	"""Serves the values of a test settings file from memory.
+
+	The file is only parsed again if it has changed, it is checked at most
+	once per check interval. The section [Sensors] contains fixed values,
+	the section [Sequences] contains value curves which are interpolated
+	linearly (a sequence overrides a fixed value of the same channel):
+
+		[Sequences]
+		# Relative seconds, the sequence is repeated after the last point.
+		1 = 0 20, 1800 25, 3600 20
+		# Times of day, the curve is repeated every day.
+		2 = 06:00 40, 12:00 80, 20:00 40
+
+	The sequences use the clock of the system, so they also run faster with
+	a virtual clock.
+	"""
+
+	def __init__(self, path: str, checkInterval: float = 1):
+		"""Initialises a TestValueProvider, the file is parsed on the first access.
+
+		Args:
+			path : Path of the test settings file.
+			checkInterval : Minimal number of seconds between two checks of the file.
+		"""
+		self._path = path
+		self._checkInterval = checkInterval
+		self._lock = threading.Lock()
+		self._nextCheck = None
+		self._fileKey = None
+		self._values = {}
+		# channel -> (times, values, period, daily)
+		self._sequences = {}
+		self._start = clock.getClock().time()
+
+	def getValue(self, channel: str) -> float:
+		"""Thread safe, gets the current value of a channel.
+
+		Args:
+			channel : The channel of the test sensor (as string).
+
+		Raises:
+			KeyError : There is no value for the channel.
+		"""
+		self._check()
+		# ConfigParser stores the options in lower case.
+		channel = channel.lower()
+		sequence = self._sequences.get(channel)
+		if sequence:
+			return self._interpolate(*sequence)
+		return self._values[channel]
+
+	def _check(self):
+		"""Parses the file again if it has changed (at most once per check interval)."""
+		now = clock.getClock().monotonic()
+		if self._nextCheck is not None and now < self._nextCheck:
+			return
+		with self._lock:
+			if self._nextCheck is not None and now < self._nextCheck:
+				return
+			self._nextCheck = now + self._checkInterval
+			try:
+				stat = os.stat(self._path)
+			except OSError:
+				logger.exception("Test settings could not be read")
+				return
+			fileKey = (stat.st_mtime_ns, stat.st_size)
+			if fileKey == self._fileKey:
+				return
+			try:
+				self._parse()
+			except (configparser.Error, ValueError):
+				logger.exception("Test settings could not be parsed")
+				return
+			self._fileKey = fileKey
+
+	def _parse(self):
+		"""Parses the file, must be called with the lock held."""
+		config = configparser.ConfigParser()
+		with open(self._path) as f:
+			config.read_file(f)
+		values = {}
+		if config.has_section("Sensors"):
+			for channel, value in config.items("Sensors"):
+				values[channel] = float(value)
+		sequences = {}
+		if config.has_section("Sequences"):
+			for channel, value in config.items("Sequences"):
+				sequences[channel] = self._parseSequence(value)
+		# The dicts are replaced, so they can be read without the lock.
+		self._values = values
+		self._sequences = sequences
+
+	@staticmethod
+	def _parseSequence(text: str) -> tuple:
+		"""Parses a sequence ("time value, time value, ...", see class)."""
+		points = []
+		daily = ":" in text
+		for point in text.split(","):
+			t, value = point.split()
+			if daily:
+				parts = [int(p) for p in t.split(":")]
+				seconds = parts[0] * 3600 + parts[1] * 60 + (parts[2:] or [0])[0]
+			else:
+				seconds = float(t)
+			points.append((seconds, float(value)))
+		points.sort()
+		if daily:
+			period = 86400
+		else:
+			period = points[-1][0] or 1
+		times = [p[0] for p in points]
+		values = [p[1] for p in points]
+		return times, values, period, daily
+
+	def _interpolate(self, times: list, values: list, period: float, daily: bool):
+		"""Gets the value of a sequence at the current time of the clock."""
+		if daily:
+			now = clock.getClock().now()
+			position = now.hour * 3600 + now.minute * 60 + now.second
+			position += now.microsecond / 1000000
+		else:
+			position = (clock.getClock().time() - self._start) % period
+
+		i = bisect.bisect_right(times, position)
+		if daily and (i == 0 or i == len(times)):
+			# Between the last point of a day and the first of the next day.
+			t0, v0 = times[-1], values[-1]
+			t1, v1 = times[0] + period, values[0]
+			if i == 0:
+				position += period
+		elif i == len(times):
+			return values[-1]
+		elif i == 0:
+			return values[0]
+		else:
+			t0, v0 = times[i - 1], values[i - 1]
+			t1, v1 = times[i], values[i]
+		if t1 == t0:
+			return v1
+		return v0 + (v1 - v0) * (position - t0) / (t1 - t0)
+
+
+def getTestValueProvider(path: str) -> TestValueProvider:
+	"""Thread safe getter for the shared TestValueProvider of a file.
+
+	Args:
+		path : Path of the test settings file (i.E. settings.TESTFILE).
+	"""
+	provider = _providers.get(path)
+	if provider is None:
+		with _providersLock:
+			provider = _providers.setdefault(path, TestValueProvider(path))
+	return provider
@@ -3,9 +3,11 @@ This ist the Sensor Package.
 
 Its main content is an abstract class Sensor and descendants which implement this class.
 A Sensor is the representation of one physical sensor.
+All Sensors are sampled by one Scheduler, each on its own interval.
 """
 
 from sensor.Sensor import Sensor
+from sensor.Sensor import Subscription
 from sensor.enums import Type
 from sensor.TempSensor import TempSensor
 from sensor.HumSensor import HumSensor
@@ -14,29 +16,36 @@ from sensor.EmptySensor import EmptySensor
 from sensor.TestTempSensor import TestTempSensor
 from sensor.TestHumSensor import TestHumSensor
 from sensor.TestLightSensor import TestLightSensor
+from sensor.TestValueProvider import TestValueProvider
+from sensor.ProxySensor import ProxySensor
+from sensor.ProxySensor import SharedValues
+from sensor.Scheduler import Scheduler
 
 
-def createSensor(nr: int, sensorType: Type, channel: str = "0"):
+def createSensor(
+	nr: int, sensorType: Type, channel: str = "0", interval: float = Sensor.DEFAULTINTERVAL
+):
 	"""Factory function for Sensor objects.
 
 	Args:
 		sensorType: Enum (sensor.enums.Type) of Sensor type.
 		channel: Channel number on which the physical sensor is attached.
+		interval: Sampling interval of the Sensor in seconds.
 
 	Returns:
 		A Sensor instance of the given type. The Sensor is not startet yet.
 	"""
 	if sensorType == Type.TEMPERATURE:
-		return TempSensor(nr, channel)
+		return TempSensor(nr, channel, interval)
 	elif sensorType == Type.HUMIDITY:
-		return HumSensor(nr, channel)
+		return HumSensor(nr, channel, interval)
 	elif sensorType == Type.LIGHT:
-		return LightSensor(nr, channel)
+		return LightSensor(nr, channel, interval)
 	if sensorType == Type.TEST_TEMPERATURE:
-		return TestTempSensor(nr, channel)
+		return TestTempSensor(nr, channel, interval)
 	elif sensorType == Type.TEST_HUMIDITY:
-		return TestHumSensor(nr, channel)
+		return TestHumSensor(nr, channel, interval)
 	elif sensorType == Type.TEST_LIGHT:
-		return TestLightSensor(nr, channel)
+		return TestLightSensor(nr, channel, interval)
 	else:
 		raise NotImplementedError
@@ -9,22 +9,91 @@ It is used for the following purposes:
 import os
 import logging
 
+import logTail
+
 
 # BASECONFDIR = "/var/lib/chilwater/conf/"
 BASECONFDIR = os.path.join(os.getcwd(), "conf")
 
 TESTFILE = os.path.join(BASECONFDIR, "testSetting.conf")
 
+# Maximal number of threads which measure sensors in parallel.
+SENSORWORKERS = 4
+
+# Devices directory of the 1-Wire sysfs tree (a fake tree can be used for tests).
+ONEWIREDIR = "/sys/bus/w1/devices"
+
+# Maximal number of 1-Wire probes which are read in parallel.
+ONEWIREWORKERS = 8
+
+# Seconds between two dumps of all metrics into the log (0 = disabled).
+METRICSLOGINTERVAL = 600
+
+# Evaluate the rules of the controllers with a controller.ruling.RuleTable, which
+# needs less memory than a CompiledRuleSet for controllers with many rules.
+RULETABLE = False
+
+# Number of worker processes which run the controllers (0 = everything runs in the
+# main process). If set, the sensors are sampled by one more worker process.
+CONTROLLERPROCESSES = 0
+
+# Maximal number of sensors whose values are shared with the worker processes.
+SHAREDSENSORSLOTS = 1024
+
+# Number of threads which read the config files in parallel (0 = serial).
+CONFLOADWORKERS = 0
+
+# Binary snapshot of the parsed config files, used for faster starts (None = disabled).
+SNAPSHOTFILE = os.path.join(os.getcwd(), "cache", "conf.snapshot")
+
+# Directory of the sensor value history (see timeseries.Store).
+HISTORYDIR = os.path.join(os.getcwd(), "history")
+
+# Seconds for which the history is kept, per resolution in seconds.
+HISTORYRETENTION = {1: 6 * 3600, 60: 31 * 86400, 3600: 2 * 365 * 86400}
+
+# Number of raw values per sensor which are kept in memory.
+HISTORYRAWSIZE = 600
+
+# Seconds between two writes of the history to the disk.
+HISTORYFLUSHINTERVAL = 60
+
+# Maximal number of points which are returned by the history service.
+HISTORYMAXPOINTS = 1000
+
+# File of the pump ledger, which records all pump runs (see pumper.Ledger).
+LEDGERFILE = os.path.join(os.getcwd(), "history", "pumps.ledger")
+
+# Seconds between two writes of the pump ledger.
+LEDGERFLUSHINTERVAL = 30
+
+# Number of status changes which are kept for the web frontend (see web.status).
+STATUSMAXDELTAS = 1000
+
+# Seconds after which an idle event stream of the web frontend sends a keep alive.
+STATUSKEEPALIVE = 15
+
+# Maximal number of event streams of the web frontend. Every stream occupies a
+# thread of the web server, the thread pool is enlarged by this number.
+STATUSMAXSTREAMS = 20
+
 LOGFILE = os.path.join(os.getcwd(), "log", "chilwater.log")
 LOGLEVEL = logging.INFO
+LOGFORMAT = "%(asctime)s %(threadName)-12s %(levelname)-8s %(message)s"
+LOGDATEFORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Number of log lines which are kept in memory for the web frontend.
+LOGTAILSIZE = 200
 
+os.makedirs(os.path.dirname(LOGFILE), exist_ok=True)
 logging.basicConfig(
 	filename=LOGFILE,
 	filemode="a",
 	level=LOGLEVEL,
-	format="%(asctime)s %(threadName)-12s %(levelname)-8s %(message)s",
-	datefmt="%Y-%m-%d %H:%M:%S",
+	format=LOGFORMAT,
+	datefmt=LOGDATEFORMAT,
 )
+logTail.install(LOGFILE, LOGTAILSIZE, logging.Formatter(LOGFORMAT, LOGDATEFORMAT))
 
 # Automaticall switch from RPi.GPIO to fake_rpigio in non-RPi environments
 try:
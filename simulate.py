@@ -0,0 +1,119 @@
+"""Runs the whole chili watering system with an accelerated virtual clock.
+
+The system is started with the configuration of a conf directory, but the
+clock runs faster than the real time (see clock.VirtualClock). This allows
+to test rule schedules over many days in a few seconds. Only test pumps
+(GPIO = 0) are allowed, test sensors read their values from the
+testSetting.conf of the conf directory.
+The history and the pump ledger are written into a temporary directory, at
+the end the pump ledger is printed.
+
+Example:
+	python simulate.py --conf conf --days 3 --speed 5000
+"""
+import argparse
+import threading
+import datetime
+import tempfile
+import shutil
+import time
+import os
+import sys
+
+import settings
+import clock
+import persistanceLayer
+import main
+
+
+def _parseArgs(args: list):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--conf", default=settings.BASECONFDIR, help="conf directory")
+	parser.add_argument(
+		"--start",
+		type=datetime.datetime.fromisoformat,
+		default=None,
+		help="start time of the virtual clock (ISO format, default is now)",
+	)
+	parser.add_argument("--days", type=float, default=1, help="simulated days")
+	parser.add_argument(
+		"--speed", type=float, default=1000, help="simulated seconds per real second"
+	)
+	parser.add_argument(
+		"--interval",
+		type=float,
+		default=None,
+		help="sampling interval of all sensors in simulated seconds",
+	)
+	return parser.parse_args(args)
+
+
+def simulate(
+	basePath: str,
+	start: datetime.datetime,
+	days: float,
+	speed: float,
+	interval: float = None,
+) -> main.Main:
+	"""Runs the system with a virtual clock until the simulated time is over.
+
+	Args:
+		basePath : The base dir of all conf files.
+		start : Start time of the virtual clock.
+		days : Number of days which are simulated.
+		speed : Number of simulated seconds per real second.
+		interval : Optional, sampling interval of all sensors in simulated seconds.
+
+	Returns:
+		The stopped Main object (i.E. for reading its ledger).
+	"""
+	for nr, conf in persistanceLayer.readPumpConfs(basePath).items():
+		if int(conf["gpio"]) != 0:
+			raise ValueError("Pump Nr. {} is not a test pump (GPIO = 0)".format(nr))
+
+	settings.TESTFILE = os.path.join(basePath, "testSetting.conf")
+	settings.SNAPSHOTFILE = None
+	workDir = tempfile.mkdtemp(prefix="chilwater_simulation_")
+	settings.HISTORYDIR = os.path.join(workDir, "history")
+	settings.LEDGERFILE = os.path.join(workDir, "pumps.ledger")
+
+	virtualClock = clock.VirtualClock(start, speed)
+	clock.setClock(virtualClock)
+	m = main.Main(basePath)
+	end = virtualClock.now() + datetime.timedelta(days=days)
+	try:
+		t = threading.Thread(target=m.run, args=(), name="simulation")
+		t.start()
+		while not m._running and t.is_alive():
+			time.sleep(0.01)
+		if interval:
+			for s in m.sensors.values():
+				s.interval = interval
+		while virtualClock.now() < end and t.is_alive():
+			time.sleep(0.05)
+		m.requestStop()
+		t.join()
+	finally:
+		clock.setClock(clock.SystemClock())
+		shutil.rmtree(workDir, ignore_errors=True)
+	return m
+
+
+if __name__ == "__main__":
+	args = _parseArgs(sys.argv[1:])
+	start = args.start or datetime.datetime.now()
+	realStart = time.monotonic()
+	m = simulate(args.conf, start, args.days, args.speed, args.interval)
+	print(
+		"Simulated {} days in {:.1f} seconds".format(
+			args.days, time.monotonic() - realStart
+		)
+	)
+	end = (start + datetime.timedelta(days=args.days)).date()
+	for pumpNr in sorted(m.pumper.pumps):
+		for day, total in m.ledger.getDailyTotals(start.date(), end, pumpNr).items():
+			print(
+				"{} pump {:3d}: {:4d} runs {:8.1f} seconds {:8.2f} liters".format(
+					day, pumpNr, total["runs"], total["seconds"], total["liters"]
+				)
+			)
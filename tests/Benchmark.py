@@ -0,0 +1,338 @@
+"""Benchmarks of the hot paths of the chili watering system.
+
+The benchmarks run without hardware, only test pumps (GPIO = 0) and test
+sensors are used. The results are written as JSON, so the results of two
+commits can be compared.
+
+Example:
+	python -m tests.Benchmark --output benchmark.json
+	python -m tests.Benchmark --quick --only rules,pumper
+"""
+import argparse
+import statistics
+import subprocess
+import threading
+import datetime
+import platform
+import tempfile
+import logging
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+import settings
+import controller
+import persistanceLayer
+import pumper
+import main
+import web.frontend
+from controller.enums import Comparator
+from tests import ConfigGenerator
+
+_COMPARATORS = ["<", "<=", "=", ">=", ">"]
+
+
+def _writeConfDir(basePath: str, controllers: int, rules: int, seed: int = 0):
+	"""Writes a conf dir with one pump and one test sensor per controller."""
+	ConfigGenerator.generate(basePath, controllers, rules, timeShare=0, seed=seed)
+
+
+def _replaceControllers(basePath: str, controllers: int, rules: int, seed: int):
+	"""Replaces only the controller files of a conf dir by ones with other rules."""
+	tempDir = tempfile.mkdtemp(prefix="chilwater_benchmark_")
+	try:
+		_writeConfDir(tempDir, controllers, rules, seed)
+		for entry in os.scandir(os.path.join(tempDir, "controllers")):
+			shutil.copy(entry.path, os.path.join(basePath, "controllers", entry.name))
+	finally:
+		shutil.rmtree(tempDir, ignore_errors=True)
+
+
+def _summarize(name: str, params: dict, samples: list, operations: int = 1) -> dict:
+	"""Builds a result from the durations (seconds) of the repetitions."""
+	best = min(samples)
+	return {
+		"name": name,
+		"params": params,
+		"repeat": len(samples),
+		"operations": operations,
+		"min": best,
+		"median": statistics.median(samples),
+		"max": max(samples),
+		"operationsPerSecond": operations / best if best else None,
+	}
+
+
+def benchRules(sizes: list, repeat: int, evaluations: int) -> list:
+	"""Rule evaluation throughput (CompiledRuleSet and RuleTable) per ruleSet size."""
+	results = []
+	rnd = random.Random(1)
+	start = datetime.datetime(2021, 3, 1)
+	times = [
+		start + datetime.timedelta(seconds=i * 7 * 86400 / evaluations)
+		for i in range(evaluations)
+	]
+	values = [rnd.uniform(0, 100) for _ in range(evaluations)]
+	for size in sizes:
+		rules = []
+		for r in range(size):
+			timeFrom = rnd.randint(0, 23 * 3600)
+			timeTo = min(86399, timeFrom + rnd.randint(60, 3 * 3600))
+			rules.append(
+				controller.MeasureRule(
+					"Rule%d" % r,
+					datetime.time(*divmod(timeFrom // 60, 60), timeFrom % 60),
+					datetime.time(*divmod(timeTo // 60, 60), timeTo % 60),
+					Comparator.fromString(rnd.choice(_COMPARATORS)),
+					rnd.randint(0, 100),
+					rnd.randint(1, 30),
+				)
+			)
+		for name, ruleSetClass in (
+			("rules", controller.ruling.CompiledRuleSet),
+			("rules.table", controller.ruling.RuleTable),
+		):
+			compileSamples = []
+			evaluateSamples = []
+			for _ in range(repeat):
+				for rule in rules:
+					rule.lastRun = None
+				t = time.perf_counter()
+				ruleSet = ruleSetClass(rules)
+				compileSamples.append(time.perf_counter() - t)
+				t = time.perf_counter()
+				for now, value in zip(times, values):
+					ruleSet.evaluate(now, value)
+				evaluateSamples.append(time.perf_counter() - t)
+			params = {"rules": size}
+			results.append(_summarize(name + ".compile", params, compileSamples))
+			results.append(
+				_summarize(name + ".evaluate", params, evaluateSamples, evaluations)
+			)
+	return results
+
+
+def benchPumper(threadCounts: list, repeat: int, orders: int) -> list:
+	"""Throughput of Pumper.pump() with many ordering controller threads."""
+	results = []
+	for threadCount in threadCounts:
+		samples = []
+		for _ in range(repeat):
+			p = pumper.Pumper()
+			for nr in range(1, threadCount + 1):
+				p.addPump(nr, 0)
+			pumperThread = threading.Thread(target=p.run, name="pumper")
+			pumperThread.start()
+			barrier = threading.Barrier(threadCount + 1)
+
+			def order(pumpNr):
+				barrier.wait()
+				for _ in range(orders // threadCount):
+					p.pump(pumpNr, 0.001, pumpNr, "benchmark")
+
+			threads = [
+				threading.Thread(target=order, args=(nr,))
+				for nr in range(1, threadCount + 1)
+			]
+			for t in threads:
+				t.start()
+			barrier.wait()
+			t0 = time.perf_counter()
+			for t in threads:
+				t.join()
+			# Until the pumper thread has applied all orders.
+			while not p._orders.empty():
+				time.sleep(0.0005)
+			samples.append(time.perf_counter() - t0)
+			p.stop()
+			pumperThread.join()
+		results.append(
+			_summarize(
+				"pumper.pump",
+				{"threads": threadCount},
+				samples,
+				orders // threadCount * threadCount,
+			)
+		)
+	return results
+
+
+def benchLoadControllers(counts: list, repeat: int, rules: int) -> list:
+	"""Time of loadControllers() and readAllConfs() against the conf dir size."""
+	results = []
+	for count in counts:
+		coldSamples = []
+		warmSamples = []
+		snapshotSamples = []
+		for _ in range(repeat):
+			basePath = tempfile.mkdtemp(prefix="chilwater_benchmark_")
+			try:
+				_writeConfDir(basePath, count, rules)
+				p = pumper.Pumper()
+				sensors = persistanceLayer.loadSensors(basePath)
+				t = time.perf_counter()
+				persistanceLayer.loadControllers(basePath, p, sensors)
+				coldSamples.append(time.perf_counter() - t)
+				t = time.perf_counter()
+				persistanceLayer.loadControllers(basePath, p, sensors)
+				warmSamples.append(time.perf_counter() - t)
+
+				snapshot = os.path.join(basePath, "conf.snapshot")
+				persistanceLayer.readAllConfs(basePath, 0, snapshot)
+				t = time.perf_counter()
+				persistanceLayer.readAllConfs(basePath, 0, snapshot)
+				snapshotSamples.append(time.perf_counter() - t)
+			finally:
+				shutil.rmtree(basePath, ignore_errors=True)
+		params = {"controllers": count, "rules": rules}
+		for name, samples in (
+			("persistance.loadControllers.cold", coldSamples),
+			("persistance.loadControllers.warm", warmSamples),
+			("persistance.readAllConfs.snapshot", snapshotSamples),
+		):
+			results.append(_summarize(name, params, samples))
+	return results
+
+
+class _RunningSystem:
+	"""Runs a whole system (Main) on a generated conf dir."""
+
+	def __init__(self, controllers: int, rules: int):
+		self.basePath = tempfile.mkdtemp(prefix="chilwater_benchmark_")
+		_writeConfDir(self.basePath, controllers, rules)
+		self._settings = {
+			name: getattr(settings, name)
+			for name in ("TESTFILE", "SNAPSHOTFILE", "HISTORYDIR", "LEDGERFILE")
+		}
+		settings.TESTFILE = os.path.join(self.basePath, "testSetting.conf")
+		settings.SNAPSHOTFILE = None
+		settings.HISTORYDIR = os.path.join(self.basePath, "history")
+		settings.LEDGERFILE = os.path.join(self.basePath, "pumps.ledger")
+		self.main = main.Main(self.basePath)
+		# Uses the server.conf and the web dir of settings.BASECONFDIR.
+		self.frontend = web.frontend.Frontend(self.main)
+		self._thread = threading.Thread(target=self.main.run, name="main")
+
+	def __enter__(self):
+		self._thread.start()
+		while not self.main._running:
+			time.sleep(0.01)
+		return self
+
+	def __exit__(self, *args):
+		self.main.requestStop()
+		self._thread.join()
+		self.frontend._statusBoard.close()
+		for name, value in self._settings.items():
+			setattr(settings, name, value)
+		shutil.rmtree(self.basePath, ignore_errors=True)
+
+
+def benchSystem(counts: list, repeat: int, rules: int) -> list:
+	"""Latency of Frontend.index() and Main.reload() against the controller count."""
+	results = []
+	for count in counts:
+		params = {"controllers": count, "rules": rules}
+		with _RunningSystem(count, rules) as system:
+			samples = []
+			for _ in range(repeat):
+				t = time.perf_counter()
+				system.frontend.index()
+				samples.append(time.perf_counter() - t)
+			results.append(_summarize("frontend.index", params, samples))
+
+			samples = []
+			for _ in range(repeat):
+				t = time.perf_counter()
+				system.frontend.index("1")
+				samples.append(time.perf_counter() - t)
+			results.append(_summarize("frontend.index.rules", params, samples))
+
+			samples = []
+			for _ in range(repeat):
+				t = time.perf_counter()
+				system.main.reload()
+				samples.append(time.perf_counter() - t)
+			results.append(_summarize("main.reload.unchanged", params, samples))
+
+			samples = []
+			for i in range(repeat):
+				# Changes the rules of all controllers, the controllers keep running.
+				_replaceControllers(system.basePath, count, rules, i + 1)
+				t = time.perf_counter()
+				system.main.reload()
+				samples.append(time.perf_counter() - t)
+			results.append(_summarize("main.reload.rules", params, samples))
+	return results
+
+
+def _getCommit() -> str:
+	try:
+		return subprocess.run(
+			["git", "rev-parse", "HEAD"],
+			capture_output=True,
+			text=True,
+			check=True,
+			cwd=os.path.dirname(os.path.abspath(__file__)),
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def run(only: list = None, quick: bool = False) -> dict:
+	"""Runs the benchmarks.
+
+	Args:
+		only : Optional, names of the benchmarks to run (rules, pumper,
+			persistance, system).
+		quick : Uses small sizes and few repetitions (i.E. for a smoke test).
+
+	Returns:
+		A dict with the environment and a list of results.
+	"""
+	repeat = 2 if quick else 5
+	benchmarks = {
+		"rules": lambda: benchRules(
+			[1, 10] if quick else [1, 10, 100, 1000], repeat, 2000 if quick else 20000
+		),
+		"pumper": lambda: benchPumper(
+			[1, 4] if quick else [1, 4, 16, 64], repeat, 400 if quick else 20000
+		),
+		"persistance": lambda: benchLoadControllers(
+			[5] if quick else [10, 100, 500], repeat, 5
+		),
+		"system": lambda: benchSystem([5] if quick else [10, 50, 200], repeat, 5),
+	}
+	results = []
+	for name, benchmark in benchmarks.items():
+		if not only or name in only:
+			results.extend(benchmark())
+	return {
+		"commit": _getCommit(),
+		"time": datetime.datetime.now().isoformat(timespec="seconds"),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"quick": quick,
+		"results": results,
+	}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+	parser.add_argument("--only", default=None, help="comma separated benchmark names")
+	parser.add_argument("--quick", action="store_true", help="small sizes only")
+	args = parser.parse_args()
+
+	# The test pumps and the pump orders log every action.
+	logging.disable(logging.INFO)
+	report = run(args.only.split(",") if args.only else None, args.quick)
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump(report, f, indent=2)
+	else:
+		json.dump(report, sys.stdout, indent=2)
+		print()
@@ -0,0 +1,228 @@
+"""Generates the conf dir of a large synthetic installation for scale tests.
+
+Only test pumps (GPIO = 0) and test sensors (types 11 - 13) are written, the
+sensor values are written into the testSetting.conf of the conf dir. Most
+rules water in the morning or in the evening, like hand-written rules do.
+
+Example:
+	python -m tests.ConfigGenerator /tmp/bigconf --controllers 1000 --rules 10
+"""
+import argparse
+import random
+import shutil
+import sys
+import os
+
+# Controller type -> (test sensor type, range of the values, comparators)
+_MEASURETYPES = {
+	1: (11, (5, 40), (">", ">=")),
+	2: (12, (10, 90), ("<", "<=")),
+	3: (13, (0, 1000), (">", ">=", "=")),
+}
+_TIMETYPE = 4
+
+# Centers (seconds of the day) of the watering windows and their weights.
+_WINDOWCENTERS = ((7 * 3600, 4), (19 * 3600, 4), (13 * 3600, 1))
+
+DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+
+def _getRuleCount(rnd: random.Random, mean: int, distribution: str) -> int:
+	"""Gets the number of rules of a controller."""
+	if distribution == "uniform":
+		return rnd.randint(0, 2 * mean)
+	if distribution == "exponential":
+		return min(20 * mean, int(rnd.expovariate(1 / mean))) if mean else 0
+	return mean
+
+
+def _getWindow(rnd: random.Random) -> tuple:
+	"""Gets a random time window (seconds of the day, both inclusive)."""
+	if rnd.random() < 0.2:
+		start = rnd.randint(0, 86399 - 60)
+	else:
+		centers = [c for c, _ in _WINDOWCENTERS]
+		weights = [w for _, w in _WINDOWCENTERS]
+		center = rnd.choices(centers, weights)[0]
+		start = int(min(86399 - 60, max(0, rnd.gauss(center, 3600))))
+	return start, min(86399, start + rnd.randint(60, 2 * 3600))
+
+
+def _formatSeconds(seconds: int) -> str:
+	return "{:02d}:{:02d}:{:02d}".format(
+		seconds // 3600, seconds // 60 % 60, seconds % 60
+	)
+
+
+def _formatDaily(rnd: random.Random, low: float, high: float) -> str:
+	"""Gets a daily value curve for the [Sequences] of the testSetting.conf."""
+	points = []
+	for hour in range(0, 24, 3):
+		# Highest values in the early afternoon.
+		factor = 1 - abs(hour - 14) / 14
+		value = low + (high - low) * factor + rnd.uniform(-0.1, 0.1) * (high - low)
+		points.append("{:02d}:00 {:.1f}".format(hour, value))
+	return ", ".join(points)
+
+
+def generate(
+	basePath: str,
+	controllers: int,
+	rules: int,
+	pumps: int = None,
+	sensors: int = None,
+	distribution: str = "fixed",
+	timeShare: float = 0.1,
+	sequenceShare: float = 0.0,
+	seed: int = 0,
+) -> dict:
+	"""Writes a conf dir (the sub dirs pumps, sensors and controllers).
+
+	Existing sub dirs are replaced.
+
+	Args:
+		basePath : The conf dir, it is created if needed.
+		controllers : Number of controllers.
+		rules : Mean number of rules per controller.
+		pumps : Number of pumps (default: one per controller), the controllers
+			are spread over the pumps.
+		sensors : Number of sensors (default: one per measuring controller).
+		distribution : Distribution of the rules per controller (see
+			DISTRIBUTIONS).
+		timeShare : Share of the TimeControllers (no sensor).
+		sequenceShare : Share of the sensors with a daily value curve instead
+			of a fixed value.
+		seed : Seed of the random generator, the same arguments always
+			generate the same files.
+
+	Returns:
+		A dict with the number of controllers, pumps, sensors and rules.
+	"""
+	if distribution not in DISTRIBUTIONS:
+		raise ValueError("Unknown distribution: " + distribution)
+	rnd = random.Random(seed)
+	pumps = pumps or controllers
+	for subDir in ("pumps", "sensors", "controllers"):
+		shutil.rmtree(os.path.join(basePath, subDir), ignore_errors=True)
+		os.makedirs(os.path.join(basePath, subDir))
+
+	# Controllers: type and sensor of each one
+	types = [
+		_TIMETYPE if rnd.random() < timeShare else rnd.choice(list(_MEASURETYPES))
+		for _ in range(controllers)
+	]
+	measuring = [nr for nr, t in enumerate(types, 1) if t != _TIMETYPE]
+	sensors = max(1, sensors or len(measuring)) if measuring else 0
+
+	# Sensors: the type of each sensor is the type of its first controller
+	sensorTypes = {}
+	controllerSensors = {}
+	for i, nr in enumerate(measuring):
+		sensorNr = i % sensors + 1
+		sensorTypes.setdefault(sensorNr, types[nr - 1])
+		# A controller must use a sensor of its type.
+		types[nr - 1] = sensorTypes[sensorNr]
+		controllerSensors[nr] = sensorNr
+
+	# Pumps, 100 per file
+	for first in range(1, pumps + 1, 100):
+		with open(os.path.join(basePath, "pumps", "%d.conf" % first), "w") as f:
+			for nr in range(first, min(pumps, first + 99) + 1):
+				f.write("[Pump {0}]\nNr = {0}\nGPIO = 0\n".format(nr))
+				f.write("FlowRate = {:.1f}\n\n".format(rnd.uniform(0.5, 3)))
+
+	# Sensors, 100 per file, and their values
+	values = []
+	sequences = []
+	for first in range(1, sensors + 1, 100):
+		with open(os.path.join(basePath, "sensors", "%d.conf" % first), "w") as f:
+			for nr in range(first, min(sensors, first + 99) + 1):
+				sensorType, (low, high), _ = _MEASURETYPES[sensorTypes[nr]]
+				channel = "bench%d" % nr
+				f.write("[Sensor {0}]\nNr = {0}\nType = {1}\n".format(nr, sensorType))
+				f.write("Channel = {}\n".format(channel))
+				f.write("Interval = {}\n\n".format(rnd.choice((1, 5, 10, 60))))
+				values.append("{} = {:.1f}".format(channel, rnd.uniform(low, high)))
+				if rnd.random() < sequenceShare:
+					sequences.append(
+						"{} = {}".format(channel, _formatDaily(rnd, low, high))
+					)
+	with open(os.path.join(basePath, "testSetting.conf"), "w") as f:
+		f.write("[Sensors]\n" + "".join(v + "\n" for v in values))
+		f.write("\n[Sequences]\n" + "".join(s + "\n" for s in sequences))
+
+	# Controllers, one file each
+	ruleCount = 0
+	for nr, controllerType in enumerate(types, 1):
+		lines = ["[DEFAULT]", "Type = %d" % controllerType, "Nr = %d" % nr]
+		lines.append("PumpNr = %d" % ((nr - 1) % pumps + 1))
+		if nr in controllerSensors:
+			lines.append("SensorNr = %d" % controllerSensors[nr])
+			lines.append("Deadband = %d" % rnd.choice((0, 0, 1, 2)))
+		lines.append("")
+		for r in range(_getRuleCount(rnd, rules, distribution)):
+			start, end = _getWindow(rnd)
+			lines += [
+				"[Rule%d]" % r,
+				"TimeFrom = %s" % _formatSeconds(start),
+				"TimeTo = %s" % _formatSeconds(end),
+			]
+			if controllerType != _TIMETYPE:
+				_, (low, high), comparators = _MEASURETYPES[controllerType]
+				lines.append("Comparator = %s" % rnd.choice(comparators))
+				lines.append("RightValue = %d" % rnd.uniform(low, high))
+			lines += ["PumpSeconds = %d" % rnd.randint(5, 120), ""]
+			ruleCount += 1
+		with open(os.path.join(basePath, "controllers", "%d.conf" % nr), "w") as f:
+			f.write("\n".join(lines))
+
+	return {
+		"controllers": controllers,
+		"pumps": pumps,
+		"sensors": sensors,
+		"rules": ruleCount,
+	}
+
+
+def _parseArgs(args: list):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("conf", help="conf dir which is written")
+	parser.add_argument("--controllers", type=int, default=100)
+	parser.add_argument(
+		"--rules", type=int, default=10, help="mean number of rules per controller"
+	)
+	parser.add_argument("--pumps", type=int, default=None, help="default: controllers")
+	parser.add_argument(
+		"--sensors", type=int, default=None, help="default: one per controller"
+	)
+	parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="fixed")
+	parser.add_argument(
+		"--time-share", type=float, default=0.1, help="share of TimeControllers"
+	)
+	parser.add_argument(
+		"--sequence-share",
+		type=float,
+		default=0.0,
+		help="share of the sensors with a daily value curve",
+	)
+	parser.add_argument("--seed", type=int, default=0)
+	return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+	args = _parseArgs(sys.argv[1:])
+	counts = generate(
+		args.conf,
+		args.controllers,
+		args.rules,
+		args.pumps,
+		args.sensors,
+		args.distribution,
+		args.time_share,
+		args.sequence_share,
+		args.seed,
+	)
+	print(
+		"{controllers} controllers, {pumps} pumps, {sensors} sensors and {rules} "
+		"rules written".format(**counts)
+	)
@@ -0,0 +1,196 @@
+"""Starts the system against a conf dir and records its resource usage.
+
+The system runs in a child process (the backend only, without the web
+server, unless --web is given). The harness records the startup time and
+samples the RSS, the number of threads and the CPU usage of the child on
+every tick (Linux only, the values are read from /proc). The results are
+written as JSON.
+
+Example:
+	python -m tests.ConfigGenerator /tmp/bigconf --controllers 1000 --rules 10
+	python -m tests.LoadHarness /tmp/bigconf --duration 60 --output load.json
+"""
+import argparse
+import subprocess
+import statistics
+import datetime
+import tempfile
+import signal
+import shutil
+import json
+import time
+import sys
+import os
+
+_READY = "READY"
+
+
+def _runChild(basePath: str, speed: float, withWeb: bool):
+	"""Runs the system in the child process until SIGTERM is received."""
+	import threading
+	import settings
+	import clock
+	import main
+
+	workDir = tempfile.mkdtemp(prefix="chilwater_load_")
+	settings.TESTFILE = os.path.join(basePath, "testSetting.conf")
+	settings.SNAPSHOTFILE = os.path.join(workDir, "conf.snapshot")
+	settings.HISTORYDIR = os.path.join(workDir, "history")
+	settings.LEDGERFILE = os.path.join(workDir, "pumps.ledger")
+	if speed != 1:
+		clock.setClock(clock.VirtualClock(speed=speed))
+
+	m = main.Main(basePath)
+	frontend = None
+	if withWeb:
+		import web.frontend
+
+		frontend = web.frontend.Frontend(m)
+		threading.Thread(target=frontend.run, name="web_frontend", daemon=True).start()
+
+	start = time.perf_counter()
+	reported = []
+
+	def ready():
+		# Only the startup is reported, not the later reloads.
+		if not reported:
+			reported.append(True)
+			print(_READY, time.perf_counter() - start, flush=True)
+
+	m.addReloadListener(ready)
+	try:
+		m.run()
+	finally:
+		if frontend:
+			frontend.stop()
+		shutil.rmtree(workDir, ignore_errors=True)
+
+
+def _readProc(pid: int) -> tuple:
+	"""Gets (RSS in bytes, number of threads, CPU seconds) of a process."""
+	rss = threads = None
+	with open("/proc/%d/status" % pid) as f:
+		for line in f:
+			if line.startswith("VmRSS:"):
+				rss = int(line.split()[1]) * 1024
+			elif line.startswith("Threads:"):
+				threads = int(line.split()[1])
+	with open("/proc/%d/stat" % pid) as f:
+		# The command may contain spaces, the fields start after the ")".
+		fields = f.read().rsplit(")", 1)[1].split()
+	cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+	return rss, threads, cpu
+
+
+def measure(
+	basePath: str,
+	duration: float,
+	tick: float = 1,
+	speed: float = 1,
+	withWeb: bool = False,
+) -> dict:
+	"""Starts the system in a child process and samples its resource usage.
+
+	Args:
+		basePath : The conf dir (i.E. written by tests.ConfigGenerator).
+		duration : Seconds which are sampled after the startup.
+		tick : Seconds between two samples.
+		speed : Speed of the virtual clock of the child (1 = real time).
+		withWeb : Also starts the web frontend.
+
+	Returns:
+		A dict with the startup and shutdown times, the samples and a summary.
+	"""
+	basePath = os.path.abspath(basePath)
+	args = [sys.executable, "-m", "tests.LoadHarness", basePath, "--child"]
+	args += ["--speed", str(speed)] + (["--web"] if withWeb else [])
+	cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	spawned = time.perf_counter()
+	child = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, text=True)
+	try:
+		# The first reload notification is sent when the system is running.
+		for line in child.stdout:
+			if line.startswith(_READY):
+				break
+		else:
+			raise RuntimeError("The system exited during the startup")
+		startup = time.perf_counter() - spawned
+		mainStartup = float(line.split()[1])
+
+		samples = []
+		last = _readProc(child.pid)
+		lastTime = time.perf_counter()
+		end = lastTime + duration
+		while time.perf_counter() < end and child.poll() is None:
+			time.sleep(tick)
+			now = time.perf_counter()
+			rss, threads, cpu = _readProc(child.pid)
+			samples.append(
+				{
+					"time": now - spawned,
+					"rss": rss,
+					"threads": threads,
+					# Share of one CPU core during the tick.
+					"cpu": (cpu - last[2]) / (now - lastTime),
+				}
+			)
+			last, lastTime = (rss, threads, cpu), now
+
+		stopped = time.perf_counter()
+		child.send_signal(signal.SIGTERM)
+		child.wait()
+		shutdown = time.perf_counter() - stopped
+	finally:
+		if child.poll() is None:
+			child.kill()
+			child.wait()
+
+	summary = {}
+	if samples:
+		for key in ("rss", "threads", "cpu"):
+			values = [s[key] for s in samples]
+			summary[key] = {
+				"mean": statistics.mean(values),
+				"max": max(values),
+			}
+	return {
+		"conf": basePath,
+		"time": datetime.datetime.now().isoformat(timespec="seconds"),
+		"speed": speed,
+		"web": withWeb,
+		"startup": startup,
+		"mainStartup": mainStartup,
+		"shutdown": shutdown,
+		"tick": tick,
+		"samples": samples,
+		"summary": summary,
+	}
+
+
+def _parseArgs(args: list):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("conf", help="conf dir")
+	parser.add_argument("--duration", type=float, default=60, help="sampled seconds")
+	parser.add_argument("--tick", type=float, default=1, help="seconds per sample")
+	parser.add_argument(
+		"--speed", type=float, default=1, help="speed of the virtual clock"
+	)
+	parser.add_argument("--web", action="store_true", help="start the web frontend")
+	parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+	parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+	return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+	args = _parseArgs(sys.argv[1:])
+	if args.child:
+		_runChild(args.conf, args.speed, args.web)
+		sys.exit(0)
+
+	report = measure(args.conf, args.duration, args.tick, args.speed, args.web)
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump(report, f, indent=2)
+	else:
+		json.dump(report, sys.stdout, indent=2)
+		print()
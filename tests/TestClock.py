@@ -0,0 +1,89 @@
+"""Provides tests for the clock module and its use by the loops."""
+import unittest
+import threading
+import datetime
+import time
+import settings
+import clock
+import controller
+import pumper
+
+
+class _FailingPumper:
+	"""Records the pump orders, the first order fails like an unknown pump."""
+
+	def __init__(self):
+		self.orders = []
+
+	def pump(self, pumpNr, seconds, controllerNr=None, ruleName=None):
+		self.orders.append(ruleName)
+		if len(self.orders) == 1:
+			raise KeyError(pumpNr)
+		return seconds
+
+
+class TestVirtualClock(unittest.TestCase):
+	"""Provides tests for the VirtualClock class."""
+
+	def setUp(self):
+		self.clock = clock.VirtualClock(datetime.datetime(2021, 3, 1, 9, 59, 50), 1000)
+		clock.setClock(self.clock)
+
+	def tearDown(self):
+		clock.setClock(clock.SystemClock())
+
+	def testSpeed(self):
+		"""Checks if the virtual time passes faster."""
+		event = threading.Event()
+		start = time.monotonic()
+		self.clock.wait(event, 100)
+		self.assertLess(time.monotonic() - start, 1, "Timeout was not shortened")
+		self.assertGreaterEqual(
+			self.clock.now(), datetime.datetime(2021, 3, 1, 10, 1, 30)
+		)
+
+	def testController(self):
+		"""Checks if a controller and the pumper follow the virtual clock."""
+		p = pumper.Pumper()
+		p.addPump(1, "0")
+		c = controller.createController(controller.Type.TIME, p, 1)
+		c.addRule(
+			controller.TimeRule("r", datetime.time(10), datetime.time(10, 0, 10), 60)
+		)
+		threads = [threading.Thread(target=p.run), threading.Thread(target=c.run)]
+		for t in threads:
+			t.start()
+		try:
+			time.sleep(0.03)
+			self.assertTrue(p.pumps[1].isPumping(), "Pump was not started at 10:00")
+			time.sleep(0.1)
+			self.assertFalse(p.pumps[1].isPumping(), "Pump was not stopped")
+		finally:
+			c.stop()
+			p.stop()
+			for t in threads:
+				t.join()
+
+	def testControllerSurvivesFailedOrder(self):
+		"""Ensures that a failed pump order does not end the controller loop."""
+		p = _FailingPumper()
+		c = controller.createController(controller.Type.TIME, p, 1)
+		c.addRule(controller.TimeRule("a", datetime.time(10), datetime.time(10, 1), 5))
+		c.addRule(
+			controller.TimeRule("b", datetime.time(10, 2), datetime.time(10, 3), 5)
+		)
+		t = threading.Thread(target=c.run)
+		t.start()
+		try:
+			deadline = time.monotonic() + 5
+			while len(p.orders) < 2 and time.monotonic() < deadline:
+				time.sleep(0.01)
+			self.assertEqual(p.orders, ["a", "b"])
+			self.assertTrue(t.is_alive(), "Controller loop has ended")
+		finally:
+			c.stop()
+			t.join()
+
+
+if __name__ == "__main__":
+	unittest.main()
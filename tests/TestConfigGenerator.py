@@ -0,0 +1,42 @@
+"""Provides tests for the synthetic conf dirs of tests.ConfigGenerator."""
+import unittest
+import tempfile
+import os
+import settings
+import persistanceLayer
+import sensor
+from tests import ConfigGenerator
+
+
+class TestConfigGenerator(unittest.TestCase):
+	"""Checks if generated conf dirs can be loaded."""
+
+	def testGenerate(self):
+		"""Checks the counts and the consistency of a generated conf dir."""
+		with tempfile.TemporaryDirectory() as basePath:
+			counts = ConfigGenerator.generate(
+				basePath, 40, 5, pumps=10, sensors=8, distribution="uniform"
+			)
+			confs = persistanceLayer.readAllConfs(basePath)
+			self.assertEqual(len(confs["controllers"]), 40)
+			self.assertEqual(len(confs["pumps"]), 10)
+			self.assertEqual(len(confs["sensors"]), counts["sensors"])
+			self.assertEqual(
+				sum(len(c["rules"]) for c in confs["controllers"].values()),
+				counts["rules"],
+			)
+			for c in confs["controllers"].values():
+				self.assertIn(c["pumpNr"], confs["pumps"])
+				if c["sensorNr"]:
+					self.assertIn(c["sensorNr"], confs["sensors"])
+
+			# Every test sensor has a value.
+			values = sensor.TestValueProvider(
+				os.path.join(basePath, "testSetting.conf")
+			)
+			for conf in confs["sensors"].values():
+				self.assertIsInstance(values.getValue(conf["channel"]), float)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,36 +1,44 @@
-"""Provides tests for the pumper and sensor packages."""
+"""Provides tests for the pumper and sensor packages on the real hardware.
+
+The tests are skipped if the SPI device or the 1-Wire bus does not exist
+(i.E. if the tests are run on a development machine).
+"""
+import unittest
+import threading
+import os
 from time import sleep
 
+import settings
 import pumper
 import sensor
-from pumper.Pumper import Pumper
 from sensor import Type
 
+_TEMPSENSOR = "/sys/bus/w1/devices/28-3c01b556cc3d/w1_slave"
+
 
+@unittest.skipUnless(os.path.exists("/dev/spidev0.0"), "No SPI device")
 class TestHardware(unittest.TestCase):
 	"""Provides tests for the Hardware related classes."""
 
-	def setUp(self):
-		self.p = Pumper()
-
 	def testHumSensor(self):
 		"""Test reading of the humidity sensors."""
 		sensors = []
 		for i in range(1, 5):
-			sensors[i] = sensor.createSensor(i, Type.HUMIDITY, str(i))
+			sensors.append(sensor.createSensor(i, Type.HUMIDITY, str(i)))
 		for s in sensors:
-			print("Hum sensor channel: " + s.channel + ", read value is" + s.getValue())
+			print(
+				"Hum sensor channel: " + s.channel + ", read value is " + str(s.sample())
+			)
 
+	@unittest.skipUnless(os.path.exists(_TEMPSENSOR), "No 1-Wire temperature sensor")
 	def testTempSensor(self):
 		"""Test reading of the temperature sensor."""
-		temp = sensor.createSensor(
-			8, Type.TEMPERATURE, "/sys/bus/w1/devices/28-3c01b556cc3d/w1_slave"
-		)
+		temp = sensor.createSensor(8, Type.TEMPERATURE, _TEMPSENSOR)
 		print(
 			"Temperature sensor channel: "
 			+ temp.channel
-			+ ", read value is"
-			+ temp.getValue()
+			+ ", read value is "
+			+ str(temp.sample())
 		)
 
 	def testLightSensor(self):
@@ -39,8 +47,8 @@ class TestHardware(unittest.TestCase):
 		print(
 			"Light sensor channel: "
 			+ light.channel
-			+ ", read value is"
-			+ light.getValue()
+			+ ", read value is "
+			+ str(light.sample())
 		)
 
 	def testPump(self):
@@ -51,6 +59,17 @@ class TestHardware(unittest.TestCase):
 		pumps.addPump(3, 21)
 		pumps.addPump(4, 26)
 
-		for p in range(1, 5):
-			pumps.pump(p, 10)
-			sleep(10)
\ No newline at end of file
+		# The orders are only executed by the pumper thread.
+		t = threading.Thread(target=pumps.run, args=(), name="pumper")
+		t.start()
+		try:
+			for p in range(1, 5):
+				pumps.pump(p, 10)
+				sleep(10)
+		finally:
+			pumps.stop()
+			t.join()
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,105 @@
+"""Provides tests for the Ledger class of the pumper package."""
+import unittest
+import threading
+import datetime
+import tempfile
+import shutil
+import time
+import os
+import settings
+import pumper
+
+
+class TestLedger(unittest.TestCase):
+	"""Provides tests for the Ledger class."""
+
+	def setUp(self):
+		self.basePath = tempfile.mkdtemp()
+		self.path = os.path.join(self.basePath, "pumps.ledger")
+		self.ledger = pumper.Ledger(self.path)
+		self.day = datetime.date(2021, 3, 1)
+		self.start = datetime.datetime(2021, 3, 1, 10)
+
+	def tearDown(self):
+		shutil.rmtree(self.basePath)
+
+	def testQueries(self):
+		"""Checks the totals per pump, controller and rule."""
+		self.ledger.add(1, self.start, [(1, "a", 10), (2, "b", 5)], 6)
+		self.ledger.add(1, self.start.replace(day=2), [(1, "a", 20)], 6)
+		self.ledger.add(2, self.start, [(None, None, 3)])
+		self.ledger.flush()
+
+		total = self.ledger.query(self.day, self.day, pumpNr=1)
+		self.assertEqual(
+			total, {"runs": 1, "orders": 2, "seconds": 15, "liters": 1.5}
+		)
+		self.assertEqual(
+			self.ledger.query(self.day, self.day, ruleName="b")["seconds"], 5
+		)
+		days = self.ledger.getDailyTotals(
+			self.day, self.day.replace(day=9), controllerNr=1
+		)
+		self.assertEqual([d["seconds"] for d in days.values()], [10, 20])
+		self.assertEqual(self.ledger.query(self.day, self.day, pumpNr=2)["runs"], 1)
+		start = time.perf_counter()
+		days = self.ledger.getDailyTotals(datetime.date.min, datetime.date.max)
+		self.assertLess(time.perf_counter() - start, 0.1, "All days were visited")
+		self.assertEqual(list(days), [self.day, self.day.replace(day=2)])
+
+	def testReload(self):
+		"""Ensures that records written after the aggregates are not lost."""
+		aggregates = self.path + ".agg"
+		self.ledger.add(1, self.start, [(1, "a", 10)])
+		self.ledger.flush()
+		self.ledger.add(1, self.start.replace(day=2), [(1, "a", 20)])
+		self.ledger.flush()
+		# Without the offset, the records of saved days must not count twice.
+		os.remove(os.path.join(aggregates, "offset"))
+		ledger = pumper.Ledger(self.path)
+		self.assertEqual(ledger.query(self.day, self.day)["seconds"], 10)
+
+		# A lost day is rebuilt from the records.
+		os.remove(os.path.join(aggregates, str(self.day.toordinal())))
+		with open(os.path.join(aggregates, "offset"), "wb") as f:
+			f.write(b"broken")
+		ledger = pumper.Ledger(self.path)
+		self.assertEqual(ledger.query(self.day, self.day)["seconds"], 10)
+		self.assertEqual(
+			ledger.query(self.day, self.day.replace(day=2))["seconds"], 30
+		)
+
+	def testInvalidRecord(self):
+		"""Ensures that a record which cannot be packed does not stop the ledger."""
+		self.ledger.add(1, self.start, [(40000, "a", 10)])
+		self.ledger.add(1, self.start, [(2 ** 40, "b", 5)])
+		self.ledger.flush()
+		self.assertEqual(
+			self.ledger.query(self.day, self.day, controllerNr=40000)["seconds"], 10
+		)
+		ledger = pumper.Ledger(self.path)
+		self.assertEqual(ledger.query(self.day, self.day)["seconds"], 10)
+
+	def testPumperRecordsRuns(self):
+		"""Checks if a finished run is recorded with its orders."""
+		p = pumper.Pumper(self.ledger)
+		p.addPump(3, 0, 60)
+		t = threading.Thread(target=p.run, args=())
+		t.start()
+		try:
+			p.pump(3, 0.1, 7, "rule")
+			p.pump(3, 0.1)
+			time.sleep(0.4)
+		finally:
+			p.stop()
+			t.join()
+		self.ledger.flush()
+		today = datetime.date.today()
+		total = self.ledger.query(today, today, controllerNr=7)
+		self.assertEqual((total["runs"], total["orders"]), (1, 1))
+		self.assertAlmostEqual(total["liters"], 0.1, 2)
+		self.assertEqual(self.ledger.query(today, today, pumpNr=3)["orders"], 2)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,45 @@
+"""Provides tests for the logTail module."""
+import unittest
+import logging
+import tempfile
+import os
+import settings
+import logTail
+
+
+class TestLogTail(unittest.TestCase):
+	"""Provides tests for the LogTail handler and tailFile()."""
+
+	def testTailFile(self):
+		"""Compares tailFile() with readlines() for several block sizes."""
+		with tempfile.NamedTemporaryFile("w", delete=False) as f:
+			for i in range(1000):
+				f.write("line " + str(i) * (i % 7) + "\n")
+		try:
+			with open(f.name) as r:
+				expected = [l.rstrip("\n") for l in r.readlines()]
+			for blockSize in (1, 16, 4096):
+				for count in (0, 1, 50, 2000):
+					self.assertEqual(
+						logTail.tailFile(f.name, count, blockSize),
+						expected[-count:] if count else [],
+					)
+		finally:
+			os.remove(f.name)
+
+	def testHandler(self):
+		"""Checks if the handler keeps only the latest lines."""
+		handler = logTail.LogTail(3)
+		handler.prime(["a", "b"])
+		logger = logging.getLogger("test.logTail")
+		logger.addHandler(handler)
+		try:
+			logger.warning("c\nd")
+		finally:
+			logger.removeHandler(handler)
+		self.assertEqual(handler.getLines(10), ["b", "c", "d"])
+		self.assertEqual(handler.getLines(1), ["d"])
+
+
+if __name__ == "__main__":
+	unittest.main()
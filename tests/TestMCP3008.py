@@ -0,0 +1,87 @@
+"""Provides tests for the lib.adc package with a fake SPI device."""
+import unittest
+import unittest.mock
+import importlib
+import settings
+import lib.adc
+
+_mcpModule = importlib.import_module("lib.adc.MCP3008")
+
+
+class _FakeSpiDev:
+	"""Answers the transfers of a MCP3008 with fixed values per channel."""
+
+	def __init__(self):
+		self.values = {channel: channel * 100 + 50 for channel in range(8)}
+		self.transfers = []
+		self.opened = None
+
+	def open(self, bus, device):
+		self.opened = (bus, device)
+
+	def close(self):
+		self.opened = None
+
+	def xfer2(self, data):
+		self.transfers.append(list(data))
+		value = self.values[(data[1] >> 4) - 8]
+		return [0, value >> 8, value & 0xFF]
+
+
+class TestMCP3008(unittest.TestCase):
+	"""Provides tests for the MCP3008 class and getMCPInterface()."""
+
+	def setUp(self):
+		patcher = unittest.mock.patch.object(_mcpModule, "SpiDev", _FakeSpiDev)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.mcp = lib.adc.MCP3008(0, 1)
+		self.spi = self.mcp._spi
+
+	def _channels(self) -> list:
+		return [(data[1] >> 4) - 8 for data in self.spi.transfers]
+
+	def testRead(self):
+		"""Checks the encoding of the channel and the decoding of the value."""
+		self.assertEqual(self.spi.opened, (0, 1))
+		self.assertEqual(self.mcp.read(7), 750)
+		self.assertEqual(self.spi.transfers, [[1, 0xF0, 0]])
+		self.spi.values[0] = 1023
+		self.assertEqual(self.mcp.read(0), 1023)
+
+	def testReadMany(self):
+		"""Ensures that every channel is read once per call."""
+		values = self.mcp.readMany()
+		self.assertEqual(values, self.spi.values)
+		self.assertEqual(self._channels(), list(range(8)))
+		self.spi.transfers.clear()
+		self.assertEqual(self.mcp.readMany([2, 5]), {2: 250, 5: 550})
+		self.assertEqual(self._channels(), [2, 5])
+
+	def testReadBuffered(self):
+		"""Checks if the channels are only read again after maxAge."""
+		self.assertEqual(self.mcp.readBuffered(3, 10), 350)
+		self.assertEqual(len(self.spi.transfers), 8)
+		self.spi.values[3] = 10
+		self.assertEqual(self.mcp.readBuffered(3, 10), 350)
+		self.assertEqual(self.mcp.readBuffered(4, 10), 450)
+		self.assertEqual(len(self.spi.transfers), 8, "Burst was read again")
+
+		self.mcp._burstTime -= 11
+		self.assertEqual(self.mcp.readBuffered(3, 10), 10)
+		self.assertEqual(len(self.spi.transfers), 16)
+
+	def testGetMCPInterface(self):
+		"""Ensures that one instance is shared per SPI device."""
+		try:
+			mcp = lib.adc.getMCPInterface(90, 0)
+			self.assertIs(lib.adc.getMCPInterface(90, 0), mcp)
+			self.assertIsNot(lib.adc.getMCPInterface(90, 1), mcp)
+			self.assertEqual(mcp._spi.opened, (90, 0))
+		finally:
+			lib.adc.mcpInterfaces.pop((90, 0), None)
+			lib.adc.mcpInterfaces.pop((90, 1), None)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,59 @@
+"""Provides tests for the metrics module."""
+import unittest
+import threading
+import time
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+	"""Provides tests for counters, histograms and the rendering."""
+
+	def testCounter(self):
+		"""Checks if counters with labels are counted separately."""
+		family = metrics.counter("test_counter_total", "Test counter", ("sensor",))
+		family.labels(1).inc()
+		family.labels(1).inc(2)
+		family.labels(2).inc()
+		self.assertIs(
+			metrics.counter("test_counter_total", "Test counter", ("sensor",)), family
+		)
+		text = metrics.render()
+		self.assertIn('test_counter_total{sensor="1"} 3', text)
+		self.assertIn('test_counter_total{sensor="2"} 1', text)
+		with self.assertRaises(ValueError):
+			metrics.histogram("test_counter_total", "Same name, other type")
+
+	def testHistogram(self):
+		"""Checks the buckets, the quantiles and the rendering of a histogram."""
+		family = metrics.histogram("test_histogram_seconds", "Test", (), (1, 2, 5))
+		for value in (0.5, 1, 1.5, 4, 10):
+			family.observe(value)
+		histogram = family.labels()
+		self.assertEqual(histogram.getValues(), (5, 17.0, 10, [2, 1, 1, 1]))
+		self.assertEqual(histogram.getQuantile(0.5), 2)
+		self.assertEqual(histogram.getQuantile(1), 10)
+		text = metrics.render()
+		self.assertIn('test_histogram_seconds_bucket{le="1"} 2\n', text)
+		self.assertIn('test_histogram_seconds_bucket{le="5"} 4\n', text)
+		self.assertIn('test_histogram_seconds_bucket{le="+Inf"} 5\n', text)
+		self.assertIn("test_histogram_seconds_sum 17.0\n", text)
+		self.assertIn("# TYPE test_histogram_seconds histogram\n", text)
+
+	def testTimedLock(self):
+		"""Checks if the wait and hold times of a TimedLock are measured."""
+		lock = metrics.TimedLock("test")
+		with lock:
+			blocked = threading.Thread(target=lambda: lock.acquire() and lock.release())
+			blocked.start()
+			time.sleep(0.05)
+		blocked.join()
+		wait = metrics._LOCKWAIT.labels("test").getValues()
+		hold = metrics._LOCKHOLD.labels("test").getValues()
+		self.assertEqual(wait[0], 2)
+		self.assertGreaterEqual(wait[2], 0.04)
+		self.assertGreaterEqual(hold[2], 0.04)
+		self.assertFalse(lock.locked())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,105 @@
+"""Provides tests for the lib.onewire package with a fake sysfs tree."""
+import unittest
+import tempfile
+import time
+import os
+import settings
+import lib.onewire
+import sensor
+
+_SLAVE = "72 01 4b 46 7f ff 0e 10 57 : crc=57 {}\n72 01 4b 46 7f ff 0e 10 57 t={}\n"
+
+
+class TestOneWireBus(unittest.TestCase):
+	"""Provides tests for the OneWireBus class."""
+
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.baseDir = self.dir.name
+		self.bus = lib.onewire.OneWireBus(self.baseDir, 2)
+
+	def tearDown(self):
+		self.bus.close()
+		self.dir.cleanup()
+
+	def _writeProbe(self, deviceId: str, milliDegrees: int, crc: str = "YES"):
+		os.makedirs(os.path.join(self.baseDir, deviceId), exist_ok=True)
+		path = os.path.join(self.baseDir, deviceId, "w1_slave")
+		with open(path, "w") as f:
+			f.write(_SLAVE.format(crc, milliDegrees))
+		return path
+
+	def testParse(self):
+		"""Checks the parsing of valid and invalid w1_slave contents."""
+		self.assertEqual(lib.onewire.parseSlave(_SLAVE.format("YES", 23125)), 23.125)
+		self.assertEqual(lib.onewire.parseSlave(_SLAVE.format("YES", -1500)), -1.5)
+		self.assertIsNone(lib.onewire.parseSlave(_SLAVE.format("NO", 23125)))
+		self.assertIsNone(lib.onewire.parseSlave(""))
+
+	def testRead(self):
+		"""Checks if all probes are discovered and read in one round."""
+		self._writeProbe("28-000000000001", 21000)
+		self._writeProbe("28-000000000002", 22500)
+		self._writeProbe("28-000000000003", 0, "NO")
+		self.assertEqual(len(self.bus.discover()), 3)
+		self.assertEqual(self.bus.read("28-000000000001", 60), 21)
+		# The second probe was read in the same round.
+		self.assertEqual(self.bus._rounds, 1)
+		self.assertEqual(self.bus.read("28-000000000002", 60), 22.5)
+		self.assertEqual(self.bus._rounds, 1)
+		self.assertIsNone(self.bus.read("28-000000000003", 60))
+		self.assertIsNone(self.bus.read("28-ffffffffffff", 60))
+
+	def testRefresh(self):
+		"""Checks if an old value is served until the next round has finished."""
+		self._writeProbe("28-000000000001", 21000)
+		self.assertEqual(self.bus.read("28-000000000001", 0), 21)
+		self._writeProbe("28-000000000001", 25000)
+		deadline = time.monotonic() + 5
+		while self.bus.read("28-000000000001", 0) != 25:
+			self.assertLess(time.monotonic(), deadline, "Value was not refreshed")
+			time.sleep(0.01)
+
+	def testFailingProbe(self):
+		"""Ensures that the value of a failing probe is not served any more."""
+		self._writeProbe("28-000000000001", 21000)
+		self.assertEqual(self.bus.read("28-000000000001", 0), 21)
+		self._writeProbe("28-000000000001", 25000, "NO")
+		deadline = time.monotonic() + 5
+		while self.bus.read("28-000000000001", 0) is not None:
+			self.assertLess(time.monotonic(), deadline, "Old value is still served")
+			time.sleep(0.01)
+
+		# The error is cached, a read does not wait for the next round.
+		readDevice = self.bus._readDevice
+		self.bus._readDevice = lambda d: time.sleep(0.5) or readDevice(d)
+		start = time.monotonic()
+		self.assertIsNone(self.bus.read("28-000000000001", 0))
+		self.assertLess(time.monotonic() - start, 0.25, "Read waited for a round")
+
+	def testBulkRead(self):
+		"""Checks if a conversion is triggered on bus masters which support it."""
+		os.makedirs(os.path.join(self.baseDir, "w1_bus_master1"))
+		trigger = os.path.join(self.baseDir, "w1_bus_master1", "therm_bulk_read")
+		open(trigger, "w").close()
+		self._writeProbe("28-000000000001", 21000)
+		self.assertEqual(self.bus.read("28-000000000001", 60), 21)
+		with open(trigger) as f:
+			self.assertEqual(f.read(), "trigger\n")
+
+	def testTempSensor(self):
+		"""Checks if a TempSensor reads its probe from the fake tree."""
+		path = self._writeProbe("28-000000000001", 19750)
+		s = sensor.createSensor(1, sensor.Type.TEMPERATURE, path)
+		self.assertEqual(s._measure(), 19.75)
+		oneWireDir = settings.ONEWIREDIR
+		settings.ONEWIREDIR = self.baseDir
+		try:
+			s = sensor.createSensor(2, sensor.Type.TEMPERATURE, "28-000000000001")
+			self.assertEqual(s._measure(), 19.75)
+		finally:
+			settings.ONEWIREDIR = oneWireDir
+
+
+if __name__ == "__main__":
+	unittest.main()
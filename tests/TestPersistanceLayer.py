@@ -0,0 +1,165 @@
+"""Provides tests for the persistanceLayer module."""
+import unittest
+import unittest.mock
+import tempfile
+import shutil
+import os
+import settings
+import persistanceLayer
+
+
+_CONTROLLER = """
+[DEFAULT]
+Type = 4
+Nr = {}
+PumpNr = 1
+
+[Rule1]
+TimeFrom = 10:00:00
+TimeTo = 11:00:00
+PumpSeconds = 2
+"""
+
+_PUMPS = """
+[Pump 1]
+Nr = 1
+GPIO = 4
+
+[Pump 2]
+Nr = 2
+GPIO = 5
+"""
+
+_SENSORS = """
+[Sensor 1]
+Nr = 1
+Type = 12
+Channel = 1
+Interval = 2
+"""
+
+
+class TestPersistanceLayer(unittest.TestCase):
+	"""Provides tests for reading controller configurations."""
+
+	def setUp(self):
+		self.basePath = tempfile.mkdtemp()
+		for subDir in ("controllers", "pumps", "sensors"):
+			os.mkdir(os.path.join(self.basePath, subDir))
+		for nr in range(1, 4):
+			self._write("c" + str(nr), nr)
+
+	def tearDown(self):
+		shutil.rmtree(self.basePath)
+
+	def _write(self, name, nr):
+		path = os.path.join(self.basePath, "controllers", name + ".conf")
+		with open(path, "w") as f:
+			f.write(_CONTROLLER.format(nr))
+		return path
+
+	def testCachedConfig(self):
+		"""Ensures that unchanged files are not parsed again."""
+		path = os.path.join(self.basePath, "controllers", "c1.conf")
+		config = persistanceLayer._configCache.read(path)
+		self.assertIs(persistanceLayer._configCache.read(path), config)
+		with open(path, "a") as f:
+			f.write("\n[Rule2]\n")
+		self.assertIsNot(persistanceLayer._configCache.read(path), config)
+
+	def testControllerIndex(self):
+		"""Checks if controller files are found after they were moved."""
+		self.assertTrue(
+			persistanceLayer._getControllerFile(self.basePath, 2).endswith("c2.conf")
+		)
+		os.remove(os.path.join(self.basePath, "controllers", "c2.conf"))
+		self._write("moved", 2)
+		self.assertTrue(
+			persistanceLayer._getControllerFile(self.basePath, 2).endswith("moved.conf")
+		)
+		self.assertIsNone(persistanceLayer._getControllerFile(self.basePath, 9))
+
+	def testPersistentControllerIndex(self):
+		"""Checks if the controller index of the snapshot is used after a restart."""
+		snapshotFile = settings.SNAPSHOTFILE
+		settings.SNAPSHOTFILE = os.path.join(self.basePath, "cache", "conf.snapshot")
+		try:
+			persistanceLayer.readAllConfs(self.basePath, 0, settings.SNAPSHOTFILE)
+			persistanceLayer._controllerIndex.clear()
+			with unittest.mock.patch.object(
+				persistanceLayer, "_getConfFiles", side_effect=AssertionError
+			):
+				path = persistanceLayer._getControllerFile(self.basePath, 2)
+			self.assertTrue(path.endswith("c2.conf"), "Files were scanned")
+		finally:
+			settings.SNAPSHOTFILE = snapshotFile
+
+	def testEditRule(self):
+		"""Checks if an edited rule is read back."""
+		persistanceLayer.editRule(self.basePath, 3, "Rule1", PumpSeconds=7)
+		conf = persistanceLayer.readControllerConf(self.basePath, 3)
+		self.assertEqual(conf["rules"][0].pumpSeconds, 7)
+		persistanceLayer.deleteRule(self.basePath, 3, "Rule1")
+		self.assertEqual(persistanceLayer.readControllerConf(self.basePath, 3)["rules"], [])
+
+	def testParallelLoading(self):
+		"""Ensures that the parallel loader reads the same configuration."""
+		for subDir, content in (("pumps", _PUMPS), ("sensors", _SENSORS)):
+			with open(os.path.join(self.basePath, subDir, "1.conf"), "w") as f:
+				f.write(content)
+		serial = persistanceLayer.readAllConfs(self.basePath)
+		parallel = persistanceLayer.readAllConfs(self.basePath, 4)
+		self.assertEqual(sorted(serial["pumps"]), [1, 2])
+		self.assertEqual(list(serial["sensors"]), [1])
+		self.assertEqual(sorted(serial["controllers"]), [1, 2, 3])
+		self.assertEqual(serial["pumps"], parallel["pumps"])
+		self.assertEqual(serial["sensors"], parallel["sensors"])
+		self.assertEqual(serial["timings"].keys(), parallel["timings"].keys())
+		self.assertEqual(
+			{
+				nr: [r.getDefinition() for r in c["rules"]]
+				for nr, c in serial["controllers"].items()
+			},
+			{
+				nr: [r.getDefinition() for r in c["rules"]]
+				for nr, c in parallel["controllers"].items()
+			},
+		)
+		self.assertEqual(
+			serial["pumps"], persistanceLayer.readPumpConfs(self.basePath)
+		)
+
+	def testSnapshot(self):
+		"""Checks if the snapshot is used only as long as the files are unchanged."""
+		snapshot = os.path.join(self.basePath, "cache", "conf.snapshot")
+		first = persistanceLayer.readAllConfs(self.basePath, 0, snapshot)
+		self.assertTrue(os.path.exists(snapshot), "Snapshot was not written")
+		second = persistanceLayer.readAllConfs(self.basePath, 0, snapshot)
+		self.assertEqual(second["timings"], {}, "Snapshot was not used")
+		self.assertEqual(
+			[r.getDefinition() for r in first["controllers"][1]["rules"]],
+			[r.getDefinition() for r in second["controllers"][1]["rules"]],
+		)
+		self.assertTrue(
+			persistanceLayer._getControllerFile(self.basePath, 2).endswith("c2.conf")
+		)
+
+		# The snapshot is removed, even if the file keeps its size and mtime.
+		path = persistanceLayer._getControllerFile(self.basePath, 1)
+		st = os.stat(path)
+		snapshotFile = settings.SNAPSHOTFILE
+		settings.SNAPSHOTFILE = snapshot
+		try:
+			persistanceLayer.editRule(self.basePath, 1, "Rule1", PumpSeconds=9)
+		finally:
+			settings.SNAPSHOTFILE = snapshotFile
+		os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+		self.assertEqual(os.stat(path).st_size, st.st_size)
+		self.assertFalse(os.path.exists(snapshot), "Snapshot was not removed")
+		third = persistanceLayer.readAllConfs(self.basePath, 0, snapshot)
+		self.assertNotEqual(third["timings"], {}, "Outdated snapshot was used")
+		self.assertEqual(third["controllers"][1]["rules"][0].pumpSeconds, 9)
+
+
+if __name__ == "__main__":
+	unittest.main()
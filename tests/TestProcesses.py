@@ -0,0 +1,171 @@
+"""Provides tests for the multi process mode (processes.py)."""
+import unittest
+import tempfile
+import threading
+import shutil
+import time
+import os
+import settings
+import main
+import sensor
+
+
+_PUMPS = """
+[Pump 1]
+Nr = 1
+GPIO = 0
+"""
+
+_SENSORS = """
+[Sensor 1]
+Nr = 1
+Type = 12
+Channel = 1
+Interval = 0.1
+"""
+
+_CONTROLLER = """
+[DEFAULT]
+Type = 2
+Nr = 1
+SensorNr = 1
+PumpNr = 1
+
+[Rule1]
+TimeFrom = 00:00:00
+TimeTo = 23:59:59
+Comparator = <
+RightValue = 60
+PumpSeconds = 1
+"""
+
+_VALUES = """
+[Sensors]
+1 = 10
+2 = 20
+"""
+
+
+class _RecordingMain(main.MultiProcessMain):
+	"""Records the pump orders of the worker processes."""
+
+	def __init__(self):
+		main.MultiProcessMain.__init__(self)
+		self.orders = []
+
+	def _onOrder(self, *order):
+		self.orders.append(order)
+		main.MultiProcessMain._onOrder(self, *order)
+
+
+class TestSharedValues(unittest.TestCase):
+	"""Provides tests for the SharedValues and ProxySensor classes."""
+
+	def testProxySensor(self):
+		"""Checks that a ProxySensor reads the value of its slot."""
+		values = sensor.SharedValues(4)
+		s = sensor.ProxySensor(1, "1", 1, values, 2)
+		self.assertIsNone(s.sample())
+		values.write(2, 12.5)
+		self.assertEqual(s.sample(), 12.5)
+		values.write(2, None)
+		self.assertIsNone(s.sample())
+
+
+class TestMultiProcessMain(unittest.TestCase):
+	"""Runs the system with worker processes."""
+
+	def setUp(self):
+		self._settings = {
+			name: getattr(settings, name)
+			for name in (
+				"BASECONFDIR",
+				"TESTFILE",
+				"HISTORYDIR",
+				"LEDGERFILE",
+				"SNAPSHOTFILE",
+				"CONTROLLERPROCESSES",
+				"SHAREDSENSORSLOTS",
+			)
+		}
+		settings.BASECONFDIR = tempfile.mkdtemp()
+		settings.TESTFILE = os.path.join(settings.BASECONFDIR, "testSetting.conf")
+		settings.HISTORYDIR = os.path.join(settings.BASECONFDIR, "history")
+		settings.LEDGERFILE = os.path.join(settings.HISTORYDIR, "pumps.ledger")
+		settings.SNAPSHOTFILE = None
+		settings.CONTROLLERPROCESSES = 2
+		with open(settings.TESTFILE, "w") as f:
+			f.write(_VALUES)
+		for name, content in (
+			("pumps", _PUMPS),
+			("sensors", _SENSORS),
+			("controllers", _CONTROLLER),
+		):
+			os.mkdir(os.path.join(settings.BASECONFDIR, name))
+			self._write(name, content)
+
+		self.main = _RecordingMain()
+		self.t = threading.Thread(target=self.main.run, args=())
+		self.t.start()
+		while not self.main._running:
+			time.sleep(0.01)
+
+	def tearDown(self):
+		self.main.requestStop()
+		self.t.join()
+		shutil.rmtree(settings.BASECONFDIR)
+		for name, value in self._settings.items():
+			setattr(settings, name, value)
+
+	def _write(self, name, content):
+		with open(os.path.join(settings.BASECONFDIR, name, "1.conf"), "w") as f:
+			f.write(content)
+
+	def _waitFor(self, condition, timeout=30):
+		end = time.monotonic() + timeout
+		while not condition():
+			if time.monotonic() > end:
+				return False
+			time.sleep(0.05)
+		return True
+
+	def testOrdersAndValues(self):
+		"""Checks that the values and the pump orders pass the processes."""
+		self.assertTrue(
+			self._waitFor(lambda: self.main.sensors[1].getValue() == 10),
+			"Sensor value did not arrive",
+		)
+		self.assertTrue(self._waitFor(lambda: self.main.orders), "No pump order")
+		self.assertEqual(self.main.orders[0], (1, 1, 1, "Rule1"))
+
+	def testReloadSensor(self):
+		"""Checks that a changed sensor is replaced in the worker processes."""
+		self.assertTrue(self._waitFor(lambda: self.main.orders), "No pump order")
+		self._write("sensors", _SENSORS.replace("Channel = 1", "Channel = 2"))
+		self.main.reload()
+		self.assertTrue(
+			self._waitFor(lambda: self.main.sensors[1].getValue() == 20),
+			"Value of the new sensor did not arrive",
+		)
+		# The restarted controller must keep the lastRun of its rule.
+		time.sleep(0.5)
+		self.assertEqual(len(self.main.orders), 1, "Rule ran twice on one day")
+
+	def testTooManySensors(self):
+		"""Ensures that sensors without a slot are rejected before they are applied."""
+		settings.SHAREDSENSORSLOTS = 1
+		second = _SENSORS.replace("Sensor 1", "Sensor 2").replace("Nr = 1", "Nr = 2")
+		self._write("sensors", _SENSORS + second)
+		self.main.reload()
+		self.assertEqual(list(self.main.sensors), [1])
+
+		# A failed start must stop the worker processes.
+		m = main.MultiProcessMain()
+		with self.assertRaises(ValueError):
+			m.run()
+		self.assertFalse(m._processes._orderThread.is_alive())
+		self.assertFalse(any(p.is_alive() for p in m._processes._processes))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,5 +1,7 @@
 """Provides tests for the pumper package."""
 import unittest
+import threading
+import time
 import settings
 import pumper
 
@@ -30,6 +32,41 @@ class TestPumper(unittest.TestCase):
 		self.p.addPump(3, 1)
 		self.assertRaises(ValueError, self.p.addPump, 3, 2)
 
+	def testPumpOrdersAccumulate(self):
+		"""Checks if the seconds of multiple orders are added up."""
+		self.p.addPump(3, 0)
+		t = threading.Thread(target=self.p.run, args=())
+		t.start()
+		try:
+			self.p.pump(3, 10)
+			self.p.pump(3, 5)
+			time.sleep(0.3)
+			self.assertTrue(self.p.pumps[3].isPumping(), "Pump was not started")
+			self.assertGreater(self.p.pumps[3].seconds, 14, "Orders were not added up")
+		finally:
+			self.p.stop()
+			t.join()
+		self.assertEqual(self.p.pumps[3].seconds, 0, "Pump was not stopped")
+
+	def testPumpStopsOnTime(self):
+		"""Checks if a pump is stopped when its seconds have elapsed."""
+		self.p.addPump(3, 0)
+		t = threading.Thread(target=self.p.run, args=())
+		t.start()
+		try:
+			self.p.pump(3, 0.2)
+			time.sleep(0.1)
+			self.assertTrue(self.p.pumps[3].isPumping(), "Pump was not started")
+			time.sleep(0.15)
+			self.assertFalse(self.p.pumps[3].isPumping(), "Pump was not stopped")
+		finally:
+			self.p.stop()
+			t.join()
+
+	def testPumpUnknown(self):
+		"""Ensures that an order for an unknown pump raises an Exception."""
+		self.assertRaises(KeyError, self.p.pump, 3, 10)
+
 
 if __name__ == "__main__":
 	unittest.main()
@@ -0,0 +1,158 @@
+"""Provides tests for reloading the configuration of a running system."""
+import unittest
+import datetime
+import tempfile
+import threading
+import shutil
+import time
+import os
+import settings
+import main
+import persistanceLayer
+
+
+_PUMPS = """
+[Pump 1]
+Nr = 1
+GPIO = 0
+
+[Pump 2]
+Nr = 2
+GPIO = 0
+"""
+
+_SENSORS = """
+[Sensor 1]
+Nr = 1
+Type = 12
+Channel = 1
+Interval = 1
+"""
+
+_CONTROLLER = """
+[DEFAULT]
+Type = 2
+Nr = 1
+SensorNr = 1
+PumpNr = 1
+
+[Rule1]
+TimeFrom = 00:00:00
+TimeTo = 00:00:01
+Comparator = <
+RightValue = 60
+PumpSeconds = 2
+"""
+
+
+class TestReload(unittest.TestCase):
+	"""Provides tests for Main.reload() and Main.reloadController()."""
+
+	def setUp(self):
+		self.baseConfDir = settings.BASECONFDIR
+		self.historyDir = settings.HISTORYDIR
+		self.snapshotFile = settings.SNAPSHOTFILE
+		settings.BASECONFDIR = tempfile.mkdtemp()
+		settings.HISTORYDIR = os.path.join(settings.BASECONFDIR, "history")
+		settings.SNAPSHOTFILE = os.path.join(settings.BASECONFDIR, "conf.snapshot")
+		self.ledgerFile = settings.LEDGERFILE
+		settings.LEDGERFILE = os.path.join(settings.HISTORYDIR, "pumps.ledger")
+		for name, content in (
+			("pumps", _PUMPS),
+			("sensors", _SENSORS),
+			("controllers", _CONTROLLER),
+		):
+			os.mkdir(os.path.join(settings.BASECONFDIR, name))
+			with open(os.path.join(settings.BASECONFDIR, name, "1.conf"), "w") as f:
+				f.write(content)
+
+		self.main = main.Main()
+		self.t = threading.Thread(target=self.main.run, args=())
+		self.t.start()
+		while not self.main._running:
+			time.sleep(0.01)
+
+	def tearDown(self):
+		self.main._stopRequest = True
+		self.t.join()
+		shutil.rmtree(settings.BASECONFDIR)
+		settings.BASECONFDIR = self.baseConfDir
+		settings.HISTORYDIR = self.historyDir
+		settings.SNAPSHOTFILE = self.snapshotFile
+		settings.LEDGERFILE = self.ledgerFile
+
+	def _write(self, name, content):
+		with open(os.path.join(settings.BASECONFDIR, name, "1.conf"), "w") as f:
+			f.write(content)
+
+	def testEditRule(self):
+		"""Ensures that editing a rule does not restart the controller."""
+		c = self.main.controllers[1]
+		sensor = self.main.sensors[1]
+		persistanceLayer.editRule(
+			settings.BASECONFDIR,
+			1,
+			"Rule2",
+			TimeFrom="10:00:00",
+			TimeTo="11:00:00",
+			Comparator=">",
+			RightValue=5,
+			PumpSeconds=3,
+		)
+		self.main.reloadController(1)
+		self.assertIs(self.main.controllers[1], c, "Controller was replaced")
+		self.assertIs(self.main.sensors[1], sensor, "Sensor was replaced")
+		self.assertEqual([r.name for r in c.ruleSet], ["Rule1", "Rule2"])
+
+	def testUnchangedRulesKeepState(self):
+		"""Ensures that unchanged rules keep their lastRun."""
+		c = self.main.controllers[1]
+		rule = c.ruleSet[0]
+		rule.lastRun = datetime.datetime(2021, 3, 1)
+		self.main.reload()
+		self.assertIs(self.main.controllers[1].ruleSet[0], rule)
+
+	def testChangedSensor(self):
+		"""Checks if a changed sensor restarts only its controller."""
+		c = self.main.controllers[1]
+		self._write("sensors", _SENSORS.replace("Channel = 1", "Channel = 2"))
+		self.main.reload()
+		self.assertEqual(self.main.sensors[1].channel, "2")
+		self.assertIsNot(self.main.controllers[1], c, "Controller was not restarted")
+		# The cached rule table of the old controller must not be used.
+		self.assertNotEqual(self.main.controllers[1].ruleSetVersion, c.ruleSetVersion)
+		self.assertIs(self.main.controllers[1].sensor, self.main.sensors[1])
+
+	def testPumps(self):
+		"""Checks if removed and added pumps are applied."""
+		self._write("pumps", _PUMPS.replace("Nr = 2", "Nr = 3"))
+		self.main.reload()
+		self.assertEqual(sorted(self.main.pumper.pumps), [1, 3])
+
+	def testMissingSensor(self):
+		"""Ensures that a controller without its sensor does not stop the reload."""
+		self._write("sensors", _SENSORS.replace("Nr = 1", "Nr = 2"))
+		self._write("pumps", _PUMPS.replace("Nr = 2", "Nr = 3"))
+		self.main.reload()
+		self.assertNotIn(1, self.main.controllers)
+		self.assertEqual(sorted(self.main.pumper.pumps), [1, 3])
+
+		# The controller is started as soon as its sensor exists again.
+		self._write("sensors", _SENSORS)
+		self.main.reload()
+		self.assertIs(self.main.controllers[1].sensor, self.main.sensors[1])
+
+	def testRemovedPump(self):
+		"""Ensures that a controller is stopped when its pump is removed."""
+		self._write("pumps", _PUMPS.replace("Nr = 1", "Nr = 3"))
+		self.main.reload()
+		self.assertNotIn(1, self.main.controllers)
+
+		# The controller is started as soon as its pump exists again.
+		self._write("pumps", _PUMPS)
+		self.main.reload()
+		self.assertIn(1, self.main.controllers)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,172 @@
+"""Provides tests for the ruling module of the controller package."""
+import unittest
+import datetime
+import random
+import settings
+import controller
+from controller.enums import Comparator
+from controller.ruling import CompiledRuleSet
+from controller.ruling import RuleTable
+
+
+def _time(seconds):
+	"""Converts seconds since midnight into a datetime.time."""
+	return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def _randomRules(rnd, count, measure=True):
+	"""Creates two identical lists of random rules with the given random.Random."""
+	a, b = [], []
+	for i in range(count):
+		start = rnd.randrange(0, 86400)
+		end = rnd.randrange(start, 86400)
+		if measure:
+			args = (
+				rnd.choice(list(Comparator)),
+				rnd.randrange(0, 100),
+				rnd.randrange(0, 10),
+			)
+			a.append(controller.MeasureRule(str(i), _time(start), _time(end), *args))
+			b.append(controller.MeasureRule(str(i), _time(start), _time(end), *args))
+		else:
+			seconds = rnd.randrange(0, 10)
+			a.append(controller.TimeRule(str(i), _time(start), _time(end), seconds))
+			b.append(controller.TimeRule(str(i), _time(start), _time(end), seconds))
+	return a, b
+
+
+class TestCompiledRuleSet(unittest.TestCase):
+	"""Provides tests for the CompiledRuleSet class."""
+
+	def setUp(self):
+		self.rnd = random.Random(4)
+
+	def testMeasureRulesLikeGetPumpSeconds(self):
+		"""Compares the compiled evaluation with MeasureRule.getPumpSeconds()."""
+		rules, reference = _randomRules(self.rnd, 50)
+		compiled = CompiledRuleSet(rules)
+		now = datetime.datetime(2021, 3, 1)
+		while now < datetime.datetime(2021, 3, 3):
+			value = self.rnd.choice([None, self.rnd.randrange(0, 100)])
+			expected = []
+			for rule in reference:
+				seconds = rule.getPumpSeconds(now, value)
+				if seconds > 0:
+					rule.lastRun = now
+					expected.append((rule.name, seconds))
+			result = [(r.name, s) for r, s in compiled.evaluate(now, value)]
+			self.assertEqual(sorted(result), sorted(expected), "Differs at " + str(now))
+			now += datetime.timedelta(seconds=self.rnd.randrange(1, 600))
+
+	def testTimeRulesLikeGetPumpSeconds(self):
+		"""Compares the compiled evaluation with TimeRule.getPumpSeconds()."""
+		rules, reference = _randomRules(self.rnd, 50, False)
+		compiled = CompiledRuleSet(rules)
+		now = datetime.datetime(2021, 3, 1)
+		while now < datetime.datetime(2021, 3, 3):
+			expected = []
+			for rule in reference:
+				seconds = rule.getPumpSeconds(now)
+				if seconds > 0:
+					rule.lastRun = now
+					expected.append((rule.name, seconds))
+			result = [(r.name, s) for r, s in compiled.evaluate(now)]
+			self.assertEqual(sorted(result), sorted(expected), "Differs at " + str(now))
+			now += datetime.timedelta(seconds=self.rnd.randrange(1, 600))
+
+	def testBoundariesInclusive(self):
+		"""Ensures that timeFrom and timeTo are part of the time window."""
+		rule = controller.TimeRule("r", _time(10), _time(20), 5)
+		compiled = CompiledRuleSet([rule])
+		day = datetime.datetime(2021, 3, 1)
+		self.assertEqual(compiled.evaluate(day + datetime.timedelta(seconds=9)), [])
+		self.assertEqual(
+			compiled.evaluate(day + datetime.timedelta(seconds=20)), [(rule, 5)]
+		)
+		day += datetime.timedelta(days=1)
+		self.assertEqual(
+			compiled.evaluate(day + datetime.timedelta(seconds=10)), [(rule, 5)]
+		)
+
+	def testNextCheck(self):
+		"""Checks the computation of the next time window."""
+		first = controller.TimeRule("a", _time(3600), _time(7200), 5)
+		second = controller.TimeRule("b", _time(36000), _time(36060), 5)
+		compiled = CompiledRuleSet([first, second])
+		day = datetime.datetime(2021, 3, 1)
+		self.assertEqual(compiled.getNextCheck(day), day.replace(hour=1))
+		now = day.replace(hour=1, minute=30)
+		self.assertEqual(compiled.getNextCheck(now), now, "Open window not detected")
+		compiled.evaluate(now)
+		self.assertEqual(compiled.getNextCheck(now), day.replace(hour=10))
+		compiled.evaluate(day.replace(hour=10))
+		self.assertEqual(
+			compiled.getNextCheck(day.replace(hour=10)),
+			day.replace(day=2, hour=1),
+			"Next window must be tomorrow",
+		)
+		self.assertIsNone(CompiledRuleSet([]).getNextCheck(day))
+
+
+class TestRuleTable(unittest.TestCase):
+	"""Provides tests for the RuleTable class."""
+
+	def testLikeCompiledRuleSet(self):
+		"""Compares the RuleTable with the CompiledRuleSet of the same rules."""
+		rnd = random.Random(7)
+		a, b = _randomRules(rnd, 200)
+		a.append(controller.TimeRule("empty", _time(600), _time(300), 5))
+		b.append(controller.TimeRule("empty", _time(600), _time(300), 5))
+		table = RuleTable(a)
+		compiled = CompiledRuleSet(b)
+		now = datetime.datetime(2021, 3, 1)
+		while now < datetime.datetime(2021, 3, 3):
+			value = rnd.choice([None, rnd.randrange(0, 100)])
+			self.assertEqual(table.getNextCheck(now), compiled.getNextCheck(now))
+			result = [(r.name, s) for r, s in table.evaluate(now, value)]
+			expected = [(r.name, s) for r, s in compiled.evaluate(now, value)]
+			self.assertEqual(result, expected, "Differs at " + str(now))
+			self.assertLessEqual(
+				compiled.getNextBoundary(now), table.getNextBoundary(now)
+			)
+			now += datetime.timedelta(seconds=rnd.randrange(1, 600))
+
+	def testNextBoundary(self):
+		"""Checks that the windows open at timeFrom and close after timeTo."""
+		rule = controller.TimeRule("r", _time(3600), _time(7200), 5)
+		table = RuleTable([rule])
+		day = datetime.datetime(2021, 3, 1)
+		self.assertEqual(table.getNextBoundary(day), day.replace(hour=1))
+		# The window closes just after timeTo (rounded to microseconds).
+		self.assertEqual(
+			table.getNextBoundary(day.replace(hour=2)), day.replace(hour=2)
+		)
+		self.assertEqual(
+			table.getNextBoundary(day.replace(hour=3)), day.replace(day=2)
+		)
+		self.assertIsNone(RuleTable([]).getNextCheck(day))
+
+
+class TestRule(unittest.TestCase):
+	"""Provides tests for the Rule classes."""
+
+	def testTimeWindow(self):
+		"""Checks that the time window is kept as seconds since midnight."""
+		rule = controller.MeasureRule(
+			"r",
+			datetime.time(6, 30),
+			datetime.time(7, 0, 0, 250000),
+			Comparator.LESSER,
+			10,
+			5,
+		)
+		self.assertEqual(rule.secondsFrom, 23400)
+		self.assertIsInstance(rule.secondsFrom, int)
+		self.assertEqual(rule.secondsTo, 25200.25)
+		self.assertEqual(rule.timeFrom, datetime.time(6, 30))
+		self.assertEqual(rule.timeTo, datetime.time(7, 0, 0, 250000))
+		self.assertFalse(hasattr(rule, "__dict__"))
+
+
+if __name__ == "__main__":
+	unittest.main()
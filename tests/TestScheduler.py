@@ -0,0 +1,65 @@
+"""Provides tests for the sensor scheduler."""
+import unittest
+import threading
+import time
+import settings
+import sensor
+
+
+class _CountingSensor(sensor.Sensor):
+	"""Sensor which returns the number of its measurements."""
+
+	def __init__(self, nr, interval):
+		sensor.Sensor.__init__(self, nr, "0", interval)
+		self.count = 0
+
+	def _measure(self):
+		self.count += 1
+		return self.count
+
+
+class TestScheduler(unittest.TestCase):
+	"""Provides tests for the Scheduler class."""
+
+	def setUp(self):
+		self.s = sensor.Scheduler(2)
+		self.t = threading.Thread(target=self.s.run, args=())
+
+	def tearDown(self):
+		self.s.stop()
+		self.t.join()
+
+	def testIntervals(self):
+		"""Checks if every sensor is sampled on its own interval."""
+		fast = _CountingSensor(1, 0.01)
+		slow = _CountingSensor(2, 10)
+		self.s.addSensor(fast)
+		self.s.addSensor(slow)
+		self.t.start()
+		time.sleep(0.3)
+		self.assertGreater(fast.count, 5, "Fast sensor was not sampled regularly")
+		self.assertEqual(slow.count, 1, "Slow sensor was sampled too often")
+		self.assertEqual(fast.getValue(), fast.count, "Value was not stored")
+
+	def testRemoveSensor(self):
+		"""Ensures that a removed sensor is not sampled anymore."""
+		s = _CountingSensor(1, 0.01)
+		self.s.addSensor(s)
+		self.t.start()
+		time.sleep(0.1)
+		self.s.removeSensor(1)
+		time.sleep(0.05)
+		count = s.count
+		time.sleep(0.1)
+		self.assertEqual(s.count, count, "Removed sensor is still sampled")
+		self.assertEqual(s.getState(), sensor.enums.State.STOPPED)
+
+	def testDuplicates(self):
+		"""Ensures that an Exception ist raised if a sensorNr is already in use"""
+		self.s.addSensor(_CountingSensor(1, 1))
+		self.assertRaises(ValueError, self.s.addSensor, _CountingSensor(1, 1))
+		self.t.start()
+
+
+if __name__ == "__main__":
+	unittest.main()
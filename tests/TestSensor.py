@@ -0,0 +1,155 @@
+"""Provides tests for the sensor package."""
+import unittest
+import tempfile
+import datetime
+import os
+import settings
+import clock
+import sensor
+
+
+class _ListSensor(sensor.Sensor):
+	"""Sensor which returns the values of a list."""
+
+	def __init__(self, values):
+		sensor.Sensor.__init__(self, 1, "0")
+		self._values = iter(values)
+
+	def _measure(self):
+		return next(self._values)
+
+
+class TestSubscription(unittest.TestCase):
+	"""Provides tests for the subscriptions of a Sensor."""
+
+	def _notified(self, values, deadband=0, thresholds=()):
+		"""Samples all values and returns the notified ones."""
+		s = _ListSensor(values)
+		notified = []
+		s.subscribe(notified.append, deadband, thresholds)
+		for _ in values:
+			s.sample()
+		return notified
+
+	def testEveryChange(self):
+		"""Checks if every change is notified without deadband."""
+		self.assertEqual(self._notified([1, 1, 2, 2, 3]), [1, 2, 3])
+
+	def testDeadband(self):
+		"""Checks if small changes are suppressed by the deadband."""
+		self.assertEqual(self._notified([10, 10.5, 11, 12.2, 11.5], 2), [10, 12.2])
+
+	def testThresholds(self):
+		"""Checks if crossing a threshold is notified despite of the deadband."""
+		self.assertEqual(
+			self._notified([10, 10.5, 11, 11.5, 11], 5, [11]), [10, 11, 11.5, 11]
+		)
+
+	def testNone(self):
+		"""Checks if a change from or to None is notified."""
+		self.assertEqual(self._notified([None, 5, None], 10), [5, None])
+
+	def testUnsubscribe(self):
+		"""Ensures that an unsubscribed listener is not notified anymore."""
+		s = _ListSensor([1, 2])
+		notified = []
+		subscription = s.subscribe(notified.append)
+		s.sample()
+		s.unsubscribe(subscription)
+		s.sample()
+		self.assertEqual(notified, [1])
+
+
+class _FixedClock(clock.SystemClock):
+	"""Clock which only moves if its time is set."""
+
+	def __init__(self, start: datetime.datetime):
+		self.current = start
+
+	def now(self):
+		return self.current
+
+	def time(self):
+		return self.current.timestamp()
+
+	def monotonic(self):
+		return self.current.timestamp()
+
+
+class TestTestValueProvider(unittest.TestCase):
+	"""Provides tests for the TestValueProvider class."""
+
+	def setUp(self):
+		self.clock = _FixedClock(datetime.datetime(2021, 3, 1, 12, 0))
+		clock.setClock(self.clock)
+		self.dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.dir.name, "testSetting.conf")
+
+	def tearDown(self):
+		clock.setClock(clock.SystemClock())
+		self.dir.cleanup()
+
+	def _write(self, text: str):
+		with open(self.path, "w") as f:
+			f.write(text)
+
+	def _advance(self, seconds: float):
+		self.clock.current += datetime.timedelta(seconds=seconds)
+
+	def testReload(self):
+		"""Checks if the file is only read again after a change and the interval."""
+		self._write("[Sensors]\n1 = 5\n")
+		provider = sensor.TestValueProvider(self.path, 10)
+		self.assertEqual(provider.getValue("1"), 5)
+		self._write("[Sensors]\n1 = 7.5\n")
+		os.utime(self.path, ns=(0, 10 ** 9))
+		self.assertEqual(provider.getValue("1"), 5, "Interval was not respected")
+		self._advance(10)
+		self.assertEqual(provider.getValue("1"), 7.5)
+		with self.assertRaises(KeyError):
+			provider.getValue("2")
+
+	def testSequence(self):
+		"""Checks if a relative sequence is interpolated and repeated."""
+		self._write("[Sensors]\n1 = 5\n[Sequences]\n1 = 0 10, 100 20, 200 10\n")
+		provider = sensor.TestValueProvider(self.path)
+		self.assertEqual(provider.getValue("1"), 10)
+		self._advance(50)
+		self.assertAlmostEqual(provider.getValue("1"), 15)
+		self._advance(100)
+		self.assertAlmostEqual(provider.getValue("1"), 15)
+		self._advance(75)
+		self.assertAlmostEqual(provider.getValue("1"), 12.5)
+
+	def testDailySequence(self):
+		"""Checks if a daily sequence wraps around midnight."""
+		self._write("[Sequences]\n1 = 06:00 0, 18:00 120\n")
+		provider = sensor.TestValueProvider(self.path)
+		self.assertAlmostEqual(provider.getValue("1"), 60)
+		self._advance(9 * 3600)
+		self.assertAlmostEqual(provider.getValue("1"), 90)
+		self._advance(6 * 3600)
+		self.assertAlmostEqual(provider.getValue("1"), 30)
+
+	def testMixedCaseChannel(self):
+		"""Checks if channels are found regardless of their case."""
+		self._write("[Sensors]\nAbc = 5\n[Sequences]\nSeq = 0 10, 100 20\n")
+		provider = sensor.TestValueProvider(self.path)
+		self.assertEqual(provider.getValue("Abc"), 5)
+		self.assertEqual(provider.getValue("abc"), 5)
+		self.assertEqual(provider.getValue("SEQ"), 10)
+
+	def testTestSensor(self):
+		"""Checks if the test sensors read their values from the TESTFILE."""
+		self._write("[Sensors]\n3 = 42\n")
+		testFile = settings.TESTFILE
+		settings.TESTFILE = self.path
+		try:
+			s = sensor.createSensor(1, sensor.Type.TEST_LIGHT, "3")
+			self.assertEqual(s._measure(), 42)
+		finally:
+			settings.TESTFILE = testFile
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,92 @@
+"""Provides tests for the simulation module of the controller package."""
+import unittest
+import datetime
+import random
+import settings
+import controller
+from controller.enums import Comparator
+from controller.ruling import CompiledRuleSet
+
+try:
+	import numpy
+	from controller import simulation
+except ModuleNotFoundError:
+	numpy = None
+
+
+def _time(seconds):
+	"""Converts seconds since midnight into a datetime.time."""
+	return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+@unittest.skipUnless(numpy, "NumPy is not installed")
+class TestSimulation(unittest.TestCase):
+	"""Provides tests for simulate() and sweep()."""
+
+	def setUp(self):
+		self.rnd = random.Random(7)
+		self.times = []
+		self.values = []
+		now = datetime.datetime(2021, 3, 1)
+		while now < datetime.datetime(2021, 3, 8):
+			self.times.append(now)
+			self.values.append(self.rnd.choice([None] + list(range(0, 100, 5))))
+			now += datetime.timedelta(seconds=self.rnd.randrange(1, 900))
+		self.series = simulation.Series(self.times, self.values)
+
+	def _rules(self):
+		rules = []
+		for i in range(30):
+			start = self.rnd.randrange(0, 86400)
+			end = self.rnd.randrange(start, 86400)
+			rules.append(
+				controller.MeasureRule(
+					str(i),
+					_time(start),
+					_time(end),
+					self.rnd.choice(list(Comparator)),
+					self.rnd.randrange(0, 100, 5),
+					self.rnd.randrange(0, 10),
+				)
+			)
+		rules.append(controller.TimeRule("time", _time(3600), _time(7200), 4))
+		return rules
+
+	def testLikeEvaluate(self):
+		"""Compares simulate() with CompiledRuleSet.evaluate() at every sample."""
+		rules = self._rules()
+		rules[0].lastRun = datetime.datetime(2021, 3, 1, 23)
+		result = simulation.simulate(rules, self.series)
+
+		compiled = CompiledRuleSet(rules)
+		firings = {rule.name: [] for rule in rules}
+		for now, value in zip(self.times, self.values):
+			for rule, seconds in compiled.evaluate(now, value):
+				firings[rule.name].append(now)
+		for rule in rules:
+			self.assertEqual(
+				result.firings[rule.name].tolist(), firings[rule.name], rule.name
+			)
+			self.assertEqual(
+				result.seconds[rule.name], len(firings[rule.name]) * rule.pumpSeconds
+			)
+
+	def testSweep(self):
+		"""Compares sweep() with simulate() for every parameter combination."""
+		windows = [(_time(0), _time(86399)), (_time(36000), _time(39600))]
+		rValues = list(range(0, 100, 10))
+		for comparator in Comparator:
+			seconds = simulation.sweep(self.series, comparator, rValues, windows, 3)
+			for w, (timeFrom, timeTo) in enumerate(windows):
+				for r, rValue in enumerate(rValues):
+					rule = controller.MeasureRule(
+						"r", timeFrom, timeTo, comparator, rValue, 3
+					)
+					expected = simulation.simulate([rule], self.series).seconds["r"]
+					self.assertEqual(
+						seconds[w, r], expected, str((comparator, w, rValue))
+					)
+
+
+if __name__ == "__main__":
+	unittest.main()
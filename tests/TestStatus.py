@@ -0,0 +1,87 @@
+"""Provides tests for the status module of the web package."""
+import unittest
+import threading
+import json
+import settings
+import sensor
+import pumper
+import web.status
+
+
+class _ListSensor(sensor.Sensor):
+	"""Sensor which returns the values of a list."""
+
+	def __init__(self, nr, values):
+		sensor.Sensor.__init__(self, nr, "0")
+		self._values = iter(values)
+
+	def _measure(self):
+		return next(self._values)
+
+
+class _Main:
+	"""Provides the attributes of main.Main which are used by the StatusBoard."""
+
+	def __init__(self):
+		self.sensors = {1: _ListSensor(1, [5, 6, 6])}
+		self.controllers = {}
+		self.pumper = pumper.Pumper()
+		self.pumper.addPump(1, 0)
+		self.listeners = []
+
+	def addReloadListener(self, callback):
+		self.listeners.append(callback)
+
+
+class TestStatusBoard(unittest.TestCase):
+	"""Provides tests for the StatusBoard class."""
+
+	def setUp(self):
+		self.main = _Main()
+		self.board = web.status.StatusBoard(self.main, 3)
+		self.board.sync()
+
+	def tearDown(self):
+		self.board.close()
+
+	def testSnapshot(self):
+		"""Checks if the snapshot contains all objects."""
+		version, data = self.board.getSnapshot()
+		status = json.loads(data)
+		self.assertEqual(status["version"], version)
+		self.assertEqual(status["sensors"]["1"]["value"], None)
+		self.assertEqual(status["pumps"]["1"]["pumping"], False)
+
+	def testDeltas(self):
+		"""Checks if only changed values are delivered as deltas."""
+		version = self.board.getVersion()
+		s = self.main.sensors[1]
+		s.sample()
+		s.sample()
+		s.sample()
+		deltas = self.board.getDeltas(version, 0)
+		self.assertEqual([d["d"]["value"] for d in deltas], [5, 6])
+		self.assertEqual(self.board.getDeltas(deltas[-1]["v"], 0), [])
+
+		del self.main.sensors[1]
+		self.board.sync()
+		self.assertIsNone(self.board.getDeltas(version, 0), "Deltas are too old")
+		self.assertNotIn("1", json.loads(self.board.getSnapshot()[1])["sensors"])
+
+	def testPumpState(self):
+		"""Checks if a started pump is published by the pumper thread."""
+		version = self.board.getVersion()
+		t = threading.Thread(target=self.main.pumper.run)
+		t.start()
+		try:
+			self.main.pumper.pump(1, 0.05)
+			deltas = self.board.getDeltas(version, 5)
+		finally:
+			self.main.pumper.stop()
+			t.join()
+		self.assertEqual(deltas[0]["s"], "pumps")
+		self.assertTrue(deltas[0]["d"]["pumping"])
+
+
+if __name__ == "__main__":
+	unittest.main()
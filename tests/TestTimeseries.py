@@ -0,0 +1,77 @@
+"""Provides tests for the timeseries package."""
+import unittest
+import tempfile
+import shutil
+import settings
+import timeseries
+
+
+class _Sensor:
+	"""Provides the attributes of a Sensor which are used by the Store."""
+
+	def __init__(self, nr):
+		self.nr = nr
+
+
+class TestStore(unittest.TestCase):
+	"""Provides tests for the Store class."""
+
+	def setUp(self):
+		self.basePath = tempfile.mkdtemp()
+		self.store = timeseries.Store(self.basePath, {1: 7200, 60: 86400}, 50)
+		self.start = 1614556800  # 2021-03-01 00:00:00 UTC
+
+	def tearDown(self):
+		self.store.close()
+		shutil.rmtree(self.basePath)
+
+	def _record(self, nr, seconds, values):
+		"""Records ten values per second."""
+		for i, value in enumerate(values):
+			self.store.record(_Sensor(nr), value, self.start + seconds + i / 10)
+
+	def testRollups(self):
+		"""Checks the aggregates of all levels."""
+		self._record(1, 0, [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12])
+		self._record(2, 0, [100] * 5)
+		self._record(1, 70, [20, None, "x", 30])
+
+		seconds = self.store.query(1, self.start, self.start + 3600, 1)
+		self.assertEqual(seconds[0], (self.start, 5.5, 1, 10))
+		self.assertEqual(seconds[1], (self.start + 1, 11.5, 11, 12))
+		self.assertEqual(seconds[2], (self.start + 70, 25, 20, 30), "Open slot missing")
+
+		minutes = self.store.query(1, self.start, self.start + 3600, 60)
+		self.assertEqual(
+			minutes, [(self.start, 6.5, 1, 12), (self.start + 60, 25, 20, 30)]
+		)
+		self.assertEqual(
+			self.store.query(2, self.start, self.start + 60, 60),
+			[(self.start, 100, 100, 100)],
+		)
+		self.assertEqual(len(self.store.query(1, self.start, self.start + 3600, 0)), 14)
+
+	def testReopen(self):
+		"""Ensures that a slot is merged with the data written before a restart."""
+		self._record(1, 0, [1, 2])
+		self.store.close()
+		self.store = timeseries.Store(self.basePath, {}, 50)
+		self._record(1, 0.5, [6])
+		self.assertEqual(
+			self.store.query(1, self.start, self.start + 1, 1), [(self.start, 3, 1, 6)]
+		)
+
+	def testCompact(self):
+		"""Checks if only segments older than their retention are deleted."""
+		self._record(1, 0, [1, 2])
+		self.store.flush(True)
+		self.store.compact(self.start + 3 * 3600)
+		self.assertEqual(self.store.query(1, self.start, self.start + 60, 1), [])
+		self.assertEqual(
+			self.store.query(1, self.start, self.start + 60, 60),
+			[(self.start, 1.5, 1, 2)],
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
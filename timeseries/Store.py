@@ -0,0 +1,483 @@
+"""Stores the history of sensor values."""
+import threading
+import struct
+import array
+import mmap
+import os
+import logging
+
+import clock
+
+logger = logging.getLogger(__name__)
+
+# Aggregation levels: (resolution in seconds, number of slots per segment).
+LEVELS = ((1, 3600), (60, 1440), (3600, 720))
+
+_MAGIC = b"CWSERIES"
+_HEADER = struct.Struct("<8sIIqI")
+_MAXBLOCKS = 1000
+_HEADERSIZE = 4096
+
+# A record of a slot is stored in four columns:
+# count (uint32), minimum (float32), maximum (float32), sum (float64).
+_RECORDSIZE = 20
+_COUNT = struct.Struct("<I")
+_MINMAX = struct.Struct("<f")
+_SUM = struct.Struct("<d")
+
+
+class _Segment:
+	"""A memory mapped file with the aggregates of all sensors for a fixed period.
+
+	The file starts with a header and a directory of the sensor numbers, which
+	is followed by one block per sensor. A block consists of the columns count,
+	minimum, maximum and sum, each of them has one entry per slot. Blocks are
+	appended when a sensor writes its first slot, empty slots have a count of 0.
+	NOT THREAD SAFE, it is synchronised by the Store.
+	"""
+
+	def __init__(self, path: str, resolution: int, slots: int, start: int):
+		"""Opens or creates the segment file.
+
+		Args:
+			path : Path of the file.
+			resolution : Number of seconds per slot.
+			slots : Number of slots per sensor.
+			start : Time of the first slot (seconds since the epoch).
+		"""
+		self.path = path
+		self.resolution = resolution
+		self.slots = slots
+		self.start = start
+		self._blockSize = slots * _RECORDSIZE
+		self._blocks = {}
+
+		with open(path, "a+b") as f:
+			if f.seek(0, os.SEEK_END) < _HEADERSIZE:
+				f.truncate(_HEADERSIZE)
+			self._mmap = mmap.mmap(f.fileno(), 0)
+
+		magic, res, sl, st, count = _HEADER.unpack_from(self._mmap)
+		if magic != _MAGIC:
+			_HEADER.pack_into(self._mmap, 0, _MAGIC, resolution, slots, start, 0)
+			count = 0
+		elif (res, sl, st) != (resolution, slots, start):
+			self._mmap.close()
+			raise ValueError("Segment does not match its file name: " + path)
+		numbers = array.array("i")
+		numbers.frombytes(self._mmap[_HEADER.size : _HEADER.size + 4 * count])
+		self._blocks = {nr: i for i, nr in enumerate(numbers)}
+
+	def _getBlockOffset(self, nr: int) -> int:
+		"""Gets the offset of the block of a sensor, the block is created if needed."""
+		index = self._blocks.get(nr)
+		if index is None:
+			index = len(self._blocks)
+			if index >= _MAXBLOCKS:
+				raise ValueError("Too many sensors in segment " + self.path)
+			# New blocks are sparse, so they only use space where they are written.
+			self._mmap.resize(_HEADERSIZE + (index + 1) * self._blockSize)
+			struct.pack_into("<i", self._mmap, _HEADER.size + 4 * index, nr)
+			_HEADER.pack_into(
+				self._mmap,
+				0,
+				_MAGIC,
+				self.resolution,
+				self.slots,
+				self.start,
+				index + 1,
+			)
+			self._blocks[nr] = index
+		return _HEADERSIZE + index * self._blockSize
+
+	def merge(self, nr: int, slot: int, count: int, minimum, maximum, total):
+		"""Merges an aggregate into a slot of a sensor."""
+		offset = self._getBlockOffset(nr)
+		countPos = offset + 4 * slot
+		minPos = offset + 4 * (self.slots + slot)
+		maxPos = offset + 4 * (2 * self.slots + slot)
+		sumPos = offset + 12 * self.slots + 8 * slot
+		oldCount = _COUNT.unpack_from(self._mmap, countPos)[0]
+		if oldCount:
+			minimum = min(minimum, _MINMAX.unpack_from(self._mmap, minPos)[0])
+			maximum = max(maximum, _MINMAX.unpack_from(self._mmap, maxPos)[0])
+			total += _SUM.unpack_from(self._mmap, sumPos)[0]
+		_MINMAX.pack_into(self._mmap, minPos, minimum)
+		_MINMAX.pack_into(self._mmap, maxPos, maximum)
+		_SUM.pack_into(self._mmap, sumPos, total)
+		_COUNT.pack_into(self._mmap, countPos, oldCount + count)
+
+	def flush(self):
+		"""Writes the changed pages to the file."""
+		self._mmap.flush()
+
+	def close(self):
+		"""Writes the changed pages and closes the file."""
+		self._mmap.flush()
+		self._mmap.close()
+
+	@staticmethod
+	def read(path: str, nr: int, first: int, last: int) -> list:
+		"""Reads the slots of a sensor from a segment file.
+
+		The file is read with plain reads, so it can be read while it is
+		written by an open _Segment.
+
+		Args:
+			path : Path of the file.
+			nr : Number of the sensor.
+			first : First slot.
+			last : Slot after the last slot.
+
+		Returns:
+			A list of tuples (slot, count, minimum, maximum, sum) of all non
+			empty slots.
+		"""
+		with open(path, "rb") as f:
+			header = f.read(_HEADERSIZE)
+			if len(header) < _HEADERSIZE:
+				return []
+			magic, _, slots, _, count = _HEADER.unpack_from(header)
+			if magic != _MAGIC:
+				return []
+			numbers = array.array("i")
+			numbers.frombytes(header[_HEADER.size : _HEADER.size + 4 * count])
+			if nr not in numbers:
+				return []
+			offset = _HEADERSIZE + numbers.index(nr) * slots * _RECORDSIZE
+			first, last = max(0, first), min(slots, last)
+			if first >= last:
+				return []
+
+			columns = []
+			for start, typecode in (
+				(offset, "I"),
+				(offset + 4 * slots, "f"),
+				(offset + 8 * slots, "f"),
+				(offset + 12 * slots, "d"),
+			):
+				column = array.array(typecode)
+				f.seek(start + column.itemsize * first)
+				column.frombytes(f.read(column.itemsize * (last - first)))
+				columns.append(column)
+
+		counts, minimums, maximums, sums = columns
+		return [
+			(first + i, counts[i], minimums[i], maximums[i], sums[i])
+			for i in range(len(sums))
+			if counts[i]
+		]
+
+
+class _Series:
+	"""The recent values and open aggregates of one sensor."""
+
+	def __init__(self, nr: int, rawSize: int):
+		self.nr = nr
+		self.lock = threading.Lock()
+
+		# Ring buffer of the latest raw values.
+		self._times = array.array("d", bytes(8 * rawSize))
+		self._values = array.array("d", bytes(8 * rawSize))
+		self._rawCount = 0
+
+		# Open aggregate per level: [slotTime, count, minimum, maximum, sum]
+		self._pending = [None] * len(LEVELS)
+
+	def add(self, timestamp: float, value: float) -> list:
+		"""NOT THREAD SAFE, adds a value (the lock must be held).
+
+		Returns:
+			A list of (level index, aggregate) of all aggregates which were
+			completed by this value.
+		"""
+		size = len(self._times)
+		if size:
+			i = self._rawCount % size
+			self._times[i] = timestamp
+			self._values[i] = value
+			self._rawCount += 1
+
+		completed = []
+		for level, (resolution, _) in enumerate(LEVELS):
+			slotTime = int(timestamp // resolution * resolution)
+			pending = self._pending[level]
+			if pending and pending[0] == slotTime:
+				pending[1] += 1
+				pending[2] = min(pending[2], value)
+				pending[3] = max(pending[3], value)
+				pending[4] += value
+			else:
+				if pending:
+					completed.append((level, pending))
+				self._pending[level] = [slotTime, 1, value, value, value]
+		return completed
+
+	def takeCompleted(self, now: float, everything: bool = False) -> list:
+		"""NOT THREAD SAFE, removes the aggregates of elapsed slots.
+
+		Args:
+			now : The current time.
+			everything : If True, the aggregates of open slots are removed too.
+		"""
+		completed = []
+		for level, (resolution, _) in enumerate(LEVELS):
+			pending = self._pending[level]
+			if pending and (everything or pending[0] + resolution <= now):
+				completed.append((level, pending))
+				self._pending[level] = None
+		return completed
+
+	def getRaw(self, start: float, end: float) -> list:
+		"""NOT THREAD SAFE, gets the buffered raw values in a time range."""
+		size = len(self._times)
+		points = []
+		for n in range(max(0, self._rawCount - size), self._rawCount):
+			t = self._times[n % size]
+			if start <= t < end:
+				v = self._values[n % size]
+				points.append((t, v, v, v))
+		return points
+
+	def getPending(self, level: int):
+		"""NOT THREAD SAFE, gets the open aggregate of a level (or None)."""
+		return self._pending[level]
+
+
+class Store:
+	"""Append only store for the history of sensor values.
+
+	All values of a sensor are aggregated per second, minute and hour (count,
+	minimum, maximum and sum). Completed aggregates are merged into memory
+	mapped segment files, one file per level and period containing all
+	sensors, so the SD card is only written when the pages are flushed (see
+	run()). The latest raw values are kept in a ring buffer in memory.
+	Segments older than the retention of their level are deleted by compact().
+	"""
+
+	def __init__(self, basePath: str, retention: dict, rawSize: int = 600):
+		"""Initialises a Store, the directories are created if needed.
+
+		Args:
+			basePath : Directory of the segment files.
+			retention : Number of seconds for which the aggregates are kept,
+				the resolution in seconds is the key (see LEVELS).
+			rawSize : Number of raw values per sensor which are kept in memory.
+		"""
+		self._basePath = basePath
+		self._retention = retention
+		self._rawSize = rawSize
+		self._series = {}
+		self._seriesLock = threading.Lock()
+
+		# Open segments per level: start -> _Segment
+		self._segments = [{} for _ in LEVELS]
+		self._segmentsLock = threading.Lock()
+		self._stopEvent = threading.Event()
+
+		for resolution, _ in LEVELS:
+			os.makedirs(os.path.join(basePath, str(resolution)), exist_ok=True)
+
+	@staticmethod
+	def getResolutions() -> list:
+		"""Gets the resolutions of all levels in seconds (finest first)."""
+		return [resolution for resolution, _ in LEVELS]
+
+	def record(self, s, value, timestamp: float):
+		"""Thread safe, adds a measured value of a sensor.
+
+		It has the signature of a sensor.Scheduler listener. None and non
+		numeric values are ignored.
+
+		Args:
+			s : The sensor (only its nr is used).
+			value : The measured value.
+			timestamp : Time of the measurement (seconds since the epoch).
+		"""
+		try:
+			value = float(value)
+		except (TypeError, ValueError):
+			return
+		series = self._getSeries(s.nr)
+		with series.lock:
+			completed = series.add(timestamp, value)
+		if completed:
+			self._write(s.nr, completed)
+
+	def _getSeries(self, nr: int) -> _Series:
+		"""Thread safe, gets the series of a sensor, it is created if needed."""
+		series = self._series.get(nr)
+		if series is None:
+			with self._seriesLock:
+				series = self._series.setdefault(nr, _Series(nr, self._rawSize))
+		return series
+
+	def _write(self, nr: int, completed: list):
+		"""Thread safe, merges completed aggregates into their segments."""
+		with self._segmentsLock:
+			for level, (slotTime, count, minimum, maximum, total) in completed:
+				resolution, slots = LEVELS[level]
+				span = resolution * slots
+				start = slotTime // span * span
+				slot = (slotTime - start) // resolution
+				try:
+					segment = self._getSegment(level, start)
+					segment.merge(nr, slot, count, minimum, maximum, total)
+				except (OSError, ValueError):
+					logger.exception("History of sensor %d could not be written", nr)
+
+	def _getSegment(self, level: int, start: int) -> _Segment:
+		"""Gets an open segment, must be called with the segments lock held.
+
+		Only the segment of the current and the previous period are kept open.
+		"""
+		segments = self._segments[level]
+		segment = segments.get(start)
+		if segment is None:
+			resolution, slots = LEVELS[level]
+			path = self._getPath(resolution, start)
+			segment = _Segment(path, resolution, slots, start)
+			segments[start] = segment
+			for old in sorted(segments)[:-2]:
+				segments.pop(old).close()
+		return segment
+
+	def _getPath(self, resolution: int, start: int) -> str:
+		return os.path.join(self._basePath, str(resolution), str(start) + ".seg")
+
+	def query(self, sensorNr: int, start: float, end: float, resolution: int) -> list:
+		"""Thread safe, gets the history of a sensor in a time range.
+
+		Args:
+			sensorNr : Number of the sensor.
+			start : Begin of the range (seconds since the epoch).
+			end : End of the range (exclusive).
+			resolution : One of getResolutions(), or 0 for the raw values which
+				are still in memory.
+
+		Returns:
+			A list of tuples (time, mean, minimum, maximum), oldest first. The
+			time is the begin of the aggregated slot.
+		"""
+		series = self._series.get(sensorNr)
+		if resolution == 0:
+			if not series:
+				return []
+			with series.lock:
+				return series.getRaw(start, end)
+
+		level = self.getResolutions().index(resolution)
+		slots = LEVELS[level][1]
+		span = resolution * slots
+		aggregates = []
+		segmentStart = int(start // span * span)
+		while segmentStart < end:
+			first = int((start - segmentStart) // resolution)
+			last = int(-((segmentStart - end) // resolution))
+			try:
+				records = _Segment.read(
+					self._getPath(resolution, segmentStart), sensorNr, first, last
+				)
+			except FileNotFoundError:
+				records = []
+			for slot, count, minimum, maximum, total in records:
+				aggregates.append(
+					[segmentStart + slot * resolution, count, minimum, maximum, total]
+				)
+			segmentStart += span
+
+		# The open aggregate is not written yet.
+		pending = None
+		if series:
+			with series.lock:
+				pending = series.getPending(level)
+				pending = pending and list(pending)
+		if pending and start <= pending[0] < end:
+			if aggregates and aggregates[-1][0] == pending[0]:
+				# A part of the slot was already written (i.E. before a restart).
+				written = aggregates.pop()
+				pending[1] += written[1]
+				pending[2] = min(pending[2], written[2])
+				pending[3] = max(pending[3], written[3])
+				pending[4] += written[4]
+			aggregates.append(pending)
+
+		return [
+			(slotTime, total / count, minimum, maximum)
+			for slotTime, count, minimum, maximum, total in aggregates
+		]
+
+	def flush(self, everything: bool = False):
+		"""Thread safe, writes the aggregates of elapsed slots and flushes the segments.
+
+		Args:
+			everything : If True, the aggregates of open slots are written too.
+		"""
+		now = clock.getClock().time()
+		with self._seriesLock:
+			allSeries = list(self._series.values())
+		for series in allSeries:
+			with series.lock:
+				completed = series.takeCompleted(now, everything)
+			if completed:
+				self._write(series.nr, completed)
+		with self._segmentsLock:
+			for segments in self._segments:
+				for segment in segments.values():
+					segment.flush()
+
+	def compact(self, now: float = None):
+		"""Thread safe, deletes all segments which are older than their retention.
+
+		Args:
+			now : The current time (seconds since the epoch), default is the
+				time of the clock.
+		"""
+		now = clock.getClock().time() if now is None else now
+		for level, (resolution, slots) in enumerate(LEVELS):
+			limit = now - self._retention.get(resolution, float("inf"))
+			directory = os.path.join(self._basePath, str(resolution))
+			for name in os.listdir(directory):
+				start, ext = os.path.splitext(name)
+				if ext != ".seg" or not start.isdigit():
+					continue
+				if int(start) + resolution * slots <= limit:
+					with self._segmentsLock:
+						segment = self._segments[level].pop(int(start), None)
+						if segment:
+							segment.close()
+					os.remove(os.path.join(directory, name))
+					logger.info("History segment %s/%s deleted", resolution, name)
+
+	def run(self, flushInterval: float = 60):
+		"""Starts the maintenance loop.
+
+		This function keeps running until the function stop() is called from
+		another thread. It regularly flushes the segments and deletes the old
+		ones. On the way out, all open aggregates are written.
+
+		Args:
+			flushInterval : Number of seconds between two flushes.
+		"""
+		logger.info("History store started")
+		while not self._stopEvent.wait(flushInterval):
+			try:
+				self.flush()
+				self.compact()
+			except OSError:
+				logger.exception("History store maintenance failed")
+		self.close()
+		logger.info("History store is going down")
+
+	def stop(self):
+		"""Thread safe, stops the maintenance loop."""
+		self._stopEvent.set()
+
+	def close(self):
+		"""Thread safe, writes all aggregates and closes the segments."""
+		self.flush(True)
+		with self._segmentsLock:
+			for segments in self._segments:
+				for segment in segments.values():
+					segment.close()
+				segments.clear()
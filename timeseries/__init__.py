@@ -0,0 +1,8 @@
+"""This is the timeseries package, it stores the history of the sensor values.
+
+Its main content is the Store class, which is fed by the sensor.Scheduler
+(see Scheduler.addListener()) and queried by the web frontend.
+"""
+
+from timeseries.Store import Store
+from timeseries.Store import LEVELS
@@ -1,12 +1,65 @@
 import cherrypy
+import datetime
 import os
+import re
 import time
+import threading
 import dominate
+import dominate.util
 import configparser
 from dominate.tags import *
 
 import settings
+import clock
 import persistanceLayer
+import logTail
+import metrics
+import web.status
+
+# Threads of the web server for the pages and services (the default of
+# cherrypy), the event streams get additional threads.
+_PAGETHREADS = 10
+
+
+class _Template:
+	"""A HTML template which is split into static text and place holders.
+
+	The file is only parsed again if it has changed.
+	"""
+
+	_PLACEHOLDER = re.compile(r"<!--\{\{(\w+)\}\}-->")
+
+	def __init__(self, path: str):
+		"""Initialises the template, the file is parsed on the first render()."""
+		self._path = path
+		self._mtime = None
+		self._segments = []
+
+	def _parse(self):
+		"""Parses the file, if it has changed since the last parsing."""
+		mtime = os.stat(self._path).st_mtime_ns
+		if mtime == self._mtime:
+			return
+		with open(self._path) as f:
+			# Every odd segment is the name of a place holder.
+			self._segments = self._PLACEHOLDER.split(f.read())
+		self._mtime = mtime
+
+	def render(self, values: dict) -> str:
+		"""Renders the template.
+
+		Args:
+			values : A dict with the content of the place holders (name as key).
+				Place holders without value remain unchanged.
+		"""
+		self._parse()
+		html = []
+		for i, segment in enumerate(self._segments):
+			if i % 2 == 0:
+				html.append(segment)
+			else:
+				html.append(values.get(segment, "<!--{{" + segment + "}}-->"))
+		return "".join(html)
 
 
 class Frontend:
@@ -28,11 +81,24 @@ class Frontend:
 		conf = persistanceLayer.getWebServerConf(settings.BASECONFDIR)
 		self._main = main
 		self._baseWebDir = conf["baseWebDir"]
+		self._template = _Template(os.path.join(self._baseWebDir, "index.html"))
+
+		# Rendered HTML fragments, they are only rendered again if their
+		# content has changed: controllerNr -> (key, html)
+		self._cacheLock = threading.Lock()
+		self._controllerRows = {}
+		self._ruleTables = {}
+
+		# Versioned status for the status() and events() services.
+		self._statusBoard = web.status.StatusBoard(main, settings.STATUSMAXDELTAS)
+		self._streams = threading.BoundedSemaphore(settings.STATUSMAXSTREAMS)
 		self._userPassword = conf["userPasswords"]
 		cherrypy.config.update(
 			{
 				"server.socket_host": conf["host"],
 				"server.socket_port": conf["port"],
+				# The event streams must not block the pages and services.
+				"server.thread_pool": _PAGETHREADS + settings.STATUSMAXSTREAMS,
 				"engine.autoreload.on": False,
 			}
 		)
@@ -68,24 +134,19 @@ class Frontend:
 		Returns:
 			A string containing the HTML page source code.
 		"""
-		html = ""
-		with open(os.path.join(self._baseWebDir, "index.html")) as f:
-			html = f.read()
-		html = html.replace(
-			r"<!--{{ControllerRows}}-->", self.getControllers().render()
-		)
-		html = html.replace(r"<!--{{Log}}-->", self.getLog().render())
-
+		values = {
+			"ControllerRows": self.getControllers().render(),
+			"Log": self.getLog().render(),
+		}
 		if controllerNr != "0":
-			html = html.replace(
-				r"<!--{{RuleRows}}-->", self.getRules(int(controllerNr)).render()
-			)
+			values["RuleRows"] = self.getRules(int(controllerNr)).render()
 
-		return html
+		with self._cacheLock:
+			return self._template.render(values)
 
 	@cherrypy.expose
 	def deleteRule(self, controllerNr: str = "0", ruleName: str = ""):
-		"""Deletes a rule from the config file and reload the backend.
+		"""Deletes a rule from the config file and reloads its controller.
 
 		Args:
 			controllerNr : number of the controller AS STRING, whichs Rule shall be deleted.
@@ -95,12 +156,12 @@ class Frontend:
 			Nothing, redirects to index() with cherrypy.HTTPRedirect.
 		"""
 		persistanceLayer.deleteRule(settings.BASECONFDIR, int(controllerNr), ruleName)
-		self._main.reload()
+		self._main.reloadController(int(controllerNr))
 		raise cherrypy.HTTPRedirect("index")
 
 	@cherrypy.expose
 	def editRule(self, controllerNr: str, ruleName: str, **kwargs):
-		"""Updates a rule in the config file and reload the backend.
+		"""Updates a rule in the config file and reloads its controller.
 
 		The function can also be used to create a new rule. For that, a rule name
 		must be chosen which is not in use yet.
@@ -121,19 +182,178 @@ class Frontend:
 			settings.BASECONFDIR, int(controllerNr), ruleName, **kwargs
 		)
 
-		self._main.reload()
+		self._main.reloadController(int(controllerNr))
 		raise cherrypy.HTTPRedirect("index")
 
+	@cherrypy.expose
+	def status(self):
+		"""Gets the status of all controllers, sensors and pumps as JSON.
+
+		See web.status.StatusBoard for the format.
+		"""
+		version, data = self._statusBoard.getSnapshot()
+		cherrypy.response.headers["Content-Type"] = "application/json"
+		cherrypy.response.headers["ETag"] = '"' + str(version) + '"'
+		# cherrypy only encodes text/* responses.
+		return data.encode()
+
+	@cherrypy.expose
+	def metrics(self):
+		"""Gets the metrics of all worker loops in the Prometheus text format."""
+		cherrypy.response.headers["Content-Type"] = "text/plain; version=0.0.4"
+		return metrics.render()
+
+	@cherrypy.expose
+	def events(self, version: str = None):
+		"""Streams the changes of the status as server sent events.
+
+		The stream starts with the whole status (event "snapshot"), after that
+		only the changes are sent (event "delta", data is a list of deltas).
+		A client which reconnects with the header Last-Event-ID (or the argument
+		version) only gets the changes it has missed. Every stream occupies a
+		thread of the cherrypy thread pool, so at most settings.STATUSMAXSTREAMS
+		streams are served at the same time, further clients get the status 503.
+
+		Args:
+			version : Optional, last version the client knows AS STRING.
+		"""
+		if not self._streams.acquire(blocking=False):
+			# An HTTPError would drop the Retry-After header.
+			cherrypy.response.status = 503
+			cherrypy.response.headers["Retry-After"] = str(settings.STATUSKEEPALIVE)
+			return [b"Too many event streams"]
+		# Is also called if the stream was never started.
+		cherrypy.request.hooks.attach("on_end_request", self._streams.release)
+		version = cherrypy.request.headers.get("Last-Event-ID", version)
+		version = int(version) if version and version.isdigit() else None
+		board = self._statusBoard
+		cherrypy.response.headers["Content-Type"] = "text/event-stream"
+		cherrypy.response.headers["Cache-Control"] = "no-cache"
+
+		def stream():
+			v = version
+			while not board.isClosed():
+				deltas = None if v is None else board.getDeltas(
+					v, settings.STATUSKEEPALIVE
+				)
+				if deltas is None:
+					v, data = board.getSnapshot()
+					event = "id: {}\nevent: snapshot\ndata: {}\n\n".format(v, data)
+				elif deltas:
+					v = deltas[-1]["v"]
+					event = "id: {}\nevent: delta\ndata: {}\n\n".format(
+						v, web.status.toJson(deltas)
+					)
+				else:
+					# Keeps the connection alive, it is ignored by the client.
+					event = ":\n\n"
+				# Streamed responses are not encoded by cherrypy.
+				yield event.encode()
+
+		return stream()
+
+	events._cp_config = {"response.stream": True}
+
+	@cherrypy.expose
+	def history(
+		self, sensorNr: str, start: str = None, end: str = None, resolution: str = None
+	):
+		"""Gets the history of a sensor as JSON.
+
+		Args:
+			sensorNr : Number of the sensor AS STRING.
+			start : Optional, begin of the range in seconds since the epoch AS
+				STRING, default is one hour before the end.
+			end : Optional, end of the range AS STRING, default is now.
+			resolution : Optional, resolution in seconds AS STRING (see
+				timeseries.LEVELS, 0 for the raw values of the last minutes).
+				By default, the finest resolution with at most
+				settings.HISTORYMAXPOINTS points is chosen.
+
+		Returns:
+			A dict {"sensorNr", "resolution", "points"} as JSON, a point is a
+			list [time, mean, minimum, maximum].
+		"""
+		store = self._main.history
+		end = float(end) if end else clock.getClock().time()
+		start = float(start) if start else end - 3600
+		if resolution is None:
+			resolutions = store.getResolutions()
+			resolution = resolutions[-1]
+			for r in resolutions:
+				if (end - start) / r <= settings.HISTORYMAXPOINTS:
+					resolution = r
+					break
+		else:
+			resolution = int(resolution)
+		if resolution != 0 and resolution not in store.getResolutions():
+			raise cherrypy.HTTPError(400, "Unknown resolution")
+
+		points = store.query(int(sensorNr), start, end, resolution)
+		cherrypy.response.headers["Content-Type"] = "application/json"
+		return web.status.toJson(
+			{"sensorNr": int(sensorNr), "resolution": resolution, "points": points}
+		).encode()
+
+	@cherrypy.expose
+	def ledger(
+		self,
+		start: str = None,
+		end: str = None,
+		pumpNr: str = None,
+		controllerNr: str = None,
+		ruleName: str = None,
+	):
+		"""Gets the daily totals of the pump runs as JSON (see pumper.Ledger).
+
+		Args:
+			start : Optional, first day as ISO date AS STRING, default is 30 days
+				before the end.
+			end : Optional, last day as ISO date AS STRING, default is today.
+			pumpNr : Optional, only runs of this pump AS STRING are included.
+			controllerNr : Optional, only orders of this controller AS STRING
+				are included.
+			ruleName : Optional, only orders of rules with this name are included.
+
+		Returns:
+			A dict {"days", "total"} as JSON, "days" has the ISO dates as keys.
+		"""
+		end = datetime.date.fromisoformat(end) if end else datetime.date.today()
+		start = (
+			datetime.date.fromisoformat(start)
+			if start
+			else end - datetime.timedelta(days=30)
+		)
+		args = (
+			start,
+			end,
+			int(pumpNr) if pumpNr else None,
+			int(controllerNr) if controllerNr else None,
+			ruleName,
+		)
+		days = self._main.ledger.getDailyTotals(*args)
+		cherrypy.response.headers["Content-Type"] = "application/json"
+		return web.status.toJson(
+			{
+				"days": {day.isoformat(): total for day, total in days.items()},
+				"total": self._main.ledger.query(*args),
+			}
+		).encode()
+
 	def run(self):
 		"""Runs the cherrypy HTTP server."""
 		cherrypy.quickstart(self, "/", self._webConfig)
 
 	def stop(self):
 		"""Stops the cherrypy HTTP server."""
+		self._statusBoard.close()
 		cherrypy.engine.exit()
 
 	def getControllers(self):
-		"""Gets a HTML table representation of all loaded controllers."""
+		"""Gets a HTML table representation of all loaded controllers.
+
+		The rows are cached, see _getControllerRow().
+		"""
 
 		tbl = table(id="controllers")
 		tbl.add(
@@ -150,37 +370,81 @@ class Frontend:
 				)
 			)
 		)
-		with tbl.add(tbody()):
-			for ctrl in self._main.controllers:
-				c = self._main.controllers[ctrl]
-				tr(
-					td(ctrl),
-					td(c.pumpNr),
-					td(self._main.pumper.getPumpState(c.pumpNr)),
-					td(c.__class__.__name__),
-					td(c.sensor.nr),
-					td(c.sensor.__class__.__name__),
-					td(str(c.sensor.getValue() or "")),
-					td(
-						input_(
-							value="Show rules",
-							onclick="window.location.href='/index?controllerNr="
-							+ str(ctrl)
-							+ "'",
-							type="submit",
-							cls="button",
-							id="controller_" + str(ctrl),
-						)
-					),
-				)
+		rows = []
+		controllers = self._main.controllers
+		for ctrl in controllers:
+			rows.append(self._getControllerRow(ctrl, controllers[ctrl]))
+		with self._cacheLock:
+			# Rows and rules of removed controllers are not needed anymore.
+			for ctrl in self._controllerRows.keys() - controllers.keys():
+				del self._controllerRows[ctrl]
+			for ctrl in self._ruleTables.keys() - controllers.keys():
+				del self._ruleTables[ctrl]
+		tbl.add(tbody(dominate.util.raw("".join(rows))))
 		return tbl
 
+	def _getControllerRow(self, ctrl: int, c) -> str:
+		"""Gets the rendered HTML table row of a controller.
+
+		The row is only rendered again if a displayed value has changed. The
+		ruleSetVersion is unique among all controllers, it also identifies a
+		controller which was replaced by a reload.
+		"""
+		key = (
+			c.ruleSetVersion,
+			c.getState(),
+			self._main.pumper.getPumpState(c.pumpNr),
+			c.sensor.getValue(),
+		)
+		with self._cacheLock:
+			cached = self._controllerRows.get(ctrl)
+		if cached and cached[0] == key:
+			return cached[1]
+
+		html = tr(
+			td(ctrl),
+			td(c.pumpNr),
+			td(key[2]),
+			td(c.__class__.__name__),
+			td(c.sensor.nr),
+			td(c.sensor.__class__.__name__),
+			td(str(key[3] or "")),
+			td(
+				input_(
+					value="Show rules",
+					onclick="window.location.href='/index?controllerNr="
+					+ str(ctrl)
+					+ "'",
+					type="submit",
+					cls="button",
+					id="controller_" + str(ctrl),
+				)
+			),
+		).render()
+		with self._cacheLock:
+			self._controllerRows[ctrl] = (key, html)
+		return html
+
 	def getRules(self, controllerNr: int):
 		"""Gets a HTML table representation of all rules.
 
+		The table is only rendered again if the rules have changed.
+
 		Args:
 			controllerNr: Number of the controller.
 		"""
+		c = self._main.controllers[controllerNr]
+		key = c.ruleSetVersion
+		with self._cacheLock:
+			cached = self._ruleTables.get(controllerNr)
+		if not cached or cached[0] != key:
+			cached = (key, self._renderRules(controllerNr).render())
+			with self._cacheLock:
+				self._ruleTables[controllerNr] = cached
+		return dominate.util.raw(cached[1])
+
+	def _renderRules(self, controllerNr: int):
+		"""Creates a HTML table representation of all rules (see getRules())."""
 
 		tbl = div(id="rules", cls="table")
 		tbl.add(
@@ -399,7 +663,6 @@ class Frontend:
 	def getLog(self):
 		"""Returns a HTML list representation of the latest log entries."""
 		ls = ol(id="log")
-		with open(settings.LOGFILE, "r") as f:
-			for f in reversed(f.readlines()[-50:]):
-				ls.add(li(f, cls="logentry"))
+		for line in reversed(logTail.getLines(50, settings.LOGFILE)):
+			ls.add(li(line, cls="logentry"))
 		return ls
@@ -0,0 +1,211 @@
+"""Provides a versioned status of the running system for the web frontend."""
+import collections
+import functools
+import itertools
+import threading
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def toJson(data) -> str:
+	"""Serialises data into compact JSON."""
+	return json.dumps(data, separators=(",", ":"), default=str)
+
+
+class StatusBoard:
+	"""Keeps a versioned status of all controllers, sensors and pumps.
+
+	The status is updated by the sensors and the pumper (see Sensor.subscribe()
+	and Pumper.subscribe()) and after every reload of the system (see
+	Main.addReloadListener()), so reading it never touches the running objects.
+	Every change increments the version and is kept as a delta, clients
+	which know an older version only have to fetch the deltas since then.
+
+	The status has the sections "controllers", "sensors" and "pumps", which
+	contain one entry per object (number as string key). A delta is a dict
+	{"v": version, "s": section, "nr": number, "d": entry or None (removed)}.
+	"""
+
+	def __init__(self, main, maxDeltas: int = 1000):
+		"""Initialises an empty StatusBoard and registers it at the main object.
+
+		Args:
+			main : reference to the Main object.
+			maxDeltas : Number of deltas which are kept, clients with an older
+				version have to fetch the whole status again.
+		"""
+		self._main = main
+		self._lock = threading.Condition()
+		self._version = 0
+		self._status = {"controllers": {}, "sensors": {}, "pumps": {}}
+		self._deltas = collections.deque(maxlen=maxDeltas)
+		self._json = None
+		self._closed = False
+
+		# Observed objects: sensorNr -> (sensor, subscription)
+		self._sensors = {}
+		self._pumper = None
+
+		main.addReloadListener(self.sync)
+
+	def sync(self):
+		"""Thread safe, compares the status with the objects of the main object.
+
+		Subscribes to new sensors and pumpers, unsubscribes from removed ones
+		and updates the entries of changed controllers.
+		"""
+		with self._lock:
+			if self._closed:
+				return
+			sensors = getattr(self._main, "sensors", {})
+			for nr, (s, subscription) in list(self._sensors.items()):
+				if sensors.get(nr) is not s:
+					s.unsubscribe(subscription)
+					del self._sensors[nr]
+					self._update("sensors", nr, None)
+			for nr, s in sensors.items():
+				if nr not in self._sensors:
+					subscription = s.subscribe(functools.partial(self._onSensorValue, s))
+					self._sensors[nr] = (s, subscription)
+					self._update("sensors", nr, self._getSensorEntry(s, s.getValue()))
+
+			pumper = getattr(self._main, "pumper", None)
+			if pumper is not self._pumper:
+				if self._pumper:
+					self._pumper.unsubscribe(self._onPumpState)
+				if pumper:
+					pumper.subscribe(self._onPumpState)
+				self._pumper = pumper
+			pumps = {}
+			if pumper:
+				with pumper.lock:
+					pumps = pumper.pumps.copy()
+			for nr in self._status["pumps"].keys() - pumps.keys():
+				self._update("pumps", nr, None)
+			for nr, pump in pumps.items():
+				if nr not in self._status["pumps"]:
+					self._update(
+						"pumps", nr, self._getPumpEntry(pump.isPumping(), pump._runSince)
+					)
+
+			controllers = getattr(self._main, "controllers", {})
+			for nr in self._status["controllers"].keys() - controllers.keys():
+				self._update("controllers", nr, None)
+			for nr, c in controllers.items():
+				self._update("controllers", nr, self._getControllerEntry(c))
+
+	def close(self):
+		"""Thread safe, unsubscribes from all objects and ends all waiting clients."""
+		with self._lock:
+			self._closed = True
+			for s, subscription in self._sensors.values():
+				s.unsubscribe(subscription)
+			self._sensors = {}
+			if self._pumper:
+				self._pumper.unsubscribe(self._onPumpState)
+				self._pumper = None
+			self._lock.notify_all()
+
+	def isClosed(self) -> bool:
+		"""Thread safe, checks if close() was called."""
+		with self._lock:
+			return self._closed
+
+	def getVersion(self) -> int:
+		"""Thread safe, gets the current version of the status."""
+		with self._lock:
+			return self._version
+
+	def getSnapshot(self) -> tuple:
+		"""Thread safe, gets the whole status as JSON.
+
+		The JSON is only serialised again if the status has changed.
+
+		Returns:
+			A tuple (version, JSON string), the JSON is a dict with the key
+			"version" and one key per section.
+		"""
+		with self._lock:
+			if self._json is None:
+				self._json = toJson(dict(self._status, version=self._version))
+			return self._version, self._json
+
+	def getDeltas(self, version: int, timeout: float = None) -> list:
+		"""Thread safe, gets all deltas since the given version.
+
+		Waits until there is at least one delta, the timeout has elapsed or
+		the StatusBoard was closed.
+
+		Args:
+			version : Last version the client knows.
+			timeout : Maximal number of seconds to wait (None = no limit).
+
+		Returns:
+			A list of deltas (oldest first), it is empty if nothing has changed.
+			None is returned if the deltas since the given version are not
+			available anymore, then the client must fetch a snapshot.
+		"""
+		with self._lock:
+			self._lock.wait_for(
+				lambda: self._version != version or self._closed, timeout
+			)
+			if version == self._version:
+				return []
+			if not self._deltas or not (
+				self._deltas[0]["v"] - 1 <= version <= self._version
+			):
+				return None
+			start = version - self._deltas[0]["v"] + 1
+			return list(itertools.islice(self._deltas, start, None))
+
+	def _update(self, section: str, nr: int, entry: dict):
+		"""Changes an entry of the status, must be called with the lock held.
+
+		Nothing happens if the entry has not changed.
+		"""
+		key = str(nr)
+		entries = self._status[section]
+		if entries.get(key) == entry:
+			return
+		if entry is None:
+			del entries[key]
+		else:
+			entries[key] = entry
+		self._version += 1
+		self._json = None
+		self._deltas.append({"v": self._version, "s": section, "nr": nr, "d": entry})
+		self._lock.notify_all()
+
+	def _onSensorValue(self, s, value):
+		"""Is called by a sensor if its value has changed."""
+		with self._lock:
+			if self._sensors.get(s.nr, (None,))[0] is s:
+				self._update("sensors", s.nr, self._getSensorEntry(s, value))
+
+	def _onPumpState(self, pumpNr: int, running: bool, runSince):
+		"""Is called by the pumper if a pump was started or stopped."""
+		with self._lock:
+			if str(pumpNr) in self._status["pumps"]:
+				self._update("pumps", pumpNr, self._getPumpEntry(running, runSince))
+
+	@staticmethod
+	def _getSensorEntry(s, value) -> dict:
+		return {"type": s.__class__.__name__, "value": value}
+
+	@staticmethod
+	def _getPumpEntry(running: bool, runSince) -> dict:
+		return {
+			"pumping": running,
+			"runSince": runSince.isoformat(timespec="seconds") if runSince else None,
+		}
+
+	@staticmethod
+	def _getControllerEntry(c) -> dict:
+		return {
+			"type": c.__class__.__name__,
+			"pumpNr": c.pumpNr,
+			"sensorNr": c.sensor.nr if c.sensor else None,
+			"ruleSetVersion": c.ruleSetVersion,
+		}